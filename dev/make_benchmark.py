@@ -0,0 +1,25 @@
+#!/usr/bin/python3
+# Run BlenderFDS benchmarks <http://blenderfds.org/>.
+# Copyright (C) 2016 Emanuele Gissi
+# Released under the terms of the GNU GPL version 3 or any later version.
+
+"""Benchmarks."""
+
+import subprocess
+
+blender = "../blender/blender-2.79b-linux-glibc219-x86_64/blender"
+
+
+def main():
+    args = (
+            blender,
+            "--background",
+            "--python-expr",
+            "from zzz_blenderfds.test import benchmark; benchmark.main()",
+    )
+    subprocess.call(args)
+    print("\nmake_benchmark.py: Done.")
+
+
+if __name__ == "__main__":
+    main()
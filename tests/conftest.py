@@ -0,0 +1,23 @@
+"""BlenderFDS, pytest configuration.
+
+The tests check the bpy-free routines of the add-on, so they run by plain
+pytest outside of Blender. There the add-on package and its subpackages
+are set up without running their __init__, that imports and registers the
+whole add-on, and the Blender modules are replaced by empty placeholders,
+only needed to import the tested modules: tested routines never use them.
+Inside Blender, the add-on is imported as usual.
+"""
+
+import os, sys, types
+
+try:
+    import bpy
+except ImportError:
+    for name in ("bpy", "bmesh", "mathutils"):
+        sys.modules[name] = types.ModuleType(name)
+    sys.modules["mathutils"].Matrix = sys.modules["mathutils"].Vector = None
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "zzz_blenderfds")
+    for name, subpath in (("zzz_blenderfds", ""), ("zzz_blenderfds.fds", "fds"), ("zzz_blenderfds.geometry", "geometry")):
+        package = types.ModuleType(name)
+        package.__path__ = [os.path.join(path, subpath)]
+        sys.modules[name] = package
@@ -0,0 +1,88 @@
+"""BlenderFDS, tests of the in-memory geometry cache."""
+
+from zzz_blenderfds.geometry import cache
+
+
+class _Mesh():
+    """A mesh with name, as Blender meshes."""
+
+    def __init__(self, name):
+        self.name = name
+
+
+class _Object():
+    """An object with name, pointer, mesh and parent, as Blender objects."""
+
+    def __init__(self, name, pointer, data=None, parent=None):
+        self.name = name
+        self.pointer = pointer
+        self.type = "MESH"
+        self.data = data or _Mesh(name)
+        self.parent = parent
+
+    def as_pointer(self):
+        return self.pointer
+
+
+def _get_xbs(n) -> "xbs, msg":
+    return [(0., 1., 0., 1., 0., 1.)] * n, "{} boxes".format(n)
+
+def test_get_set():
+    c = cache.GeometryCache()
+    ob = _Object("ob", 1)
+    assert c.get(ob, "xbs") is None
+    result = _get_xbs(10)
+    c.set(ob, "xbs", result)
+    assert c.get(ob, "xbs") is result
+    assert c.get(_Object("ob", 2), "xbs") is None  # another object, same name
+    assert len(c) == 0 and c.size == 0
+
+def test_signature():
+    c = cache.GeometryCache()
+    ob = _Object("ob", 1)
+    c.set(ob, "geom", ((), [0.] * 9, [1, 2, 3, 1], "msg"), signature="a")
+    assert c.get(ob, "geom", "a") is not None
+    assert c.get(ob, "geom", "b") is None
+    assert c.invalidations == 1 and c.size == 0
+
+def test_get_info():
+    assert cache.get_info().endswith("invalidated in {} updates".format(cache.cache.updates))
+
+def test_size():
+    c = cache.GeometryCache()
+    c.set(_Object("ob", 1), "xbs", _get_xbs(1000))
+    assert c.size == 1000 * 6 * cache.number_size
+    c.set(_Object("ob", 1), "geom", ((), [0.] * 300, [1] * 400, "msg"))
+    assert c.size == (1000 * 6 + 300 + 400) * cache.number_size
+
+def test_eviction(monkeypatch):
+    monkeypatch.setattr(cache, "default_max_size", 1)  # MB
+    c = cache.GeometryCache()
+    nxbs = 1048576 // 6 // cache.number_size // 3 + 1  # more than a third of the budget
+    obs = [_Object("ob{}".format(i), i) for i in range(4)]
+    for ob in obs[:3]:
+        c.set(ob, "xbs", _get_xbs(nxbs))
+    assert len(c) == 2 and c.get(obs[0], "xbs") is None
+    c.get(obs[1], "xbs")  # obs[1] is now the most recently used
+    c.set(obs[3], "xbs", _get_xbs(nxbs))
+    assert c.get(obs[2], "xbs") is None and c.get(obs[1], "xbs") is not None
+    assert c.size <= 1048576
+
+def test_dependents():
+    c = cache.GeometryCache()
+    me = _Mesh("me")
+    parent = _Object("parent", 1)
+    ob0 = _Object("ob0", 2, me, parent)
+    ob1 = _Object("ob1", 3, me)
+    c.set(ob0, "xbs", _get_xbs(1))
+    c.set(ob0, "geom", ((), [0.] * 9, [1, 2, 3, 1], "msg"))
+    c.set(ob1, "xbs", _get_xbs(1))
+    assert c.get_dependents("objects") == {"ob0": {"ob0"}, "parent": {"ob0"}, "ob1": {"ob1"}}
+    assert c.get_dependents("meshes") == {"me": {"ob0", "ob1"}}
+    c.invalidate("ob0", ("xbs",))
+    assert c.get_dependents("meshes") == {"me": {"ob0", "ob1"}}  # ob0 geom is still cached
+    c.invalidate("ob0")
+    assert c.get_dependents("objects") == {"ob1": {"ob1"}}
+    assert c.get_dependents("meshes") == {"me": {"ob1"}}
+    c.clear()
+    assert c.get_dependents("objects") == {} and c.get_dependents("meshes") == {}
@@ -0,0 +1,149 @@
+"""BlenderFDS, tests of triangulated surface routines."""
+
+import numpy as np
+import pytest
+
+from zzz_blenderfds.geometry import calc_trisurfaces
+
+#++ Vertex clusters
+
+def _get_reference_clusters(verts, epsilon) -> "labels":
+    """Get the cluster of each vertex, by brute force on all pairs and union find."""
+    labels = list(range(len(verts)))
+    def find(i):
+        while labels[i] != i:
+            i = labels[i]
+        return i
+    dists = ((verts[:, None] - verts[None, :]) ** 2).sum(axis=2)
+    for i, j in zip(*np.nonzero(np.triu(dists <= epsilon ** 2, k=1))):
+        ri, rj = find(i), find(j)
+        labels[max(ri, rj)] = min(ri, rj)
+    return np.array([find(i) for i in range(len(verts))])
+
+def _get_random_verts(seed, n=200) -> "verts":
+    """Get random vertices, with some near-coincident ones and some chains."""
+    rng = np.random.RandomState(seed)
+    verts = rng.uniform(-1., 1., (n, 3))
+    copies = rng.randint(0, n, n // 4)
+    verts[rng.randint(0, n, n // 4)] = verts[copies] + rng.uniform(-.006, .006, (n // 4, 3))
+    return verts
+
+@pytest.mark.parametrize("seed", range(30))
+@pytest.mark.parametrize("epsilon", (1E-3, 1E-2, .1))
+def test_get_vert_clusters_random(seed, epsilon):
+    verts = _get_random_verts(seed)
+    labels = calc_trisurfaces.get_vert_clusters(verts, epsilon)
+    assert labels.tolist() == _get_reference_clusters(verts, epsilon).tolist()
+
+def test_get_vert_clusters_chain():
+    # Clusters are transitive: the chain ends are farther than epsilon
+    verts = np.array(((0., 0., 0.), (.8, 0., 0.), (1.6, 0., 0.), (5., 0., 0.)))
+    assert calc_trisurfaces.get_vert_clusters(verts, 1.).tolist() == [0, 0, 0, 3]
+
+@pytest.mark.parametrize("seed", range(10))
+def test_get_duplicate_verts_random(seed):
+    verts = _get_random_verts(seed)
+    labels = _get_reference_clusters(verts, 1E-2)
+    reference = [i for i in range(len(verts)) if (labels == labels[i]).sum() > 1]
+    assert calc_trisurfaces._get_duplicate_verts(verts, 1E-2).tolist() == reference
+
+@pytest.mark.parametrize("seed", range(10))
+def test_weld_vertices_random(seed):
+    rng = np.random.RandomState(seed)
+    verts = _get_random_verts(seed)
+    faces = np.column_stack((rng.randint(0, len(verts), (300, 3)), rng.randint(0, 3, 300)))
+    new_verts, new_faces = calc_trisurfaces.weld_vertices(verts, faces, 1E-2)
+    labels = _get_reference_clusters(verts, 1E-2)
+    kept = sorted(set(labels.tolist()))
+    assert np.array_equal(new_verts, verts[kept])
+    reference_faces = [
+        [kept.index(labels[i]) for i in face[:3]] + [face[3]]
+        for face in faces.tolist()
+        if len({labels[i] for i in face[:3]}) == 3
+    ]
+    assert new_faces.tolist() == reference_faces
+
+#++ Welded mesh quality
+
+# A closed box, as a triangle soup: each triangle has its own vertices,
+# as in the scanned geometries that welding is meant for.
+
+_box_verts = np.array([(i, j, k) for k in (0., 1.) for j in (0., 1.) for i in (0., 1.)])
+_box_tris = np.array((
+    (0,2,3), (0,3,1), (4,5,7), (4,7,6), (0,1,5), (0,5,4),
+    (2,6,7), (2,7,3), (0,4,6), (0,6,2), (1,3,7), (1,7,5),
+))
+
+def _get_soup(verts, tris, imat=0) -> "verts, faces":
+    """Get the triangle soup of tris, with unshared vertices and material index imat."""
+    soup_verts = verts[tris.ravel()]
+    faces = np.column_stack((np.arange(len(soup_verts)).reshape((-1, 3)), np.full(len(tris), imat)))
+    return soup_verts, faces
+
+def _get_quality_msgs(verts, faces) -> "list":
+    arrays = calc_trisurfaces.get_tris_quality_arrays(verts, faces)
+    report = calc_trisurfaces.calc_mesh_quality_report(arrays, 1E-4, 1E-6)
+    return calc_trisurfaces.get_mesh_quality_msgs(report), report["inverted_normals"]
+
+def test_tris_quality_box():
+    faces = np.column_stack((_box_tris, np.zeros(len(_box_tris), dtype=np.int64)))
+    assert _get_quality_msgs(_box_verts, faces) == ([], False)
+    assert _get_quality_msgs(_box_verts, faces[:, (0, 2, 1, 3)]) == ([], True)
+
+def test_tris_quality_soup_welded():
+    verts, faces = _get_soup(_box_verts, _box_tris)
+    msgs, _ = _get_quality_msgs(verts, faces)
+    assert any(msg.startswith("Non manifold or open geometry") for msg in msgs)
+    verts, faces = calc_trisurfaces.weld_vertices(verts, faces, 1E-4)
+    assert len(verts) == 8
+    assert _get_quality_msgs(verts, faces) == ([], False)
+    calc_trisurfaces.check_tris_quality(None, verts, faces, 1E-4, 1E-6)
+
+def test_tris_quality_welded_at_a_point():
+    # Two boxes welded at a corner are not a manifold
+    verts_a, faces_a = _get_soup(_box_verts, _box_tris)
+    verts_b, faces_b = _get_soup(_box_verts + 1., _box_tris)
+    verts = np.concatenate((verts_a, verts_b))
+    faces = np.concatenate((faces_a, faces_b + (len(verts_a), len(verts_a), len(verts_a), 0)))
+    verts, faces = calc_trisurfaces.weld_vertices(verts, faces, 1E-4)
+    msgs, _ = _get_quality_msgs(verts, faces)
+    assert msgs == ["Non manifold vertices: 1"]
+    with pytest.raises(calc_trisurfaces.BFException):
+        calc_trisurfaces.check_tris_quality(None, verts, faces, 1E-4, 1E-6)
+
+#++ Bounding box pairs
+
+def _get_reference_bbox_pairs(bboxes, epsilon) -> "[(i, j), ...]":
+    """Get the index pairs of overlapping bounding boxes, by brute force."""
+    pairs = list()
+    for i in range(len(bboxes)):
+        for j in range(i + 1, len(bboxes)):
+            if all(
+                bboxes[i][2*axis] <= bboxes[j][2*axis+1] + epsilon and
+                bboxes[j][2*axis] <= bboxes[i][2*axis+1] + epsilon
+                for axis in range(3)
+            ):
+                pairs.append((i, j))
+    return pairs
+
+def _get_random_bboxes(seed, n) -> "bboxes":
+    """Get random bounding boxes, on a coarse grid so that they often touch."""
+    rng = np.random.RandomState(seed)
+    mins = rng.randint(0, 10, (n, 3)).astype(np.float64)
+    maxs = mins + rng.randint(0, 4, (n, 3))
+    return [tuple(bbox) for bbox in np.stack((mins, maxs), axis=2).reshape((-1, 6)).tolist()]
+
+def test_get_bbox_pairs_empty():
+    assert calc_trisurfaces.get_bbox_pairs(()) == []
+
+def test_get_bbox_pairs_touching():
+    bboxes = (0., 1., 0., 1., 0., 1.), (1., 2., 0., 1., 0., 1.), (2.5, 3., 0., 1., 0., 1.)
+    assert calc_trisurfaces.get_bbox_pairs(bboxes) == [(0, 1)]
+    assert calc_trisurfaces.get_bbox_pairs(bboxes, epsilon=.5) == [(0, 1), (1, 2)]
+
+@pytest.mark.parametrize("seed", range(30))
+@pytest.mark.parametrize("epsilon", (0., .5))
+def test_get_bbox_pairs_random(seed, epsilon):
+    bboxes = _get_random_bboxes(seed, 40)
+    pairs = calc_trisurfaces.get_bbox_pairs(bboxes, epsilon)
+    assert pairs == _get_reference_bbox_pairs(bboxes, epsilon)
@@ -0,0 +1,173 @@
+"""BlenderFDS, tests of voxelization routines."""
+
+import numpy as np
+import pytest
+from types import SimpleNamespace
+
+from zzz_blenderfds.geometry import calc_voxels
+
+# Reference voxelization of convex solids: a voxel is in the solid,
+# when its center is on the inner side of all the face planes.
+
+def _get_octahedron(center, radius) -> "tris":
+    """Get the counterclockwise triangles of an octahedron."""
+    verts = np.array(((1,0,0), (-1,0,0), (0,1,0), (0,-1,0), (0,0,1), (0,0,-1)), dtype=np.float64)
+    verts = verts * radius + center
+    faces = (
+        (0,2,4), (2,1,4), (1,3,4), (3,0,4),
+        (2,0,5), (1,2,5), (3,1,5), (0,3,5),
+    )
+    return verts[np.array(faces)]
+
+def _get_reference_voxels(tris, origin, voxel_size, shape) -> "set":
+    """Get the voxels with the center inside the convex solid, by brute force."""
+    normals = np.cross(tris[:, 1] - tris[:, 0], tris[:, 2] - tris[:, 0])
+    i0 = np.floor((tris.min(axis=(0, 1)) - origin) / voxel_size).astype(int) - 1
+    ijks = np.indices(shape).reshape(3, -1).T + i0
+    centers = origin + (ijks + .5) * voxel_size
+    dists = np.einsum("nk,fk->nf", centers, normals) - np.einsum("fk,fk->f", tris[:, 0], normals)
+    return set(map(tuple, ijks[np.all(dists < 0., axis=1)].tolist()))
+
+def _get_voxels(boxes) -> "set":
+    """Get the voxels covered by boxes, checking that they do not overlap."""
+    voxels = set()
+    nvoxels = 0
+    for ix0, ix1, iy0, iy1, iz0, iz1 in boxes:
+        box_voxels = {(i, j, k) for i in range(ix0, ix1) for j in range(iy0, iy1) for k in range(iz0, iz1)}
+        voxels.update(box_voxels)
+        nvoxels += len(box_voxels)
+    assert nvoxels == len(voxels)
+    return voxels
+
+@pytest.mark.parametrize("center, radius, voxel_size", (
+    ((.013, .027, .031), 1.7, .1),
+    ((-2.31, .77, 5.43), .93, .07),
+    ((10.1, -3.3, .2), 3.1, .25),
+))
+def test_scanline_octahedron(center, radius, voxel_size):
+    tris = _get_octahedron(center, radius)
+    boxes, origin, timing = calc_voxels.get_boxes_from_triangles(tris, voxel_size)
+    assert tuple(origin) == (0., 0., 0.)
+    shape = (int(2 * radius / voxel_size) + 4,) * 3
+    assert _get_voxels(boxes) == _get_reference_voxels(tris, np.zeros(3), voxel_size, shape)
+
+def test_scanline_center_voxels():
+    tris = _get_octahedron((.013, .027, .031), 1.7)
+    voxel_size = .1
+    boxes, origin, timing = calc_voxels.get_boxes_from_triangles(tris, voxel_size, center_voxels=True)
+    shape = (int(2 * 1.7 / voxel_size) + 4,) * 3
+    reference = _get_reference_voxels(tris, np.array(origin), voxel_size, shape)
+    assert _get_voxels(boxes) == reference
+
+def test_scanline_tiles():
+    tris = _get_octahedron((.013, .027, .031), 1.7)
+    boxes, origin, timing = calc_voxels.get_boxes_from_triangles(tris, .1)
+    boxes_tiles, origin, timing = calc_voxels.get_boxes_from_triangles(tris, .1, processes=2)
+    assert sorted(boxes_tiles) == sorted(boxes)
+
+def test_scanline_not_closed():
+    tris = _get_octahedron((.013, .027, .031), 1.7)[1:]
+    with pytest.raises(ValueError):
+        calc_voxels.get_boxes_from_triangles(tris, .1)
+
+def test_scanline_empty():
+    boxes, origin, timing = calc_voxels.get_boxes_from_triangles(np.empty((0, 3, 3)), .1)
+    assert boxes == list()
+
+# Box merging
+
+def _get_sphere_boxes(radius) -> "boxes":
+    """Get the x spans of a voxelized sphere, grown along y and z."""
+    centers = np.arange(-radius, radius) + .5
+    boxes = list()
+    for k, z in enumerate(centers):
+        for j, y in enumerate(centers):
+            ixs = np.nonzero(centers ** 2 + y ** 2 + z ** 2 < radius ** 2)[0]
+            if len(ixs):
+                boxes.append([int(ixs[0]), int(ixs[-1]) + 1, j, j + 1, k, k + 1])
+    boxes = calc_voxels._grow_boxes_along_y(boxes, 4)
+    return calc_voxels._grow_boxes_along_z(boxes, 0)
+
+@pytest.mark.parametrize("radius", (3, 10, 25))
+def test_merge_boxes_sphere(radius):
+    boxes = _get_sphere_boxes(radius)
+    merged = calc_voxels._merge_boxes([list(box) for box in boxes])
+    assert _get_voxels(merged) == _get_voxels(boxes)
+    assert len(merged) < len(boxes)
+
+def test_merge_boxes_block():
+    boxes = [[i, i+1, j, j+1, k, k+1] for i in range(4) for j in range(3) for k in range(5)]
+    assert calc_voxels._merge_boxes(boxes) == [[0, 4, 0, 3, 0, 5]]
+
+def test_merge_boxes_partial_faces():
+    # An L-shape of columns, touching by partial faces
+    boxes = [[0, 1, 0, 1, 0, 3], [1, 3, 0, 1, 0, 1], [1, 3, 0, 1, 1, 2]]
+    merged = calc_voxels._merge_boxes(boxes)
+    assert _get_voxels(merged) == _get_voxels(boxes)
+    assert len(merged) == 2
+
+def test_merge_boxes_stacked_layers():
+    # A tall column under a wide slab: z growth stops at the first layer not free
+    boxes = [[0, 1, 0, 1, k, k+1] for k in range(50)] + [[0, 4, 0, 4, 50, 51]]
+    merged = calc_voxels._merge_boxes(boxes)
+    assert _get_voxels(merged) == _get_voxels(boxes)
+    assert sorted(merged) == [[0, 1, 0, 1, 0, 51], [0, 1, 1, 4, 50, 51], [1, 4, 0, 4, 50, 51]]
+
+def test_merge_boxes_grid_too_large(monkeypatch):
+    boxes = [[i, i+1, j, j+1, k, k+1] for i in range(4) for j in range(3) for k in range(5)]
+    monkeypatch.setattr(calc_voxels, "MAX_MERGE_CELLS", 4 * 3 * 5 - 1)
+    assert calc_voxels._merge_boxes(boxes) is None
+    assert calc_voxels._optimize_boxes(boxes, True) == (boxes, None)
+    assert calc_voxels._optimize_boxes(boxes, False) == (boxes, len(boxes))
+
+# Boxes from remeshed faces
+
+def _get_voxel_faces(occupancy, voxel_size) -> "normals, centers":
+    """Get the normals and centers of the boundary faces of occupied voxels, as remesh does."""
+    normals, centers = list(), list()
+    padded = np.pad(occupancy, 1, mode="constant")
+    for axis in range(3):
+        step = np.zeros(3, dtype=int)
+        step[axis] = 1
+        for sign in (1, -1):
+            neighbours = np.roll(padded, -sign, axis=axis)[1:-1, 1:-1, 1:-1]
+            ijks = np.argwhere(occupancy & ~neighbours)
+            centers.append((ijks + .5 + sign * step * .5) * voxel_size)
+            normals.append(np.tile(sign * step, (len(ijks), 1)))
+    return np.concatenate(normals).astype(np.float64), np.concatenate(centers)
+
+def test_boxes_from_faces():
+    voxel_size = .2
+    centers = np.arange(-8, 8) + .5
+    z, y, x = np.meshgrid(centers, centers, centers, indexing="ij")
+    occupancy = (x ** 2 + y ** 2 + z ** 2 < 64.).transpose(2, 1, 0)  # [i, j, k]
+    normals, face_centers = _get_voxel_faces(occupancy, voxel_size)
+    xbs, timing, nboxes = calc_voxels.get_voxels_from_faces(normals, face_centers, voxel_size, optimize=True)
+    boxes = [[int(round(coo / voxel_size)) for coo in xb] for xb in xbs]
+    assert _get_voxels(boxes) == set(map(tuple, np.argwhere(occupancy).tolist()))
+    assert len(boxes) < nboxes
+
+def test_boxes_from_faces_abnormal():
+    normals = np.array(((.6, .8, 0.), (-.6, -.8, 0.)))
+    with pytest.raises(ValueError):
+        calc_voxels.get_boxes_from_faces(normals, np.zeros((2, 3)), .1)
+
+# Pixels of an object with ARRAY modifiers, exported as MULT of the base element
+
+def test_pixels_flat_axis_of_base_element(monkeypatch):
+    # Horizontal sheets, arrayed along their normal: the object is 9 m high,
+    # its copy evaluated in place of the base element is flat along z
+    ob = SimpleNamespace(dimensions=(1., 1., 9.), bf_xb_center_voxels=False, bf_xb_optimize_voxels=False)
+    modifiers = SimpleNamespace(new=lambda name, type: SimpleNamespace(), remove=lambda mo: None)
+    ob_tmp = SimpleNamespace(dimensions=(1., 1., 0.), modifiers=modifiers, to_mesh=lambda **kwargs: None)
+    removed = list()
+    monkeypatch.setattr(calc_voxels.bpy, "data", SimpleNamespace(
+        objects=SimpleNamespace(remove=lambda ob, do_unlink: removed.append(ob))), raising=False)
+    monkeypatch.setattr(calc_voxels, "get_voxel_size", lambda context, ob: .1)
+    monkeypatch.setattr(calc_voxels.utils, "object_get_global_copy", lambda context, ob, suffix: ob_tmp)
+    monkeypatch.setattr(calc_voxels.utils, "get_bbox", lambda ob: (0., 1., 0., 1., 2., 2.))
+    monkeypatch.setattr(calc_voxels, "get_voxels", lambda context, ob: (
+        [[0., 1., 0., 1., 1.95, 2.05]], .1, (0., 0., 0., 0.), 1))
+    xbs, voxel_size, timing, nboxes = calc_voxels.get_pixels(SimpleNamespace(scene=None), ob)
+    assert xbs == [[0., 1., 0., 1., 2., 2.]]
+    assert removed == [ob_tmp]
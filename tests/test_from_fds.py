@@ -0,0 +1,137 @@
+"""BlenderFDS, tests of the translation of FDS geometry to meshes."""
+
+from collections import Counter
+import numpy as np
+import pytest
+
+from zzz_blenderfds.geometry import from_fds
+
+# Reference shell checks: a closed shell has each directed edge
+# matched by its reverse, and its volume (from the divergence theorem)
+# is the volume of the union of the boxes, counted cell by cell.
+
+def _get_faces(faces, loop_totals) -> "[[vertex index, ...], ...]":
+    """Get the faces as lists of vertex indices."""
+    faces = faces.tolist()
+    loop_starts = np.cumsum(loop_totals) - loop_totals
+    return [faces[start:start+total] for start, total in zip(loop_starts.tolist(), loop_totals.tolist())]
+
+def _get_edges(faces) -> "Counter":
+    """Get the directed edges of faces."""
+    return Counter((face[i], face[(i+1) % len(face)]) for face in faces for i in range(len(face)))
+
+def _get_volume(verts, faces) -> "float":
+    """Get the volume enclosed by faces, by fan triangulation."""
+    volume = 0.
+    for face in faces:
+        for i in range(1, len(face) - 1):
+            volume += np.dot(verts[face[0]], np.cross(verts[face[i]], verts[face[i+1]])) / 6.
+    return volume
+
+def _get_reference_volume(xbs) -> "float":
+    """Get the volume of the union of integer boxes, by brute force."""
+    cells = {
+        (i, j, k)
+        for x0, x1, y0, y1, z0, z1 in xbs
+        for i in range(x0, x1) for j in range(y0, y1) for k in range(z0, z1)
+    }
+    return float(len(cells))
+
+def _get_random_xbs(seed, n=6, size=5, flat=False) -> "xbs":
+    """Get random integer boxes, or random flat boxes normal to z."""
+    rng = np.random.RandomState(seed)
+    xbs = list()
+    for _ in range(n):
+        x0, y0, z0 = rng.randint(0, size, 3).tolist()
+        x1, y1, z1 = (rng.randint(1, 4, 3) + (x0, y0, z0)).tolist()
+        if flat:
+            z1 = z0
+        xbs.append((x0, x1, y0, y1, z0, z1))
+    return xbs
+
+#++ Grid indices
+
+def test_get_grid_indices():
+    values = np.array((1., 0., 1.000001, .5, 0., 2.))
+    grid, indices = from_fds._get_grid_indices(values, 1E-5)
+    assert grid.tolist() == [0., .5, 1., 2.]
+    assert indices.tolist() == [2, 0, 2, 1, 0, 3]
+
+@pytest.mark.parametrize("seed", range(20))
+def test_get_grid_indices_random(seed):
+    rng = np.random.RandomState(seed)
+    values = rng.randint(0, 10, 30) * .1 + rng.uniform(-1E-7, 1E-7, 30)
+    grid, indices = from_fds._get_grid_indices(values, 1E-5)
+    reference = sorted(set(np.round(values, 3).tolist()))
+    assert np.allclose(grid, reference, atol=1E-6)
+    assert np.allclose(grid[indices], values, atol=1E-6)
+
+#++ Shell
+
+def test_xbs_shell_empty():
+    verts, faces, loop_totals = from_fds.get_xbs_shell(())
+    assert len(verts) == len(faces) == len(loop_totals) == 0
+
+def test_xbs_shell_box():
+    verts, faces, loop_totals = from_fds.get_xbs_shell(((0., 1., 0., 2., 0., 3.),))
+    faces = _get_faces(faces, loop_totals)
+    assert len(verts) == 8
+    assert loop_totals.tolist() == [4] * 6
+    assert all(n == 1 for n in _get_edges(faces).values())
+    assert _get_volume(verts, faces) == pytest.approx(6.)
+
+def test_xbs_shell_adjacent_pixels():
+    # Flat boxes are joined, not cancelled
+    xbs = (0., 1., 0., 1., 0., 0.), (1., 2., 0., 1., 0., 0.)
+    verts, faces, loop_totals = from_fds.get_xbs_shell(xbs)
+    assert loop_totals.tolist() == [4]
+    assert sorted(map(tuple, verts[faces].tolist())) == [
+        (0., 0., 0.), (0., 1., 0.), (2., 0., 0.), (2., 1., 0.),
+    ]
+
+def test_xbs_shell_adjacent_voxels():
+    xbs = (0., 1., 0., 1., 0., 1.), (1., 2., 0., 1., 0., 1.)
+    verts, faces, loop_totals = from_fds.get_xbs_shell(xbs)
+    assert loop_totals.tolist() == [4] * 6
+    assert _get_volume(verts, _get_faces(faces, loop_totals)) == pytest.approx(2.)
+
+def test_xbs_shell_partial_faces():
+    # L-shape: the shared face is only partly covered, no T-junctions are left
+    xbs = (0, 2, 0, 1, 0, 1), (0, 1, 1, 2, 0, 1)
+    verts, faces, loop_totals = from_fds.get_xbs_shell(xbs)
+    faces = _get_faces(faces, loop_totals)
+    assert len(faces) == 10
+    assert all(n == 1 for n in _get_edges(faces).values())
+    assert _get_volume(verts, faces) == pytest.approx(3.)
+
+@pytest.mark.parametrize("seed", range(30))
+def test_xbs_shell_random(seed):
+    xbs = _get_random_xbs(seed)
+    verts, faces, loop_totals = from_fds.get_xbs_shell(xbs)
+    faces = _get_faces(faces, loop_totals)
+    edges = _get_edges(faces)
+    # Watertight: each directed edge is matched by its reverse
+    for (v0, v1), n in edges.items():
+        assert edges[(v1, v0)] == n
+    assert all(len(face) == len(set(face)) for face in faces)
+    assert _get_volume(verts, faces) == pytest.approx(_get_reference_volume(xbs))
+
+@pytest.mark.parametrize("seed", range(20))
+def test_xbs_shell_random_pixels(seed):
+    xbs = _get_random_xbs(seed, flat=True)
+    verts, faces, loop_totals = from_fds.get_xbs_shell(xbs)
+    faces = _get_faces(faces, loop_totals)
+    # Faces do not overlap, and cover the union of pixels
+    area = 0.
+    for face in faces:
+        xs, ys = verts[face, 0], verts[face, 1]
+        area += (xs.max() - xs.min()) * (ys.max() - ys.min())
+    cells = {
+        (i, j, z0)
+        for x0, x1, y0, y1, z0, _ in xbs
+        for i in range(x0, x1) for j in range(y0, y1)
+    }
+    assert area == pytest.approx(len(cells))
+    # Each face edge is shared by at most one other face, and never in the same direction
+    edges = _get_edges(faces)
+    assert all(n == 1 for n in edges.values())
@@ -0,0 +1,71 @@
+"""BlenderFDS, tests of regular lattices of boxes, exported as FDS MULT."""
+
+import numpy as np
+import pytest
+
+from zzz_blenderfds.fds import mult
+
+# Random box sets: some lattices of copies, with random steps and uppers,
+# plus some scattered boxes. Whatever the lattices found, their expansion
+# must give back the very same boxes.
+
+def _get_random_lattice(rng) -> "lattice":
+    """Get a random lattice, with coordinates of 2 decimal digits."""
+    x0, y0, z0 = (rng.randint(-500, 500, 3) / 100.).tolist()
+    sx, sy, sz = (rng.randint(1, 50, 3) / 100.).tolist()
+    steps = (rng.randint(1, 100, 3) / 100. + (sx, sy, sz)).tolist()
+    uppers = rng.randint(0, 4, 3).tolist()
+    return (x0, x0+sx, y0, y0+sy, z0, z0+sz), tuple(steps), tuple(uppers)
+
+def _get_random_xbs(seed) -> "xbs, lattices":
+    """Get random boxes, made of random lattices and scattered boxes."""
+    rng = np.random.RandomState(seed)
+    lattices = [_get_random_lattice(rng) for _ in range(rng.randint(1, 4))]
+    xbs = [xb for lattice in lattices for xb in mult.expand_lattice(lattice)]
+    xbs.extend(_get_random_lattice(rng)[0] for _ in range(rng.randint(0, 5)))
+    rng.shuffle(xbs)
+    return xbs, lattices
+
+def test_expand_lattice():
+    lattice = (0., 1., 0., 1., 0., 1.), (2., 3., 0.), (1, 1, 0)
+    assert mult.expand_lattice(lattice) == [
+        (0., 1., 0., 1., 0., 1.), (2., 3., 0., 1., 0., 1.),
+        (0., 1., 3., 4., 0., 1.), (2., 3., 3., 4., 0., 1.),
+    ]
+    assert mult.get_lattice_size(lattice) == 4
+
+def test_split_runs():
+    assert mult._split_runs([]) == []
+    assert mult._split_runs([5]) == [(5, 0, 1)]
+    assert mult._split_runs([0, 2, 4, 5, 6, 10]) == [(0, 2, 3), (5, 1, 2), (10, 0, 1)]
+
+def test_get_lattices_single_box():
+    xbs = [(0., 1., 0., 1., 0., 1.)]
+    assert mult.get_lattices(xbs) == [(xbs[0], (0., 0., 0.), (0, 0, 0))]
+
+def test_get_lattices_grid():
+    lattice = (.1, .3, .2, .5, 0., .4), (.5, .7, 1.1), (3, 2, 1)
+    xbs = mult.expand_lattice(lattice)
+    lattices = mult.get_lattices(xbs[::-1])
+    assert len(lattices) == 1
+    assert mult.get_lattice_size(lattices[0]) == len(xbs)
+    assert mult.check_lattices(xbs, lattices)
+
+@pytest.mark.parametrize("seed", range(50))
+def test_get_lattices_random(seed):
+    xbs, _ = _get_random_xbs(seed)
+    lattices = mult.get_lattices(xbs, precision=6)
+    assert mult.check_lattices(xbs, lattices, precision=6)
+    assert sum(mult.get_lattice_size(lattice) for lattice in lattices) == len(xbs)
+
+def test_check_lattices_wrong():
+    lattice = (0., 1., 0., 1., 0., 1.), (2., 0., 0.), (2, 0, 0)
+    xbs = mult.expand_lattice(lattice)
+    assert mult.check_lattices(xbs, [lattice])
+    assert not mult.check_lattices(xbs[:-1], [lattice])
+    assert not mult.check_lattices(xbs + [(9., 10., 0., 1., 0., 1.)], [lattice])
+
+def test_get_mult_record():
+    lattice = (0., 1., 0., 1., 0., 1.), (2., 0., .5), (3, 0, 1)
+    record = mult.get_mult_record("m", lattice, precision=3)
+    assert record.to_fds() == "&MULT ID='m' DX=2.000 I_UPPER=3 DZ=0.500 K_UPPER=1 /\n"
@@ -0,0 +1,39 @@
+"""BlenderFDS, tests of FDS namelist records serializer."""
+
+import numpy as np
+import pytest
+
+from zzz_blenderfds.fds import records
+
+# Chunked formatting must give the very same string
+# of the former concatenation, row by row.
+
+_verts_format = "\n            {:.6f}, {:.6f}, {:.6f},"
+_faces_format = "\n            {},{},{}, {},"
+
+def _get_reference_verts(fds_verts) -> "str":
+    verts_str = ""
+    for v in zip(*[iter(fds_verts)]*3):
+        verts_str += "\n            {0[0]:.6f}, {0[1]:.6f}, {0[2]:.6f},".format(v)
+    return verts_str
+
+def _get_reference_faces(fds_faces) -> "str":
+    faces_str = ""
+    for f in zip(*[iter(fds_faces)]*4):
+        faces_str += "\n            {0[0]},{0[1]},{0[2]}, {0[3]},".format(f)
+    return faces_str
+
+@pytest.mark.parametrize("nrows", (0, 1, 2, 7, 8, 9, 100))
+@pytest.mark.parametrize("chunk_size", (1, 8, 4096))
+def test_rows_to_fds_chunks(nrows, chunk_size):
+    rng = np.random.RandomState(nrows)
+    fds_verts = rng.uniform(-100., 100., nrows * 3).tolist()
+    fds_faces = rng.randint(1, 1000, nrows * 4).tolist()
+    verts_str = "".join(records.rows_to_fds_chunks(fds_verts, _verts_format, 3, chunk_size))
+    faces_str = "".join(records.rows_to_fds_chunks(fds_faces, _faces_format, 4, chunk_size))
+    assert verts_str == _get_reference_verts(fds_verts)
+    assert faces_str == _get_reference_faces(fds_faces)
+
+def test_rows_to_fds_chunks_count():
+    chunks = list(records.rows_to_fds_chunks(list(range(10)), "{}:{},", 2, chunk_size=2))
+    assert chunks == ["0:1,2:3,", "4:5,6:7,", "8:9,"]
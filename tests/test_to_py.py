@@ -0,0 +1,116 @@
+"""BlenderFDS, tests of FDS file tokenizer and value parser."""
+
+import random
+import pytest
+
+from zzz_blenderfds.fds import to_py
+
+# Random FDS-like texts, with tricky strings, separators and comments.
+# The linear time scanners must give the same results of the regular expressions.
+
+_pieces = (
+    "&", "/", "\n", "\n&", " ", ",", "=", "'", '"', "a", "ID", "XB", "T", ".TRUE.",
+    "1.5", "-2", "3*0.", "1.D-3", "(1:3)", "\t", "'a/b'", '"c&d"', "'e=f,g'", '"it\'s"',
+    "SURF_ID='INERT'", "XB=1,2,3,4,5,6", "&OBST", "&HEAD CHID='x' /", "! comment /",
+)
+
+def _get_random_text(rnd, npieces) -> "str":
+    return "".join(rnd.choice(_pieces) for _ in range(npieces))
+
+def _get_random_namelists(rnd, nnamelists) -> "str":
+    lines = list()
+    for _ in range(nnamelists):
+        params = ", ".join(
+            "{}={}".format(rnd.choice(("ID", "XB", "SURF_ID", "MATL_ID(1:2)", "T_END")), _get_random_text(rnd, 3))
+            for _ in range(rnd.randint(0, 4))
+        )
+        lines.append("&{} {} /{}".format(rnd.choice(("OBST", "HEAD", "SURF", "X")), params, _get_random_text(rnd, 2)))
+    return "\n".join(lines)
+
+@pytest.mark.parametrize("seed", range(200))
+def test_scan_namelists_random(seed):
+    rnd = random.Random(seed)
+    text = seed % 2 and _get_random_namelists(rnd, 10) or _get_random_text(rnd, 40)
+    assert to_py.scan_namelists(text) == to_py._extract_namelists(text)
+
+@pytest.mark.parametrize("seed", range(200))
+def test_scan_params_random(seed):
+    rnd = random.Random(seed)
+    text = _get_random_text(rnd, 30)
+    assert to_py._scan_params(text) == to_py._extract_params(text)
+
+def test_scan_namelists():
+    text = "&HEAD CHID='a/b', TITLE=\"c&d\" /\nnot a &MISC /\n&OBST XB=1,2,3,4,5,6, SURF_ID='x' / comment\n&TAIL /"
+    nls = to_py.scan_namelists(text)
+    assert [nl[1] for nl in nls] == ["HEAD", "OBST", "TAIL"]
+    assert nls == to_py._extract_namelists(text)
+    assert to_py._scan_params(nls[0][2]) == [("CHID", "'a/b'"), ("TITLE", '"c&d"')]
+
+def test_iter_namelists(tmpdir):
+    text = _get_random_namelists(random.Random(0), 50) + "\n&OBST ID='àè' /\n"
+    filepath = str(tmpdir.join("case.fds"))
+    with open(filepath, "w", encoding="utf8") as f:
+        f.write(text)
+    nls = [nl for offset, nl in to_py.iter_namelists(filepath)]
+    assert nls == to_py.scan_namelists(text)
+
+def test_iter_namelists_empty(tmpdir):
+    filepath = str(tmpdir.join("empty.fds"))
+    open(filepath, "w").close()
+    assert list(to_py.iter_namelists(filepath)) == list()
+
+# Value parser
+
+@pytest.mark.parametrize("text, value", (
+    ("1", 1),
+    ("-2.5", -2.5),
+    ("1.D-3", 1E-3),
+    ("2.e2", 200.),
+    ("T", True),
+    (".TRUE.", True),
+    ("f", False),
+    (".FALSE.", False),
+    ("'INERT'", "INERT"),
+    ('"a/b, c"', "a/b, c"),
+    ("'it''s'", "it's"),
+    ('"say ""hi"""', 'say "hi"'),
+    ("''", ""),
+    ("'a','b'", ("a", "b")),
+    ("'a' 'b'", ("a", "b")),
+    ("'x',T,2", ("x", True, 2)),
+    ("2*'a'", ("a", "a")),
+    ("'a\nb'", "a b"),
+))
+def test_eval_param(text, value):
+    assert to_py._eval_param(text) == value
+
+@pytest.mark.parametrize("seed", range(50))
+def test_eval_param_numbers(seed):
+    # Numeric arrays are the same of the Py eval of the original parser
+    rnd = random.Random(seed)
+    values = [rnd.choice((rnd.randint(-1000, 1000), rnd.uniform(-1E3, 1E3))) for _ in range(rnd.randint(2, 30))]
+    text = rnd.choice((",", ", ", " ", ",\n")).join(repr(value) for value in values)
+    assert list(to_py._eval_param(text)) == list(eval(text.replace("\n", " ").replace(" ", ",").replace(",,", ",")))
+
+def test_eval_param_repeat():
+    assert list(to_py._eval_param("3*0.,1.")) == [0., 0., 0., 1.]
+    assert list(to_py._eval_param("2*1,3")) == [1, 1, 3]
+
+def test_eval_param_arrays():
+    assert to_py._eval_param("1,2,3").typecode == "q"
+    assert to_py._eval_param("1,2.,3").typecode == "d"
+
+def test_eval_param_errors():
+    with pytest.raises(ValueError):
+        to_py._eval_param(" ")
+    with pytest.raises(ValueError):
+        to_py._eval_param("abc")
+
+def test_tokenize():
+    text = "&OBST ID='it''s', XB=1,2,3,4,5,6, THICKEN=T /\n&TAIL /\n"
+    tokens = to_py.tokenize(text)
+    label, params, nl = tokens[0]
+    assert label == "OBST"
+    assert params["ID"] == ("it's", "'it''s'")
+    assert list(params["XB"][0]) == [1, 2, 3, 4, 5, 6]
+    assert params["THICKEN"][0] is True
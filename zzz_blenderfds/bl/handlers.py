@@ -2,7 +2,7 @@
 
 import bpy
 
-from .. import fds
+from .. import fds, geometry
 from .. import config
 
 DEBUG = False
@@ -32,6 +32,11 @@ def _load_post(self): # Beware: self is None
     context = bpy.context
     # Check file format version
     check_file_version(context)
+    # Delete cached geometry of previous file, and old cached geometry ID properties
+    geometry.cache.clear()
+    for ob in bpy.data.objects:
+        for key in ("ob_to_xbs_cache", "ob_to_xyzs_cache", "ob_to_pbs_cache"):
+            if key in ob: del ob[key]
     # Init FDS default materials
     if not fds.surf.has_predefined(): bpy.ops.material.bf_set_predefined()
     # Set default scene appearance
@@ -96,13 +101,7 @@ def set_file_version(context):
 @bpy.app.handlers.persistent 
 def _scene_update_post(context): 
     """This function is run after each Scene update"""
-    # Detect object change and delete cached geometry
-    if bpy.data.objects.is_updated:
-        for ob in bpy.data.objects:
-            # is_updated -> object, is_updated_data -> its mesh
-            if ob.is_updated: # or ob.is_updated_data: less actions, no check on mesh update...
-                ob["ob_to_xbs_cache"] = False
-                ob["ob_to_xyzs_cache"] = False
-                ob["ob_to_pbs_cache"] = False
-                DEBUG and print("BFDS: _scene_update_post: deleted all cached geometry:", ob.name)
-
+    # Detect object or mesh change and delete cached geometry
+    if bpy.data.objects.is_updated or bpy.data.meshes.is_updated:
+        ninvalidated = geometry.cache.invalidate_updated()
+        DEBUG and ninvalidated and print("BFDS: _scene_update_post: deleted cached geometries:", ninvalidated)
@@ -10,7 +10,7 @@ from ..types import BFProp
 from ..exceptions import BFException
 from .. import fds
 from .. import geometry
-from ..utils import is_writable, write_to_file
+from ..utils import is_writable, write_to_file, write_chunks_to_file
 
 DEBUG = False
 
@@ -467,6 +467,12 @@ class OBJECT_OT_bf_show_fds_geometry(Operator):
     bl_idname = "object.bf_show_fds_geometry"
     bl_description = "Show geometry as exported to FDS"
 
+    bf_shell = BoolProperty(
+        name="Show Shell Only",
+        description="Show only the exterior shell of voxels and pixels, without their internal faces",
+        default=True,
+    )
+
     def execute(self, context):
         # Init
         w = context.window_manager.windows[0]
@@ -502,7 +508,7 @@ class OBJECT_OT_bf_show_fds_geometry(Operator):
             if msg:
                 msgs.append(msg)
             if xbs:
-                geometry.from_fds.xbs_to_ob(xbs, context, bf_xb=ob.bf_xb, name="Tmp Object {} XBs".format(ob.name)).set_tmp(context, ob)
+                geometry.from_fds.xbs_to_ob(xbs, context, bf_xb=ob.bf_xb, name="Tmp Object {} XBs".format(ob.name), shell=self.bf_shell).set_tmp(context, ob)
             # Manage XYZ: get coordinates, show them in a tmp object, prepare msg
             msg = None
             try: xyzs, msg = geometry.to_fds.ob_to_xyzs(context, ob)
@@ -565,6 +571,50 @@ class OBJECT_OT_bf_hide_fds_geometry_from_tmp(Operator): # TODO check what if mu
             return{'CANCELLED'}
 
 
+### Check intersections of GEOM objects
+
+class SCENE_OT_bf_check_intersections(Operator):
+    bl_label = "Check Intersections"
+    bl_idname = "scene.bf_check_intersections"
+    bl_description = "Check self and mutual intersections of all exported GEOM objects, select intersecting faces"
+
+    def execute(self, context):
+        # Init
+        w = context.window_manager.windows[0]
+        w.cursor_modal_set("WAIT")
+        if context.mode != 'OBJECT':
+            bpy.ops.object.mode_set(mode='OBJECT', toggle=False)
+        obs = [ob for ob in context.scene.objects if ob.bf_export and ob.bf_namelist_cls == "ON_GEOM" and not ob.bf_is_tmp]
+        # Check
+        results = geometry.calc_trisurfaces.check_intersections(context, obs)
+        if not results:
+            w.cursor_modal_restore()
+            self.report({"INFO"}, "No intersection in {} GEOM objects".format(len(obs)))
+            return {'FINISHED'}
+        # Select intersecting objects and faces
+        bpy.ops.object.select_all(action='DESELECT')
+        for ob in obs:
+            ob.data.polygons.foreach_set("select", [False] * len(ob.data.polygons))
+        msgs = list()
+        for ob, other_ob, faces, other_faces in results:
+            labels = list()
+            for element, element_faces in ((ob, faces), (other_ob, other_faces)):
+                element.select = True
+                if element_faces is None:  # modified faces, whole object selected
+                    labels.append("all")
+                    continue
+                for iface in element_faces:
+                    element.data.polygons[iface].select = True
+                labels.append(str(len(element_faces)))
+            if ob == other_ob:
+                msgs.append("{} ({} faces)".format(ob.name, labels[0]))
+            else:
+                msgs.append("{} and {} ({} and {} faces)".format(ob.name, other_ob.name, *labels))
+        context.scene.objects.active = results[0][0]
+        w.cursor_modal_restore()
+        self.report({"WARNING"}, "Intersections, faces selected: {}".format("; ".join(msgs)))
+        return {'FINISHED'}
+
 ### Restore all tmp objects
 
 class SCENE_OT_bf_restore_all_tmp_objects(Operator):
@@ -573,8 +623,9 @@ class SCENE_OT_bf_restore_all_tmp_objects(Operator):
     bl_description = "Reset all FDS cached geometry and temporary objects"
 
     def execute(self, context):
+        info = geometry.cache.get_info()
         geometry.tmp_objects.restore_all(context)
-        self.report({"INFO"}, "All FDS cached geometry and temporary objects reset")
+        self.report({"INFO"}, "All FDS cached geometry and temporary objects reset (were {})".format(info))
         return {'FINISHED'}
 
 ### Open text editor with right text displayed
@@ -674,6 +725,11 @@ class import_OT_fds_case(Operator, ImportHelper):
     bl_description = "Import an FDS case file into a new Blender Scene"
     filename_ext = ".fds"
     filter_glob = bpy.props.StringProperty(default="*.fds", options={'HIDDEN'})
+    bf_merge_boxes = bpy.props.BoolProperty(
+        name="Merge Boxes",
+        description="Import simple OBST, HOLE and VENT namelists with the same parameters into one object of boxes",
+        default=False,
+    )
 
     def execute(self, context):
         return bl_scene_from_fds_case(
@@ -752,28 +808,19 @@ def _view3d_view_all(context):
                     override = {'area': area, 'region': region, 'edit_object': bpy.context.edit_object}
                     bpy.ops.view3d.view_all(override)
 
-def bl_scene_from_fds_case(operator, context, to_current_scene=False, filepath=""):
+def bl_scene_from_fds_case(operator, context, to_current_scene=False, filepath="", bf_merge_boxes=False):
     """Import FDS file to a Blender Scene"""
     # Init
     w = context.window_manager.windows[0]
     w.cursor_modal_set("WAIT")
-    # Read file
+    # Check file
     DEBUG and print("BFDS: operators.bl_scene_from_fds_case: Importing:", filepath)
-    encodings = [('utf8','ignore'),('windows-1252',None),('utf8',None),] # Last tested first
-    while encodings:
-        e = encodings.pop()
-        try:
-            with open(filepath,"r",encoding=e[0],errors=e[1]) as infile:
-                imported_value = infile.read()
-        except UnicodeDecodeError: pass
-        except:
-            w.cursor_modal_restore()
-            operator.report({"ERROR"}, "FDS file not readable, cannot import")
-            return {'CANCELLED'}
-        else: break
-    if not encodings:
+    try:
+        filesize = os.path.getsize(filepath)
+        with open(filepath, "rb"): pass
+    except OSError:
         w.cursor_modal_restore()
-        operator.report({"ERROR"}, "Unknown text encoding, cannot import")
+        operator.report({"ERROR"}, "FDS file not readable, cannot import")
         return {'CANCELLED'}
     # Get Scene
     if to_current_scene:
@@ -784,12 +831,25 @@ def bl_scene_from_fds_case(operator, context, to_current_scene=False, filepath="
         sc = bpy.data.scenes.new("imported_case")
         bpy.context.screen.scene = sc
         sc.set_default_appearance(context)
-    # Import to Scene
-    try: sc.from_fds(context=context, value=imported_value)
+    # Import to Scene, reading one namelist at a time
+    wm = context.window_manager
+    wm.progress_begin(0, max(filesize, 1))
+    def namelists():
+        for offset, nl in fds.to_py.iter_namelists(filepath):
+            wm.progress_update(offset)
+            yield nl
+    try: sc.from_fds(context=context, namelists=namelists(), merge_boxes=bf_merge_boxes)
     except BFException as err:
+        wm.progress_end()
         w.cursor_modal_restore()
         operator.report({"ERROR"}, err.labels[0])
         return {'CANCELLED'}
+    except OSError:
+        wm.progress_end()
+        w.cursor_modal_restore()
+        operator.report({"ERROR"}, "FDS file not readable, cannot import")
+        return {'CANCELLED'}
+    wm.progress_end()
     # Adapt 3DView
     _view3d_view_all(context)
     # End
@@ -822,6 +882,16 @@ class export_OT_fds_case(Operator, ExportHelper):
     bl_description = "Export current Blender Scene as an FDS case file"
     filename_ext = ".fds"
     filter_glob = bpy.props.StringProperty(default="*.fds", options={'HIDDEN'})
+    bf_stream = bpy.props.BoolProperty(
+        name="Stream to File",
+        description="Write the FDS case file while exporting, to save memory",
+        default=True,
+    )
+    bf_parallel = bpy.props.BoolProperty(
+        name="Parallel Geometry",
+        description="Calculate object geometries by a pool of processes, as set in the case configuration",
+        default=True,
+    )
 
     def execute(self, context):
         # Init
@@ -838,15 +908,21 @@ class export_OT_fds_case(Operator, ExportHelper):
             w.cursor_modal_restore()
             self.report({"ERROR"}, "FDS file not writable, cannot export")
             return {'CANCELLED'}
-        # Prepare FDS file
-        try: fds_file = sc.to_fds(context=context, with_children=True)
+        # Prepare and write FDS file
+        try:
+            if self.bf_parallel and sc.bf_config_processes > 1:
+                geometry.parallel.calc_geometries(context, sc.objects, sc.bf_config_processes)
+            if self.bf_stream:
+                is_written = write_chunks_to_file(filepath, sc.to_fds_chunks(context=context, with_children=True))
+            else:
+                fds_file = sc.to_fds(context=context, with_children=True)
+                # Add namelist index # TODO develop
+                is_written = write_to_file(filepath, fds_file)
         except BFException as err:
             w.cursor_modal_restore()
             self.report({"ERROR"}, str(err))
             return{'CANCELLED'}
-        # Add namelist index # TODO develop
-        # Write FDS file
-        if not write_to_file(filepath, fds_file):
+        if not is_written:
             w.cursor_modal_restore()
             self.report({"ERROR"}, "FDS file not writable, cannot export")
             return {'CANCELLED'}
@@ -876,5 +952,5 @@ class export_OT_fds_case(Operator, ExportHelper):
         # End
         w.cursor_modal_restore()
         DEBUG and print("BFDS: export_OT_fds_case: End.")
-        self.report({"INFO"}, "FDS case exported")
+        self.report({"INFO"}, "FDS case exported ({})".format(geometry.cache.get_info()))
         return {'FINISHED'}
@@ -105,6 +105,8 @@ class OBJECT_PT_BF_MESH(Panel):
         row.prop(element, "show_transparent", icon="GHOST", text="")
         row.prop(element, "draw_type", text="")
         element.bf_namelist.draw(context, layout)
+        if element.bf_namelist_cls == "ON_GEOM":
+            layout.operator("scene.bf_check_intersections")
         row = layout.row()
         if element.bf_has_tmp: row.operator("object.bf_hide_fds_geometry")
         else: row.operator("object.bf_show_fds_geometry")
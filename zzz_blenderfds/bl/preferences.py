@@ -28,6 +28,13 @@ class BFPreferences(AddonPreferences):
             maxlen=1024,
             )
 
+    bf_pref_cache_size = IntProperty(
+            name="Geometry Cache Size [MB]",
+            description="Memory budget for cached geometry, least recently used geometry is deleted when exceeded",
+            min=1,
+            default=256,
+            )
+
     def draw(self, context):
         layout = self.layout
 
@@ -44,6 +51,8 @@ class BFPreferences(AddonPreferences):
         col_export.prop(self, "bf_pref_use_custom_snippet_path", text="")
         col.prop(self, "bf_pref_custom_snippet_path")
         col.active = bool(self.bf_pref_use_custom_snippet_path) # if not used, layout is inactive
+        # Cache
+        layout.prop(self, "bf_pref_cache_size")
         # Mouse button selection
         row = layout.row()
         row.label("Mouse Select With Button:")
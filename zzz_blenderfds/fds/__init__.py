@@ -1,3 +1,3 @@
 """BlenderFDS, FDS related routines"""
 
-from . import head, mesh, surf, tables, to_py
+from . import head, mesh, surf, tables, to_py, records, mult
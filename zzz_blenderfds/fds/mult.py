@@ -0,0 +1,86 @@
+"""BlenderFDS, detect regular lattices of boxes and export them as FDS MULT."""
+
+from .records import FDSParam, FDSNamelist
+
+# A lattice is a base box and its copies, translated by (i*dx, j*dy, k*dz)
+# for 0 <= i <= i_upper, 0 <= j <= j_upper, 0 <= k <= k_upper,
+# as described by the FDS MULT namelist.
+# Coordinates are compared as integers, rounded to the exported precision,
+# so that the expanded lattices give the very same exported boxes.
+
+def _to_ints(xbs, precision) -> "[(x0,x1,y0,y1,z0,z1,), ...]":
+    """Get xbs as integers rounded to precision."""
+    scale = 10 ** precision
+    return [tuple(int(round(coo * scale)) for coo in xb) for xb in xbs]
+
+def _split_runs(values) -> "[(start, step, count), ...]":
+    """Split sorted integer values in arithmetic runs."""
+    runs = list()
+    i, nvalues = 0, len(values)
+    while i < nvalues:
+        if i + 1 == nvalues:
+            runs.append((values[i], 0, 1))
+            break
+        step, j = values[i+1] - values[i], i + 1
+        while j + 1 < nvalues and values[j+1] - values[j] == step:
+            j += 1
+        runs.append((values[i], step, j - i + 1))
+        i = j + 1
+    return runs
+
+def get_lattices(xbs, precision=6) -> "[(xb, (dx,dy,dz,), (i_upper,j_upper,k_upper,)), ...]":
+    """Get the regular lattices of boxes covering xbs ((x0,x1,y0,y1,z0,z1,), ...)."""
+    # Group boxes by size
+    origins_by_size = dict()
+    for x0, x1, y0, y1, z0, z1 in _to_ints(xbs, precision):
+        origins_by_size.setdefault((x1-x0, y1-y0, z1-z0), list()).append((x0, y0, z0))
+    # Build 1D lattices along x, then join them along y and along z
+    ilattices = list()
+    for size, origins in sorted(origins_by_size.items()):
+        rows = dict()  # (y, z): xs
+        for x, y, z in origins:
+            rows.setdefault((y, z), list()).append(x)
+        xruns = dict()  # (xrun, z): ys
+        for (y, z), xs in sorted(rows.items()):
+            for xrun in _split_runs(sorted(xs)):
+                xruns.setdefault((xrun, z), list()).append(y)
+        yruns = dict()  # (xrun, yrun): zs
+        for (xrun, z), ys in sorted(xruns.items()):
+            for yrun in _split_runs(sorted(ys)):
+                yruns.setdefault((xrun, yrun), list()).append(z)
+        for (xrun, yrun), zs in sorted(yruns.items()):
+            for zrun in _split_runs(sorted(zs)):
+                ilattices.append((size, xrun, yrun, zrun))
+    # Send back to float
+    scale = 10 ** precision
+    lattices = list()
+    for (sx, sy, sz), (x0, dx, ni), (y0, dy, nj), (z0, dz, nk) in ilattices:
+        xb = x0 / scale, (x0+sx) / scale, y0 / scale, (y0+sy) / scale, z0 / scale, (z0+sz) / scale
+        lattices.append((xb, (dx / scale, dy / scale, dz / scale), (ni-1, nj-1, nk-1)))
+    return lattices
+
+def expand_lattice(lattice) -> "((x0,x1,y0,y1,z0,z1,), ...)":
+    """Get all the boxes of lattice, as FDS does with MULT."""
+    (x0, x1, y0, y1, z0, z1), (dx, dy, dz), (i_upper, j_upper, k_upper) = lattice
+    return [
+        (x0 + i*dx, x1 + i*dx, y0 + j*dy, y1 + j*dy, z0 + k*dz, z1 + k*dz)
+        for k in range(k_upper+1) for j in range(j_upper+1) for i in range(i_upper+1)
+    ]
+
+def check_lattices(xbs, lattices, precision=6) -> "bool":
+    """Check that the expanded lattices give back xbs, in any order."""
+    expanded_xbs = [xb for lattice in lattices for xb in expand_lattice(lattice)]
+    return sorted(_to_ints(xbs, precision)) == sorted(_to_ints(expanded_xbs, precision))
+
+def get_lattice_size(lattice) -> "int":
+    """Get the number of boxes of lattice."""
+    i_upper, j_upper, k_upper = lattice[2]
+    return (i_upper+1) * (j_upper+1) * (k_upper+1)
+
+def get_mult_record(mult_id, lattice, precision=6) -> "FDSNamelist":
+    """Get the FDS MULT namelist record of lattice."""
+    params = [FDSParam("ID", (mult_id,))]
+    for label, step, upper_label, upper in zip(("DX", "DY", "DZ"), lattice[1], ("I_UPPER", "J_UPPER", "K_UPPER"), lattice[2]):
+        if upper:
+            params.extend((FDSParam(label, (step,), precision=precision), FDSParam(upper_label, (upper,))))
+    return FDSNamelist("MULT", params)
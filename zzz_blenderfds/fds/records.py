@@ -0,0 +1,123 @@
+"""BlenderFDS, FDS namelist records and their serializer."""
+
+# Exporters do not build FDS strings directly: they build lightweight
+# records (namelist label, ordered params with typed values, infos),
+# that are sent to string only by their to_fds() method, when the
+# namelist string is requested (eg. BFNamelist.to_fds()).
+# Caching, deduplication or compression can work on the records.
+# A param can also be a raw string (eg. "T_END=0.") or, for namelists,
+# a list of params, each one generating a separate namelist line (multiparams).
+# A namelist can carry the MULT namelists referenced by its params by MULT_ID,
+# they are sent to string before it.
+
+class FDSParam():
+    """Record of an FDS parameter, with typed values."""
+
+    __slots__ = "label", "values", "precision", "quoted"
+
+    def __init__(self, label, values, precision=3, quoted=True):
+        self.label = label  # FDS label, eg. "ID", "XB", ... or None
+        self.values = values  # tuple of bool, int, float, or str values
+        self.precision = precision  # for float values
+        self.quoted = quoted  # for str values
+
+    def __repr__(self):
+        return "FDSParam({!r}, {!r})".format(self.label, self.values)
+
+    def to_fds(self) -> "str":
+        """Get FDS string."""
+        # Expected output:
+        #   ID='example' or PI=3.14 or COLOR=3,4,5
+        values = self.values
+        if   isinstance(values[0], bool):
+            value = ",".join(value and ".TRUE." or ".FALSE." for value in values)
+        elif isinstance(values[0], int):
+            value = ",".join(str(value) for value in values)
+        elif isinstance(values[0], float):
+            value = ",".join("{:.{}f}".format(value, self.precision) for value in values)
+        elif self.quoted:
+            value = ",".join("'{}'".format(value) for value in values)
+        else:
+            value = ",".join(str(value) for value in values)
+        if self.label:
+            return "=".join((self.label, value))
+        return value
+
+
+def rows_to_fds_chunks(values, row_format, row_size, chunk_size=4096) -> "generator":
+    """Get FDS string of flat values, row_size values in each formatted row, one chunk of rows at a time."""
+    # One format call for each chunk of rows, not for each row
+    nrows = len(values) // row_size
+    chunk_format = row_format * chunk_size
+    for i in range(0, nrows, chunk_size):
+        chunk = values[i*row_size:(i+chunk_size)*row_size]
+        if len(chunk) < chunk_size * row_size:
+            chunk_format = row_format * (len(chunk) // row_size)
+        yield chunk_format.format(*chunk)
+
+
+def param_to_fds(param) -> "str":
+    """Get FDS string of FDSParam or raw string param."""
+    if isinstance(param, str):
+        return param
+    return param.to_fds()
+
+
+class FDSNamelist():
+    """Record of an FDS namelist, with ordered params and infos."""
+
+    __slots__ = "label", "params", "infos", "separator", "mults"
+
+    def __init__(self, label, params=None, infos=None, separator=" ", mults=None):
+        self.label = label  # FDS label, eg. "OBST"
+        self.params = params or list()  # FDSParam, raw str, or list of them (multiparams)
+        self.infos = infos or list()  # str
+        self.separator = separator  # between params
+        self.mults = mults or list()  # FDSNamelist of referenced MULT
+
+    def __repr__(self):
+        return "FDSNamelist({!r}, {!r})".format(self.label, self.params)
+
+    def get_param(self, label) -> "FDSParam or None":
+        """Get first FDSParam by label."""
+        for param in self.params:
+            if isinstance(param, FDSParam) and param.label == label:
+                return param
+
+    def to_fds(self) -> "str":
+        """Get FDS string."""
+        # Expected output:
+        # ! info message 1
+        # ! info message 2
+        # &MULT ID='example_mult' DX=... I_UPPER=... /\n
+        # &OBST ID='example' XB=... /\n
+        # &OBST ID='example' XB=... /\n
+        fds_label = "".join(("&", self.label, " "))
+        info = "".join(("! {}\n".format(info) for info in self.infos))
+        mults = "".join((mult.to_fds() for mult in self.mults))
+        # Extract the first and only multiparams from params
+        params = list()
+        multiparams = None
+        for param in self.params:
+            if multiparams is None and isinstance(param, (list, tuple)):
+                multiparams = [param_to_fds(mp) for mp in param]
+            else:
+                params.append(param_to_fds(param))
+        # ... then remove ordinary single ID
+        if multiparams is not None:
+            for param in params:
+                if param[:3] == "ID=":
+                    params.remove(param)
+                    break
+        # ... and join remaining params + namelist closure
+        params.append("/\n")
+        param = self.separator.join(params)
+        # Build namelists, set body
+        # &fds_label multiparam param /
+        if multiparams:
+            body = "".join((
+                self.separator.join(("".join((fds_label, multiparam)), param)) for multiparam in multiparams
+            ))
+        else:
+            body = "".join((fds_label, param))
+        return "".join((info, mults, body))
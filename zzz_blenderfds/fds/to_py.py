@@ -1,6 +1,7 @@
 """BlenderFDS, tokenize FDS file in a readable notation."""
 
-import re
+import re, mmap, codecs
+from array import array
 from ..exceptions import BFException
 
 nl_re = re.compile(r"""
@@ -46,17 +47,273 @@ def _extract_params(text):
     return re.findall(param_re, text)
 
 
-def _eval_param(text):
-    """Eval text to the corresponding Py value."""
-    # Remove newlines
-    text = ' '.join(text.splitlines())
-    # Get logicals, or eval
-    if text.upper() in ('T', '.TRUE.'):
+# The regular expressions above backtrack heavily on large namelists
+# (eg. long GEOM VERTS) or on many quoted strings.
+# The following scanners return the same results in linear time:
+# each char is visited once, as the chunks between special chars
+# are skipped by simple anchored char classes, strings by str.find(),
+# and the outcome of a scan is memoized at each special char,
+# so that scans restarted after a failed match never repeat work.
+
+_label_chars_re = re.compile(r"[a-zA-Z][a-zA-Z0-9_]+")
+_param_label_chars_re = re.compile(r"[a-zA-Z][a-zA-Z0-9_\(\):,]+")
+_letter_re = re.compile(r"[a-zA-Z]")
+_seps_re = re.compile(r"[,\s]+")
+_spaces_re = re.compile(r"\s*")
+_nl_chars_re = re.compile(r"[^'\"&/]*")
+_value_stop_re = re.compile(r"""(?<![,\s])[,\s]+[a-zA-Z]|['"]""")
+
+
+def _is_sep(c):
+    """Check if c is a separator of any kind."""
+    return c == "," or c.isspace()
+
+
+def _scan_nl_params(text, k, memo, chars_re=_nl_chars_re, slash="/", ampersand="&"):
+    """Scan namelist params from k to the closing slash, return its position or None.
+    Text is str, or bytes with the corresponding chars_re, slash and ampersand."""
+    visited = list()
+    n = len(text)
+    while True:
+        k = chars_re.match(text, k).end()
+        if k in memo:
+            result = memo[k]
+            break
+        visited.append(k)
+        c = text[k:k + 1]
+        if k == n or c == ampersand:  # no closing slash
+            result = None
+            break
+        if c == slash:
+            result = k
+            break
+        k = text.find(c, k + 1)  # closing quote
+        if k < 0:
+            result = None
+            break
+        k += 1
+    for k in visited:
+        memo[k] = result
+    return result
+
+
+def scan_namelists(text):
+    """Return a list of multiline namelists strings from an fds file, as _extract_namelists."""
+    namelists = list()
+    memo = dict()
+    n = len(text)
+    i = 0
+    while True:
+        # Find next ampersand after newline
+        if not (i == 0 and text[:1] == "&"):
+            i = text.find("\n&", max(i - 1, 0))
+            if i < 0:
+                break
+            i += 1
+        # Get label and separators
+        m = _label_chars_re.match(text, i + 1)
+        if not m or m.end() == n or not _is_sep(text[m.end()]):
+            i += 1
+            continue
+        p0 = _seps_re.match(text, m.end()).end()
+        # Get params, up to the closing slash, without trailing separators
+        k = _scan_nl_params(text, p0, memo)
+        if k is None:
+            i += 1
+            continue
+        p1 = k
+        while p1 > p0 and _is_sep(text[p1 - 1]):
+            p1 -= 1
+        namelists.append((text[i:k + 1], m.group(), text[p0:p1]))
+        i = k + 1
+    return namelists
+
+
+def _is_next_param(text, k, memo):
+    """Check if k is followed by separators and another param label with equal sign."""
+    if k in memo:
+        return memo[k]
+    result = False
+    m = _seps_re.match(text, k)
+    if m:
+        m = _param_label_chars_re.match(text, m.end())
+        if m:
+            e = _spaces_re.match(text, m.end()).end()
+            result = text[e:e + 1] == "="
+    memo[k] = result
+    return result
+
+
+def _is_value_end(text, k, memo):
+    """Check if param value can end at k."""
+    n = len(text)
+    return k == n or (k == n - 1 and text[k] == "\n") or _is_next_param(text, k, memo)
+
+
+def _scan_value(text, k, memo, next_param_memo):
+    """Scan param value from k, return its end or None."""
+    # Get first unit
+    n = len(text)
+    if k == n:
+        return None
+    c = text[k]
+    if c in "'\"":
+        k = text.find(c, k + 1)
+        if k < 0:
+            return None
+    k += 1
+    # Get following units, up to the next param
+    visited = list()
+    while True:
+        if k in memo:
+            result = memo[k]
+            break
+        visited.append(k)
+        if _is_value_end(text, k, next_param_memo):
+            result = k
+            break
+        c = text[k]
+        if c in "'\"":
+            k = text.find(c, k + 1)
+            if k < 0:
+                result = None
+                break
+            k += 1
+            continue
+        # Skip to the next string or next possible param
+        m = _value_stop_re.search(text, k + 1)
+        if not m:  # up to the end
+            result = text.endswith("\n") and n - 1 or n
+            break
+        k = m.start()
+    for k in visited:
+        memo[k] = result
+    return result
+
+
+def _scan_params(text):
+    """Return a list of parameters, as _extract_params."""
+    params = list()
+    memo, next_param_memo = dict(), dict()
+    i = 0
+    while True:
+        # Get label, followed by equal sign
+        m = _letter_re.search(text, i)
+        if not m:
+            break
+        i = m.start()
+        m = _param_label_chars_re.match(text, i)
+        if not m:
+            i += 1
+            continue
+        e = _spaces_re.match(text, m.end()).end()
+        if text[e:e + 1] != "=":
+            i = m.end()  # any other label start in this label fails the same way
+            continue
+        w0 = e + 1
+        v0 = _spaces_re.match(text, w0).end()
+        # Get value
+        v1 = _scan_value(text, v0, memo, next_param_memo)
+        if v1 is None and v0 > w0:
+            # Give back spaces to the value, one at a time, as the regex backtracking
+            for v in range(v0 - 1, w0 - 1, -1):
+                if _is_value_end(text, v + 1, next_param_memo):
+                    v0, v1 = v, v + 1
+                    break
+        if v1 is None:
+            i = m.end()  # any other label start in this label fails the same way
+            continue
+        params.append((m.group(), text[v0:v1]))
+        i = v1
+    return params
+
+
+# FDS values are parsed by a dedicated parser, never by eval().
+# Values are lists of items, separated by commas or spaces:
+# logicals (T, .TRUE., F, .FALSE.), strings ('abc' or "abc", where a doubled
+# quote is a quote char, as in Fortran: 'it''s' is it's), integers,
+# floats (also with Fortran exponents, eg. 1.D-3), and repeat counts (eg. 3*0.).
+# A single item is returned as a Py value, numeric arrays (eg. GEOM VERTS)
+# are bulk decoded into compact arrays, the other arrays into tuples.
+
+_item_re = re.compile(r"""(?:[0-9]+\*)?(?:'(?:[^']|'')*'|"(?:[^"]|"")*"|[^,\s'"]+)""")
+_fortran_exponents = str.maketrans("Dd", "Ee")
+_trues = "T", ".T.", "TRUE", ".TRUE."
+_falses = "F", ".F.", "FALSE", ".FALSE."
+
+
+def _eval_item(item):
+    """Eval a single value item to the corresponding Py value."""
+    quote = item[0]
+    if quote in "'\"":
+        return item[1:-1].replace(quote * 2, quote)
+    upper = item.upper()
+    if upper in _trues:
         return True
-    elif text.upper() in ('F', '.FALSE.'):
+    if upper in _falses:
         return False
+    try:
+        return int(item)
+    except ValueError:
+        return float(item.translate(_fortran_exponents))
+
+
+def _eval_items(items):
+    """Eval value items, with repeat counts, to the corresponding Py value."""
+    values = list()
+    for item in items:
+        count, sep, value = item.partition("*")
+        if sep and count.isdigit():
+            values.extend((_eval_item(value),) * int(count))
+        else:
+            values.append(_eval_item(item))
+    if len(values) == 1:
+        return values[0]
+    if all(type(value) is int for value in values):
+        return array("q", values)
+    if all(type(value) in (int, float) for value in values):
+        return array("d", values)
+    return tuple(values)
+
+
+def _eval_param(text):
+    """Eval text to the corresponding Py value."""
+    if "'" in text or '"' in text:
+        # Remove newlines from strings
+        text = ' '.join(text.splitlines())
+        items = _item_re.findall(text)
     else:
-        return eval(text)
+        items = _item_re.findall(text.translate(_fortran_exponents))
+        # Bulk decode numeric arrays
+        if len(items) > 1:
+            try:
+                return array("q", map(int, items))
+            except (ValueError, OverflowError):
+                pass
+            try:
+                return array("d", map(float, items))
+            except ValueError:
+                pass
+    if not items:
+        raise ValueError("Empty value")
+    return _eval_items(items)
+
+
+def tokenize_namelist(nl):
+    """Tokenize a namelist from scan_namelists."""
+    # nl = (original nl, nl label, nl params)
+    # token = ("fds_label", {label: (value, fds_value), ...}, "original namelist")
+    params = dict()
+    for par in _scan_params(nl[2]):
+        # pars = ((par label, fds value), ...)
+        try:
+            params[par[0]] = (_eval_param(par[1]), par[1])
+        except Exception as err:
+            raise BFException(
+                sender = None,
+                msg = 'Cannot evaluate parameter:\n{0[0]}={0[1]}'.format(par),
+            )
+    return nl[1], params, nl[0]
 
 
 def tokenize(text):
@@ -64,21 +321,71 @@ def tokenize(text):
     # tokens = (
     #    "fds_label",
     #       {label: (value, fds_value), ...}, "original namelist"), ... }, ...)
-    tokens = list()
-    for nl in _extract_namelists(text):
-        # nls = ((original nl, nl label, nl params), ...)
-        params = dict()
-        for par in _extract_params(nl[2]):
-            # pars = ((par label, fds value), ...)
-            try:
-                params[par[0]] = (_eval_param(par[1]), par[1])
-            except Exception as err:
-                raise BFException(
-                    sender = None,
-                    msg = 'Cannot evaluate parameter:\n{0[0]}={0[1]}'.format(par),
-                )
-        tokens.append((nl[1], params, nl[0]))
-    return tokens
+    return [tokenize_namelist(nl) for nl in scan_namelists(text)]
+
+
+# Large FDS files are not read at once: the file is memory mapped,
+# namelists are found by scanning its bytes, and decoded one at a time.
+# Namelist delimiters are ASCII chars, that are the same bytes in all
+# the accepted encodings, and are never part of multibyte utf8 chars.
+
+_nl_start_bytes_re = re.compile(rb"[\r\n]&")
+_label_bytes_re = re.compile(rb"[a-zA-Z][a-zA-Z0-9_]+[,\s]")
+_nl_chars_bytes_re = re.compile(rb"[^'\"&/]*")
+
+encodings = "utf8", "windows-1252"  # tested in this order
+sample_size = 65536  # bytes
+
+
+def detect_encoding(sample):
+    """Detect the encoding of a leading sample of bytes."""
+    for encoding in encodings:
+        try:
+            codecs.getincrementaldecoder(encoding)().decode(sample, final=False)
+        except UnicodeDecodeError:
+            continue
+        return encoding
+    return encodings[0]  # decoded with replacements
+
+
+def _iter_namelist_spans(data):
+    """Yield (start, end) byte offsets of namelists in data, as scan_namelists."""
+    memo = dict()
+    i = 0
+    while True:
+        # Find next ampersand after newline
+        if not (i == 0 and data[:1] == b"&"):
+            m = _nl_start_bytes_re.search(data, max(i - 1, 0))
+            if not m:
+                break
+            i = m.start() + 1
+        # Get label and separators, then params up to the closing slash
+        m = _label_bytes_re.match(data, i + 1)
+        k = m and _scan_nl_params(data, m.end(), memo, _nl_chars_bytes_re, b"/", b"&")
+        if k is None:
+            i += 1
+            continue
+        yield i, k + 1
+        memo.clear()  # never scanned again
+        i = k + 1
+
+
+def iter_namelists(filepath):
+    """Yield (byte offset, namelist) from an fds file, namelists as scan_namelists."""
+    with open(filepath, "rb") as f:
+        try:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # empty file
+            return
+        try:
+            encoding = detect_encoding(data[:sample_size])
+            for start, end in _iter_namelist_spans(data):
+                text = data[start:end].decode(encoding, "replace")
+                text = text.replace("\r\n", "\n").replace("\r", "\n")  # universal newlines
+                for nl in scan_namelists(text):
+                    yield start, nl
+        finally:
+            data.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,204 @@
+"""BlenderFDS, in-memory geometry cache."""
+
+import bpy
+from collections import OrderedDict
+
+DEBUG = False
+
+# Calculated geometries are cached in memory, not in Blender ID properties,
+# so they do not bloat the saved file and the undo stack.
+# Each entry is keyed by object name and geometry kind,
+# and checked against the object pointer, that changes when the object
+# is replaced by another one with the same name.
+# The least recently used entries are evicted, when over the memory budget.
+# An entry can also carry a content signature (eg. the hash of the material
+# slots and of the settings), checked when the entry is read: changes that
+# do not update the object are caught too. It signs only cheap inputs,
+# the changes of the object and of its mesh are left to the handler.
+
+kinds = "xbs", "xyzs", "pbs", "geom"
+
+default_max_size = 256  # MB
+
+class GeometryCache():
+    """Bounded LRU cache of calculated object geometries."""
+
+    def __init__(self):
+        self._entries = OrderedDict()  # (name, kind): (pointer, size, value, signature)
+        self._dependencies = dict()  # name: ((collection, id name), ...)
+        self._dependents = {"objects": dict(), "meshes": dict()}  # collection: {id name: {name, ...}}
+        self.size = 0  # bytes
+        self.invalidations = 0  # counter of invalidated entries
+        self.updates = 0  # counter of checks for updated objects
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def max_size(self) -> "int":
+        """Get memory budget in bytes, from user preferences."""
+        try:
+            max_size = bpy.context.user_preferences.addons["zzz_blenderfds"].preferences.bf_pref_cache_size
+        except (AttributeError, KeyError):
+            max_size = default_max_size
+        return max_size * 1048576
+
+    def get(self, ob, kind, signature=None) -> "value or None":
+        """Get cached geometry of ob, or None."""
+        key = ob.name, kind
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] != ob.as_pointer():  # another object, with the same name
+            self._pop(key)
+            return None
+        if entry[3] != signature:  # changed content
+            self.invalidations += self._pop(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry[2]
+
+    def set(self, ob, kind, value, signature=None) -> "None":
+        """Cache geometry of ob, and evict least recently used geometries."""
+        key = ob.name, kind
+        self._pop(key)
+        size = _get_size(value)
+        self._entries[key] = ob.as_pointer(), size, value, signature
+        self.size += size
+        self._remove_dependencies(ob.name)
+        self._add_dependencies(ob.name, _get_dependencies(ob))
+        max_size = self.max_size
+        while self.size > max_size and len(self._entries) > 1:
+            evicted_key = next(iter(self._entries))
+            DEBUG and print("BFDS: cache.set: evicted:", evicted_key)
+            self._pop(evicted_key)
+
+    def get_dependents(self, collection) -> "{id name: {name, ...}, ...}":
+        """Get the IDs in collection ("objects" or "meshes") that cached geometries depend on,
+        and the names of the dependent objects."""
+        return self._dependents[collection]
+
+    def invalidate(self, name, kinds=kinds) -> "int":
+        """Delete cached geometries of object by name, return their number."""
+        ninvalidated = 0
+        for kind in kinds:
+            ninvalidated += self._pop((name, kind))
+        self.invalidations += ninvalidated
+        return ninvalidated
+
+    def clear(self) -> "None":
+        """Delete all cached geometries."""
+        self._entries.clear()
+        self._dependencies.clear()
+        for dependents in self._dependents.values():
+            dependents.clear()
+        self.size = 0
+
+    def _pop(self, key) -> "int":
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return 0
+        self.size -= entry[1]
+        name = key[0]
+        if not any((name, kind) in self._entries for kind in kinds):
+            self._remove_dependencies(name)
+        return 1
+
+    def _add_dependencies(self, name, dependencies) -> "None":
+        self._dependencies[name] = dependencies
+        for collection, id_name in dependencies:
+            self._dependents[collection].setdefault(id_name, {name}).add(name)
+
+    def _remove_dependencies(self, name) -> "None":
+        for collection, id_name in self._dependencies.pop(name, ()):
+            dependents = self._dependents[collection]
+            dependents[id_name].discard(name)
+            if not dependents[id_name]:
+                del dependents[id_name]
+
+# Cached values are tuples of lists (eg. xbs, or GEOM verts and faces)
+# and a message. Their size is estimated once, when set, from the list
+# lengths and the length of their first item, without walking them.
+
+number_size = 32  # bytes, a Py number and its reference
+
+def _get_size(value) -> "int":
+    """Get approximate memory size of value in bytes, from list lengths."""
+    size = 0
+    for items in value:
+        if isinstance(items, (list, tuple)) and items:
+            item = items[0]
+            nnumbers = isinstance(item, (list, tuple)) and len(item) or 1
+            size += len(items) * nnumbers * number_size
+    return size
+
+# The one and only geometry cache
+
+cache = GeometryCache()
+
+def get(ob, kind, signature=None) -> "value or None":
+    """Get cached geometry of ob, or None."""
+    return cache.get(ob, kind, signature)
+
+def set(ob, kind, value, signature=None) -> "None":
+    """Cache geometry of ob."""
+    cache.set(ob, kind, value, signature)
+
+def invalidate(ob, kinds=kinds) -> "int":
+    """Delete cached geometries of ob, return their number."""
+    return cache.invalidate(ob.name, kinds)
+
+# An object geometry depends on: the object itself (eg. its transform),
+# its mesh data (that can be shared with other objects), and its parents
+# (the geometry is global). The cache keeps the index of these dependencies,
+# so that the updated ones give the dirty set of objects to be invalidated.
+# Blender 2.79 has no list of the updated IDs, only their is_updated flags:
+# so the dirty set is collected by checking the flags of the IDs the cached
+# geometries depend on, once for each ID, and only in the updated collections.
+# Objects without cached geometries are never checked, but each update of
+# a collection still costs O(number of cached IDs), not O(updated IDs).
+
+def _get_dependencies(ob) -> "((collection, id name), ...)":
+    """Get the IDs the geometry of ob depends on."""
+    dependencies = [("objects", ob.name)]
+    if ob.type == "MESH":
+        dependencies.append(("meshes", ob.data.name))
+    parent = ob.parent
+    while parent:
+        dependencies.append(("objects", parent.name))
+        parent = parent.parent
+    return tuple(dependencies)
+
+def get_dirty_names() -> "set":
+    """Get names of objects with cached geometries depending on updated or deleted IDs.
+    Blender 2.79 has no list of updated IDs, so the flags of all the dependencies are checked."""
+    dirty = list()  # of sets of names
+    if bpy.data.objects.is_updated:
+        for id_name, names in cache.get_dependents("objects").items():
+            ob = bpy.data.objects.get(id_name)
+            if ob is None or ob.is_updated or ob.is_updated_data:  # deleted or updated
+                dirty.append(names)
+    if bpy.data.meshes.is_updated:
+        for id_name, names in cache.get_dependents("meshes").items():
+            me = bpy.data.meshes.get(id_name)
+            if me is None or me.is_updated:
+                dirty.append(names)
+    return {name for names in dirty for name in names}
+
+def invalidate_updated() -> "int":
+    """Delete cached geometries of the dirty set of objects, return their number."""
+    cache.updates += 1
+    ninvalidated = 0
+    for name in get_dirty_names():
+        ninvalidated += cache.invalidate(name)
+    return ninvalidated
+
+def clear() -> "None":
+    """Delete all cached geometries."""
+    cache.clear()
+
+def get_info() -> "str":
+    """Get the cache usage message."""
+    return "{} cached geometries, {:.1f} MB, {} invalidated in {} updates".format(
+        len(cache), cache.size / 1048576, cache.invalidations, cache.updates,
+    )
@@ -1,8 +1,8 @@
 """BlenderFDS, algorithms for triangulated surfaces."""
 
-import bpy, bmesh, mathutils
-from time import time
-from math import floor, ceil
+import bpy, mathutils
+import numpy as np
+from collections import OrderedDict
 
 from ..exceptions import BFException
 from . import utils
@@ -17,8 +17,10 @@ def get_trisurface(context, ob) -> "mas, verts, faces":
     assert(ob.type == 'MESH')
     if not ob.data.vertices:
         raise BFException(ob, "Empty object!")
-    # Check original mesh quality
-    check_mesh_quality(context, ob)
+    # Check original mesh quality, or the welded one later if requested
+    weld = ob.bf_geom_weld_vertices
+    if not weld:
+        check_mesh_quality(context, ob)
     # Create new object global copy
     ob_tmp = utils.object_get_global_copy(context, ob, suffix='_tri_tmp')
     # Create triangulate modifier
@@ -45,161 +47,275 @@ def get_trisurface(context, ob) -> "mas, verts, faces":
             bpy.data.objects.remove(ob_tmp, True)
             raise BFException(ob, "Referenced SURF ID='{}' is not exported.".format(ma.name))
         mas.append(ma.name)
-    # Get ob verts and faces
-    bm = bmesh.new()
-    bm.from_mesh(ob_tmp.data)
-    verts = [(v.co.x, v.co.y, v.co.z) for v in bm.verts]
-    faces = [(
-            f.verts[0].index+1, # FDS index start from 1, not 0
-            f.verts[1].index+1,
-            f.verts[2].index+1,
-            f.material_index+1,
-    ) for f in bm.faces]
+    # Get ob verts and faces, all triangles
+    me = ob_tmp.data
+    verts = np.empty(len(me.vertices) * 3, dtype=np.float32)
+    me.vertices.foreach_get("co", verts)
+    verts = verts.reshape((-1, 3)).astype(np.float64)
+    faces = np.empty((len(me.polygons), 4), dtype=np.int64)
+    tris = np.empty(len(me.loops), dtype=np.int32)
+    me.loops.foreach_get("vertex_index", tris)
+    faces[:, :3] = tris.reshape((-1, 3))
+    imats = np.empty(len(me.polygons), dtype=np.int32)
+    me.polygons.foreach_get("material_index", imats)
+    faces[:, 3] = imats
     # Clean up
-    bm.free()
     bpy.data.objects.remove(ob_tmp, True)
-    return mas, verts, faces
+    # Weld duplicate vertices, then check welded mesh quality
+    if weld:
+        nverts = len(verts)
+        verts, faces = weld_vertices(verts, faces, context.scene.bf_config_min_edge_length)
+        DEBUG and print("BFDS: get_trisurface: welded {} vertices".format(nverts - len(verts)))
+        check_tris_quality(ob, verts, faces, context.scene.bf_config_min_edge_length, context.scene.bf_config_min_face_area)
+    faces += 1  # FDS index start from 1, not 0
+    return mas, list(map(tuple, verts.tolist())), list(map(tuple, faces.tolist()))
 
-def check_mesh_quality(context, ob):
+# The mesh quality is checked on arrays pulled from the mesh once.
+# All the categories are evaluated in one sweep, and reported together
+# with the indices of their bad elements, so they can be fixed at once.
+
+quality_checks = (  # category, element type, message
+    ("non_manifold_edges", "EDGE", "Non manifold or open geometry"),
+    ("non_manifold_verts", "VERT", "Non manifold vertices"),
+    ("non_contiguous_edges", "EDGE", "Inconsistent face normals"),
+    ("short_edges", "EDGE", "Too short edges"),
+    ("small_faces", "FACE", "Too small area faces"),
+    ("loose_verts", "VERT", "Loose vertices"),
+    ("duplicate_verts", "VERT", "Duplicate vertices"),
+)
+
+def get_mesh_quality_arrays(me) -> "dict":
+    """Get the mesh arrays needed by the mesh quality check."""
+    arrays = dict()
+    for name, collection, attr, dtype, size in (
+            ("verts", me.vertices, "co", np.float32, 3),
+            ("edges", me.edges, "vertices", np.int32, 2),
+            ("loop_verts", me.loops, "vertex_index", np.int32, 1),
+            ("loop_edges", me.loops, "edge_index", np.int32, 1),
+            ("loop_starts", me.polygons, "loop_start", np.int32, 1),
+            ("loop_totals", me.polygons, "loop_total", np.int32, 1),
+            ("areas", me.polygons, "area", np.float32, 1),
+        ):
+        data = np.empty(len(collection) * size, dtype=dtype)
+        collection.foreach_get(attr, data)
+        arrays[name] = data.reshape((-1, size)) if size > 1 else data
+    arrays["verts"] = arrays["verts"].astype(np.float64)
+    arrays["areas"] = arrays["areas"].astype(np.float64)
+    return arrays
+
+def get_tris_quality_arrays(verts, faces) -> "dict":
+    """Get the mesh arrays needed by the mesh quality check from vertices (n,3) and triangles (n,3+)."""
+    nverts, nfaces = len(verts), len(faces)
+    loop_verts = faces[:, :3].ravel()
+    next_verts = faces[:, (1, 2, 0)].ravel()  # each loop goes along its edge to the next vertex
+    keys = np.minimum(loop_verts, next_verts).astype(np.int64) * nverts + np.maximum(loop_verts, next_verts)
+    keys, loop_edges = np.unique(keys, return_inverse=True)
+    tris = verts[faces[:, :3]]
+    return {
+        "verts": verts,
+        "edges": np.column_stack((keys // nverts, keys % nverts)),
+        "loop_verts": loop_verts,
+        "loop_edges": loop_edges.ravel(),
+        "loop_starts": np.arange(0, 3 * nfaces, 3),
+        "loop_totals": np.full(nfaces, 3, dtype=np.int64),
+        "areas": np.sqrt((np.cross(tris[:, 1] - tris[:, 0], tris[:, 2] - tris[:, 0]) ** 2).sum(axis=1)) / 2.,
+    }
+
+def _get_fans(loop_verts, loop_edges, next_loops, is_manifold) -> "fans for each vertex":
+    """Get the number of face fans around each vertex."""
+    nloops = len(loop_verts)
+    # The corners (loops) of two faces at the same vertex of their common manifold edge are joined
+    corners = np.concatenate((np.arange(nloops), next_loops))
+    edges = np.concatenate((loop_edges, loop_edges))
+    verts = loop_verts[corners]
+    corners, edges, verts = corners[is_manifold[edges]], edges[is_manifold[edges]], verts[is_manifold[edges]]
+    order = np.lexsort((verts, edges))
+    joins_a, joins_b = corners[order[0::2]], corners[order[1::2]]
+    # Label the connected corners with their minimum index
+    labels = _get_labels(nloops, joins_a, joins_b)
+    # Count the different labels around each vertex
+    keys = np.unique(loop_verts.astype(np.int64) * nloops + labels)
+    return np.bincount(keys // nloops, minlength=loop_verts.max() + 1)
+
+def calc_mesh_quality_report(arrays, epsilon_len, epsilon_area, check_duplicates=True) -> "OrderedDict":
+    """Get the mesh quality report of the mesh arrays, with the bad element indices for each category."""
+    verts, edges = arrays["verts"], arrays["edges"]
+    loop_verts, loop_edges = arrays["loop_verts"], arrays["loop_edges"]
+    loop_starts, loop_totals = arrays["loop_starts"], arrays["loop_totals"]
+    nverts, nedges, nloops = len(verts), len(edges), len(loop_verts)
+    report = OrderedDict()
+    # Manifold edges join two faces, no more no less
+    nfaces_of_edges = np.bincount(loop_edges, minlength=nedges)
+    is_manifold = nfaces_of_edges == 2
+    report["non_manifold_edges"] = np.flatnonzero(~is_manifold)
+    # Manifold vertices are only on manifold edges, and have a single fan of faces
+    next_loops = np.arange(1, nloops + 1)
+    next_loops[loop_starts + loop_totals - 1] = loop_starts
+    is_bad_vert = np.zeros(nverts, dtype=bool)
+    is_bad_vert[edges[~is_manifold].ravel()] = True
+    if nloops:
+        fans = _get_fans(loop_verts, loop_edges, next_loops, is_manifold)
+        is_bad_vert[:len(fans)] |= fans > 1
+    report["non_manifold_verts"] = np.flatnonzero(is_bad_vert)
+    # Contiguous normals, adjoining faces go along their common edge in opposite directions
+    order = np.argsort(loop_edges, kind="mergesort")
+    firsts = np.concatenate(([0], np.cumsum(nfaces_of_edges)[:-1]))
+    manifold_edges = np.flatnonzero(is_manifold)
+    loops_a, loops_b = order[firsts[manifold_edges]], order[firsts[manifold_edges] + 1]
+    report["non_contiguous_edges"] = manifold_edges[loop_verts[loops_a] == loop_verts[loops_b]]
+    # Degenerate edges and faces
+    lengths = np.sqrt(((verts[edges[:, 0]] - verts[edges[:, 1]]) ** 2).sum(axis=1))
+    report["short_edges"] = np.flatnonzero(lengths <= epsilon_len)
+    report["small_faces"] = np.flatnonzero(arrays["areas"] <= epsilon_area)
+    # Loose vertices, with no connectivity
+    report["loose_verts"] = np.flatnonzero(np.bincount(edges.ravel(), minlength=nverts) == 0)
+    # Duplicate vertices
+    if check_duplicates:
+        report["duplicate_verts"] = _get_duplicate_verts(verts, epsilon_len)
+    else:
+        report["duplicate_verts"] = np.empty(0, dtype=np.int64)
+    # Inverted normals, the volume enclosed by the faces is negative
+    report["inverted_normals"] = False
+    if nloops and not len(report["non_manifold_edges"]) and not len(report["non_contiguous_edges"]):
+        is_fan = np.ones(nloops, dtype=bool)  # fan triangles of each face, from its first vertex
+        is_fan[loop_starts] = False
+        is_fan[loop_starts + loop_totals - 1] = False
+        fan_loops = np.flatnonzero(is_fan)
+        firsts = np.repeat(loop_starts, loop_totals)[fan_loops]
+        v0, v1, v2 = verts[loop_verts[firsts]], verts[loop_verts[fan_loops]], verts[loop_verts[next_loops[fan_loops]]]
+        report["inverted_normals"] = bool((v0 * np.cross(v1, v2)).sum() < 0.)
+    return report
+
+# Near-coincident vertices are found by grid hashes: the vertices are
+# hashed by their cell in a grid of size 2*epsilon, and only the vertices
+# in the same cell are compared. Two vertices closer than epsilon share
+# a cell in at least one of eight grids, shifted by half a cell along each axis.
+# Hash collisions only add some more comparisons.
+# The vertex clusters are the connected near-coincident pairs.
+
+_grid_shifts = np.array([(i, j, k) for i in (0., .5) for j in (0., .5) for k in (0., .5)])
+
+def _get_cell_hashes(cells) -> "hashes":
+    """Get the int64 hash of each (i, j, k) grid cell."""
+    return (cells[:, 0] * 73856093) ^ (cells[:, 1] * 19349663) ^ (cells[:, 2] * 83492791)
+
+def _get_labels(n, joins_a, joins_b) -> "labels":
+    """Label n elements with the minimum index of their connected elements."""
+    labels = np.arange(n)
+    while True:
+        new_labels = labels.copy()
+        min_labels = np.minimum(labels[joins_a], labels[joins_b])
+        np.minimum.at(new_labels, joins_a, min_labels)
+        np.minimum.at(new_labels, joins_b, min_labels)
+        new_labels = new_labels[new_labels]
+        if np.array_equal(new_labels, labels):
+            return labels
+        labels = new_labels
+
+def get_vert_clusters(verts, epsilon) -> "labels":
+    """Get the cluster of each vertex, labelled by its minimum index; near-coincident vertices share it."""
+    nverts = len(verts)
+    size = 2. * max(epsilon, 1E-12)
+    joins_a, joins_b = list(), list()
+    for shift in _grid_shifts:
+        hashes = _get_cell_hashes(np.floor(verts / size + shift).astype(np.int64))
+        order = np.argsort(hashes)
+        hashes = hashes[order]
+        # Compare each vertex with the following ones in the same cell
+        k, candidates = 1, np.arange(nverts)
+        while True:
+            candidates = candidates[candidates + k < nverts]
+            candidates = candidates[hashes[candidates] == hashes[candidates + k]]
+            if not len(candidates):
+                break
+            a, b = order[candidates], order[candidates + k]
+            is_near = ((verts[a] - verts[b]) ** 2).sum(axis=1) <= epsilon ** 2
+            joins_a.append(a[is_near])
+            joins_b.append(b[is_near])
+            k += 1
+    if not joins_a:
+        return np.arange(nverts)
+    return _get_labels(nverts, np.concatenate(joins_a), np.concatenate(joins_b))
+
+def _get_duplicate_verts(verts, epsilon_len) -> "indices":
+    """Get indices of duplicate vertices."""
+    labels = get_vert_clusters(verts, epsilon_len)
+    return np.flatnonzero(np.bincount(labels, minlength=len(verts))[labels] > 1)
+
+def weld_vertices(verts, faces, epsilon) -> "verts, faces":
+    """Weld near-coincident vertices (n,3), remap faces (n,4) of (i0,i1,i2,imat), remove collapsed faces."""
+    labels = get_vert_clusters(verts, epsilon)
+    is_kept = labels == np.arange(len(verts))  # the first vertex of each cluster
+    new_indices = np.cumsum(is_kept) - 1
+    faces = faces.copy()
+    faces[:, :3] = new_indices[labels[faces[:, :3]]]
+    is_collapsed = (faces[:, 0] == faces[:, 1]) | (faces[:, 1] == faces[:, 2]) | (faces[:, 2] == faces[:, 0])
+    return verts[is_kept], faces[~is_collapsed]
+
+def get_mesh_quality_msgs(report) -> "list":
+    """Get the messages of the bad categories of the mesh quality report."""
+    msgs = list()
+    for category, element, msg in quality_checks:
+        n = len(report[category])
+        if n:
+            msgs.append("{}: {}".format(msg, n))
+    return msgs
+
+def check_mesh_quality(context, ob, check_duplicates=True):
     """Check that Object is a closed orientable manifold,
-    with no degenerate geometry."""
+    with no degenerate geometry (and no duplicate vertices, if requested)."""
     # Init
     DEBUG and print("BFDS: check_mesh_quality")
     bpy.ops.object.mode_set(mode='OBJECT')
-    bm = bmesh.new()
-    bm.from_mesh(ob.data)
-    bm.faces.ensure_lookup_table()  # update bmesh index
-    bm.verts.ensure_lookup_table()  # update bmesh index
-    bm.edges.ensure_lookup_table()  # update bmesh index
-    epsilon_len = context.scene.bf_config_min_edge_length
-    epsilon_area = context.scene.bf_config_min_face_area
-    bad_verts, bad_edges, bad_faces= list(), list(), list()
-    # Check manifold edges, each edge should join two faces, no more no less
-    for edge in bm.edges:
-        if not edge.is_manifold:
-            bad_edges.append(edge)
-    msg = "Non manifold or open geometry detected, bad edges selected."
-    _raise_bad_geometry(context, ob, bm, msg, bad_edges=bad_edges)
-    # Check manifold vertices
-    for vert in bm.verts:
-        if not vert.is_manifold:
-            bad_verts.append(vert)
-    msg = "Non manifold vertices detected, bad vertices selected."
-    _raise_bad_geometry(context, ob, bm, msg, bad_verts=bad_verts)
-    # Check contiguous normals, adjoining faces should have normals
-    # in the same directions
-    for edge in bm.edges:
-        if not edge.is_contiguous:
-            bad_edges.append(edge)
-    msg = "Inconsistent face normals detected, bad edges selected."
-    _raise_bad_geometry(context, ob, bm, msg, bad_edges=bad_edges)
-    # Check no degenerate edges, zero lenght edges
-    for edge in bm.edges:
-        if edge.calc_length() <= epsilon_len:
-            bad_edges.append(edge)
-    msg = "Too short edges detected, bad edges selected."
-    _raise_bad_geometry(context, ob, bm, msg, bad_edges=bad_edges)
-    # Check degenerate faces, zero area faces
-    for face in bm.faces:
-        if face.calc_area() <= epsilon_area:
-            bad_faces.append(face)
-    msg = "Too small area faces detected, bad faces selected."
-    _raise_bad_geometry(context, ob, bm, msg, bad_faces=bad_faces)
-    # Check loose vertices, vertices that have no connectivity
-    for vert in bm.verts:
-        if not bool(vert.link_edges):
-            bad_verts.append(vert)
-    msg = "Loose vertices detected, bad vertices selected."
-    _raise_bad_geometry(context, ob, bm, msg, bad_verts=bad_verts)
-    # Check duplicate vertices
-    _check_duplicate_vertices(context, ob, bm, epsilon_len)
+    report = calc_mesh_quality_report(
+        get_mesh_quality_arrays(ob.data),
+        context.scene.bf_config_min_edge_length,
+        context.scene.bf_config_min_face_area,
+        check_duplicates,
+    )
+    # Report all bad categories at once
+    msgs = get_mesh_quality_msgs(report)
+    if msgs:
+        _select_bad_geometry(context, ob, report)
+        raise BFException(ob, "Bad geometry detected, bad elements selected",
+            [BFException(None, msg) for msg in msgs])
     # Check inverted normals
-    original_normal = bm.faces[0].normal.copy()
-    bmesh.ops.recalc_face_normals(bm, faces=bm.faces)  # recalc outside
-    if original_normal.dot(bm.faces[0].normal) < 0.:  # opposed normals?
+    if report["inverted_normals"]:
         raise BFException(ob, "Face normals are pointing towards the inside, "
             "update needed.")
-    # Close
-    bm.free()
-
-def _check_duplicate_vertices(context, ob, bm, epsilon_len):
-    """Check duplicate vertices."""
-    bad_verts = list()
-    size = len(bm.verts)
-    kd = mathutils.kdtree.KDTree(size)  # create a kd-tree from a mesh
-    for i, vert in enumerate(bm.verts):
-        kd.insert(vert.co, i)
-    kd.balance()
-    for vert in bm.verts:
-        vert_group = list()
-        for (co, i, dist) in kd.find_range(vert.co, epsilon_len):
-            vert_group.append(i)
-        if len(vert_group) > 1:
-            for i in vert_group:
-                bad_verts.append(bm.verts[i])
-    msg = "Duplicate vertices detected, bad vertices selected."
-    _raise_bad_geometry(context, ob, bm, msg, bad_verts=bad_verts)
-
-def check_intersections(obs, context):  # FIXME test and make operator
-    """Check self and mutual intersection of objects."""
-    DEBUG and print("BFDS: check_quality: intersection:", obs)
-    for i, ob in enumerate(obs):
-        # Check self intersection
-        epsilon_len = context.scene.bf_config_min_edge_length
-        tree = mathutils.bvhtree.BVHTree.FromObject(context, ob.scene, epsilon=epsilon_len)
-        _check_intersection(context, ob, tree, epsilon_len, other_ob=ob, other_tree=tree)
-        # Check intersection with others
-        for other_ob in obs[i+1:]:
-            _check_intersection(context, ob, tree, epsilon_len, other_ob, other_tree=None)
-
-def _check_intersection(context, ob, tree, epsilon_len, other_ob, other_tree=None):
-    """Check intersection between ob and other_ob."""
-    DEBUG and print("BFDS: check_quality: intersection:", ob.name, other_ob.name)
-    bad_faces = list()
-    # First check bboxes for intersection (fast)
-    bb0 = [ob.matrix_world * mathutils.Vector(b) for b in ob.bound_box]
-    bb1 = [other_ob.matrix_world * mathutils.Vector(b) for b in other_ob.bound_box]
-    if bb0[6][0] < bb1[0][0] or bb1[6][0] < bb0[0][0] or \
-       bb0[6][1] < bb1[0][1] or bb1[6][1] < bb0[0][1] or \
-       bb0[6][2] < bb1[0][2] or bb1[6][2] < bb0[0][2]:
-        DEBUG and print("BFDS: check_quality: intersection: none (fast): ", ob.name, other_ob.name)
-        return
-    # Then check tree (slow)
-    if not other_tree:
-        other_tree = mathutils.bvhtree.BVHTree.FromObject(
-            other_ob, deform=True, render=True, cage=True, epsilon=epsilon_len)
-    overlap = tree.overlap(other_tree)
-    if overlap:
-        ifaces = {i_pair[0] for i_pair in overlap}  # only from first tree
-        bad_faces = [bm.faces[iface] for iface in ifaces]
-        msg = "Intersection detected, bad faces selected."
-        _raise_bad_geometry(context, ob, bm, msg, bad_faces=bad_faces)
-    DEBUG and print("BFDS: check_quality: intersection: none (slow): ", ob.name, other_ob.name)
-
-def _raise_bad_geometry(context, ob, bm, msg,
-        bad_verts=None, bad_edges=None, bad_faces=None):
-    """Select bad elements, show them, raise BFException."""
-    if not bad_verts and not bad_edges and not bad_faces:
-        return
-    # Deselect faces, edges, verts in bmesh
-    for face in bm.faces:
-        face.select = False
-    for edge in bm.edges:
-        edge.select = False
-    for vert in bm.verts:
-        vert.select = False
-    # Select bad elements
-    if bad_faces:
-        for b in bad_faces:
-            b.select = True
-    if bad_edges:
-        for b in bad_edges:
-            b.select = True
-    if bad_verts:
-        for b in bad_verts:
-            b.select = True
-    bm.to_mesh(ob.data)
-    bm.free()
+
+def check_tris_quality(ob, verts, faces, epsilon_len, epsilon_area):
+    """Check that the triangulated surface of ob (eg. after welding its vertices)
+    is a closed orientable manifold, with no degenerate geometry."""
+    report = calc_mesh_quality_report(get_tris_quality_arrays(verts, faces), epsilon_len, epsilon_area)
+    # The bad elements are not in the object mesh, they cannot be selected
+    msgs = get_mesh_quality_msgs(report)
+    if msgs:
+        raise BFException(ob, "Bad geometry detected after welding vertices",
+            [BFException(None, msg) for msg in msgs])
+    if report["inverted_normals"]:
+        raise BFException(ob, "Face normals are pointing towards the inside, "
+            "update needed.")
+
+def _select_bad_geometry(context, ob, report):
+    """Select bad elements of the mesh quality report, show them in edit mode."""
+    me = ob.data
+    selections = {
+        "VERT": np.zeros(len(me.vertices), dtype=bool),
+        "EDGE": np.zeros(len(me.edges), dtype=bool),
+        "FACE": np.zeros(len(me.polygons), dtype=bool),
+    }
+    for category, element, _ in quality_checks:
+        selections[element][report[category]] = True
+    # Select the vertices of bad edges and faces too, the selection is flushed from vertices
+    edges = np.empty(len(me.edges) * 2, dtype=np.int32)
+    me.edges.foreach_get("vertices", edges)
+    selections["VERT"][edges.reshape((-1, 2))[selections["EDGE"]].ravel()] = True
+    for iface in np.flatnonzero(selections["FACE"]):
+        selections["VERT"][list(me.polygons[iface].vertices)] = True
+    me.vertices.foreach_set("select", selections["VERT"])
+    me.edges.foreach_set("select", selections["EDGE"])
+    me.polygons.foreach_set("select", selections["FACE"])
     # Select object and go to edit mode
     bpy.ops.object.mode_set(mode='OBJECT')
     bpy.ops.object.select_all(action='DESELECT')
@@ -207,4 +323,66 @@ def _raise_bad_geometry(context, ob, bm, msg,
     context.scene.objects.active = ob
     bpy.ops.object.mode_set(mode='EDIT')
     bpy.ops.mesh.select_mode(use_extend=False, use_expand=False, type='VERT')
-    raise BFException(ob, msg)
+
+# Intersections are checked in two phases. The broad phase sorts the global
+# bounding boxes along x and sweeps them, to find the candidate pairs.
+# The narrow phase overlaps the BVH trees of the candidates only,
+# each tree is built once from the global mesh of its object.
+
+def get_bbox_pairs(bboxes, epsilon=0.) -> "[(i, j), ...]":
+    """Get the index pairs of overlapping bounding boxes ((x0,x1,y0,y1,z0,z1,), ...), by sort and sweep."""
+    pairs, active = list(), list()
+    for i in sorted(range(len(bboxes)), key=lambda i: bboxes[i][0]):
+        x0, x1, y0, y1, z0, z1 = bboxes[i]
+        active = [j for j in active if bboxes[j][1] + epsilon >= x0]  # still open along x
+        for j in active:
+            bbox = bboxes[j]
+            if bbox[2] <= y1 + epsilon and y0 <= bbox[3] + epsilon and \
+               bbox[4] <= z1 + epsilon and z0 <= bbox[5] + epsilon:
+                pairs.append((min(i, j), max(i, j)))
+        active.append(i)
+    return sorted(pairs)
+
+# Intersections are checked on the exported mesh, after the modifiers.
+# Its faces are the faces of the object mesh only when the modifiers do not
+# change their number (eg. no Mirror, Array, or Subsurf): Blender 2.79 does not
+# expose the original index of the evaluated faces, so in the other cases
+# the intersecting faces cannot be told, and the whole object is reported.
+
+def _get_global_bvhtree(context, ob, epsilon) -> "BVHTree, bbox, is_original":
+    """Get the BVH tree and the bounding box of ob global mesh,
+    and if its faces are the faces of ob mesh."""
+    me = utils.get_global_mesh(context, ob)
+    verts = np.empty(len(me.vertices) * 3, dtype=np.float32)
+    me.vertices.foreach_get("co", verts)
+    verts = verts.reshape((-1, 3)).astype(np.float64)
+    polygons = [tuple(polygon.vertices) for polygon in me.polygons]
+    bpy.data.meshes.remove(me, do_unlink=True)
+    tree = mathutils.bvhtree.BVHTree.FromPolygons(verts.tolist(), polygons, epsilon=epsilon)
+    bbmin, bbmax = verts.min(axis=0), verts.max(axis=0)
+    is_original = len(polygons) == len(ob.data.polygons)
+    return tree, (bbmin[0], bbmax[0], bbmin[1], bbmax[1], bbmin[2], bbmax[2]), is_original
+
+def check_intersections(context, obs) -> "[(ob, other_ob, faces, other_faces), ...]":
+    """Check self and mutual intersections of objects, get the intersecting faces of each pair.
+    Faces are indices of ob.data.polygons, or None if the modifiers change the faces."""
+    DEBUG and print("BFDS: check_intersections:", len(obs))
+    epsilon_len = context.scene.bf_config_min_edge_length
+    obs = [ob for ob in obs if ob.type == "MESH" and ob.data.polygons]
+    trees, bboxes, are_original = list(), list(), list()
+    for ob in obs:
+        tree, bbox, is_original = _get_global_bvhtree(context, ob, epsilon_len)
+        trees.append(tree)
+        bboxes.append(bbox)
+        are_original.append(is_original)
+    # Self intersections, then mutual intersections of candidate pairs only
+    pairs = [(i, i) for i in range(len(obs))] + get_bbox_pairs(bboxes, epsilon_len)
+    results = list()
+    for i, j in pairs:
+        overlap = trees[i].overlap(trees[j])
+        if overlap:
+            faces = are_original[i] and sorted({i_pair[0] for i_pair in overlap}) or None
+            other_faces = are_original[j] and sorted({i_pair[1] for i_pair in overlap}) or None
+            results.append((obs[i], obs[j], faces, other_faces))
+    DEBUG and print("BFDS: check_intersections: {} candidate pairs, {} intersecting".format(len(pairs), len(results)))
+    return results
@@ -1,8 +1,10 @@
 """BlenderFDS, voxelization algorithms."""
 
 import bpy, bmesh
+import numpy as np
+import multiprocessing
 from time import time
-from math import floor, ceil
+from math import floor, ceil, sqrt
 
 from ..exceptions import BFException
 from . import utils
@@ -21,7 +23,26 @@ def get_voxels(context, ob):
     assert(ob.type == 'MESH')
     if not ob.data.vertices:
         raise BFException(ob, "Empty object!")
-    voxel_size = _get_voxel_size(context, ob)
+    voxel_size = get_voxel_size(context, ob)
+    # Choose voxelization engine, and get boxes
+    if context.scene.bf_config_voxel_engine == "SCANLINE":
+        boxes, origin, timing = _get_boxes_by_scanline(context, ob, voxel_size)
+    else:
+        boxes, origin, timing = _get_boxes_by_remesh(context, ob, voxel_size)
+    # Optimize boxes
+    boxes, nboxes = _optimize_boxes(boxes, ob.bf_xb_optimize_voxels)
+    # Return global coordinates, timing, and number of boxes before optimization
+    xbs = list(_get_box_xbs(boxes, origin, voxel_size))
+    return xbs, voxel_size, timing, nboxes
+
+def _get_boxes_by_remesh(context, ob, voxel_size) -> "boxes, origin, timing":
+    """Get boxes from object, by remesh voxelization."""
+    DEBUG and print("BFDS: calc_voxels._get_boxes_by_remesh")
+    normals, centers = get_remesh_faces(context, ob, voxel_size)
+    return get_boxes_from_faces(normals, centers, voxel_size)
+
+def get_remesh_faces(context, ob, voxel_size) -> "normals, centers":
+    """Get global faces normals and centers of object, after remesh voxelization."""
     # Create new object, and link it
     ob_tmp = utils.object_get_global_copy(context, ob, suffix='_vox_tmp')
     # Align voxels to global origin
@@ -41,20 +62,32 @@ def get_voxels(context, ob):
         calc_undeformed=False,
     )
     ob_tmp.modifiers.remove(mo)
-    # Get faces and sort them according to normals
+    # Get faces, and clean up
+    normals, centers = utils.get_tessfaces_normals_centers(ob_tmp.data)
+    bpy.data.objects.remove(ob_tmp, do_unlink=True)
+    return normals, centers
+
+def get_voxels_from_faces(normals, centers, voxel_size, optimize=False) -> "xbs, timing, nboxes":
+    """Get voxels in xbs format from remeshed faces normals and centers.
+    No bpy access, can run in another process. Raise ValueError if abnormal."""
+    boxes, origin, timing = get_boxes_from_faces(normals, centers, voxel_size)
+    boxes, nboxes = _optimize_boxes(boxes, optimize)
+    return list(_get_box_xbs(boxes, origin, voxel_size)), timing, nboxes
+
+def get_boxes_from_faces(normals, centers, voxel_size) -> "boxes, origin, timing":
+    """Get boxes from remeshed faces normals and centers.
+    No bpy access, can run in another process. Raise ValueError if abnormal."""
+    # Sort faces according to normals
     t1 = time()
-    faces = ob_tmp.data.tessfaces
-    x_faces, y_faces, z_faces = list(), list(), list()
-    for face in faces:
-        normal = face.normal
-        if   abs(normal[0]) > .9:
-            x_faces.append(face)  # face is normal to x axis
-        elif abs(normal[1]) > .9:
-            y_faces.append(face)  # ... to y axis
-        elif abs(normal[2]) > .9:
-            z_faces.append(face)  # ... to z axis
-        else:
-            raise ValueError("BFDS: abnormal face")
+    if not len(centers):
+        return list(), (0., 0., 0.), (0., 0., 0., 0.)
+    normals = np.abs(normals)
+    is_x_face = normals[:, 0] > .9  # face is normal to x axis
+    is_y_face = ~is_x_face & (normals[:, 1] > .9)  # ... to y axis
+    is_z_face = ~is_x_face & ~is_y_face & (normals[:, 2] > .9)  # ... to z axis
+    if not np.all(is_x_face | is_y_face | is_z_face):
+        raise ValueError("BFDS: abnormal face")
+    x_faces, y_faces, z_faces = centers[is_x_face], centers[is_y_face], centers[is_z_face]
     # Choose shorter list of faces, relative functions, and parameters
     t2 = time()
     choices = [
@@ -77,12 +110,9 @@ def get_voxels(context, ob):
     boxes = grow_boxes_along_first_axis(boxes, first_sort_by)
     t5 = time()
     boxes = grow_boxes_along_second_axis(boxes, second_sort_by)
-    # Clean up
     t6 = time()
-    bpy.data.objects.remove(ob_tmp, do_unlink=True)
-    xbs = list(_get_box_xbs(boxes, origin, voxel_size))
     # Return with timing: sort, 1b, 2g, 3g
-    return xbs, voxel_size, (t2-t1, t4-t3, t5-t4, t6-t5)
+    return boxes, origin, (t2-t1, t4-t3, t5-t4, t6-t5)
 
 # When appling a remesh modifier to a Blender Object in BLOCK mode,
 # the object max dimension is scaled up and divided in
@@ -103,10 +133,10 @@ def _init_remesh_mod(context, ob, voxel_size) -> "octree_depth, scale":
         if 0.010 < scale < 0.990:
             break
         if octree_depth > 9:
-            raise BFException(ob, "Object too large for its voxel size, split in parts.")
+            raise BFException(ob, "Object too large for its voxel size, split in parts or use scanline voxelization.")
     return octree_depth, scale
 
-def _get_voxel_size(context, ob) -> "voxel_size":
+def get_voxel_size(context, ob) -> "voxel_size":
     """Get voxel_size for object."""
     if ob.bf_xb_custom_voxel:
         return ob.bf_xb_voxel_size
@@ -183,101 +213,71 @@ def _align_remesh_to_global_origin(context, ob, voxel_size):
 #  0 +-F-+=x=+---+->
 #    0   1 A 2   3 x
 
-def _get_boxes_along_x(faces, voxel_size) -> "boxes, origin":
-    """Get minimal boxes from faces by raytracing along x axis."""
+def _get_boxes_along_x(centers, voxel_size) -> "boxes, origin":
+    """Get minimal boxes from face centers by raytracing along x axis."""
     DEBUG and print("BFDS: _get_boxes_along_x")
     # First face center becomes origin of the integer grid for faces
-    f_origin = tuple(faces[0].center)
+    f_origin = tuple(float(coo) for coo in centers[0])
     hvs = voxel_size / 2.
     origin = (f_origin[0], f_origin[1]-hvs, f_origin[2]-hvs)
-    # Get integer coordinates of faces and
-    # classify faces in integer piles along z
-    # piles = {(3,4):(3,4,15,25,), (3,5):(3,4,15,25), ...}
-    piles = dict()
-    for face in faces:
-        center = face.center
-        ix, iy, iz = (
-            round((center[0]-f_origin[0]) / voxel_size),
-            round((center[1]-f_origin[1]) / voxel_size),
-            round((center[2]-f_origin[2]) / voxel_size),
-        )
-        try:
-            piles[(iy, iz)].append(ix)
-        except KeyError:
-            piles[(iy, iz)] = [ix,]
     # Create boxes by raytracing piles along axis
     # boxes = [[ix0, ix1, iy0, iy1, iz0, iz1], ...]
-    boxes = list()
-    for (iy, iz), ixs in piles.items():
-        ixs.sort()  # sort in +x direction
-        while ixs:
-            ix1, ix0 = ixs.pop(), ixs.pop()  # pop solid volumes from top to bottom
-            boxes.append([ix0, ix1, iy, iy+1, iz, iz+1,])
-    return boxes, origin
-
-def _get_boxes_along_y(faces, voxel_size) -> "boxes, origin":
-    """Get minimal boxes from faces by raytracing along y axis."""
+    ixs, iys, izs = _get_piles(centers, f_origin, voxel_size, axis=0)
+    boxes = np.column_stack((ixs[1::2], ixs[0::2], iys[0::2], iys[0::2]+1, izs[0::2], izs[0::2]+1))
+    return boxes.tolist(), origin
+
+def _get_boxes_along_y(centers, voxel_size) -> "boxes, origin":
+    """Get minimal boxes from face centers by raytracing along y axis."""
     DEBUG and print("BFDS: _get_boxes_along_y")
     # First face center becomes origin of the integer grid for faces
-    f_origin = tuple(faces[0].center)
+    f_origin = tuple(float(coo) for coo in centers[0])
     hvs = voxel_size / 2.
     origin = (f_origin[0]-hvs, f_origin[1], f_origin[2]-hvs)
-    # Get integer coordinates of faces and
-    # classify faces in integer piles along z
-    # piles = {(3,4):(3,4,15,25,), (3,5):(3,4,15,25), ...}
-    piles = dict()
-    for face in faces:
-        center = face.center
-        ix, iy, iz = (
-            round((center[0]-f_origin[0]) / voxel_size),
-            round((center[1]-f_origin[1]) / voxel_size),
-            round((center[2]-f_origin[2]) / voxel_size),
-        )
-        try:
-            piles[(iz, ix)].append(iy)
-        except KeyError:
-            piles[(iz, ix)] = [iy,]
     # Create boxes by raytracing piles along axis
     # boxes = [[ix0, ix1, iy0, iy1, iz0, iz1], ...]
-    boxes = list()
-    for (iz, ix), iys in piles.items():
-        iys.sort()  # sort in +y direction
-        while iys:
-            iy1, iy0 = iys.pop(), iys.pop()  # pop solid volumes from top to bottom
-            boxes.append([ix, ix+1, iy0, iy1, iz, iz+1,])
-    return boxes, origin
-
-def _get_boxes_along_z(faces, voxel_size) -> "boxes, origin":
-    """Get minimal boxes from faces by raytracing along z axis."""
+    ixs, iys, izs = _get_piles(centers, f_origin, voxel_size, axis=1)
+    boxes = np.column_stack((ixs[0::2], ixs[0::2]+1, iys[1::2], iys[0::2], izs[0::2], izs[0::2]+1))
+    return boxes.tolist(), origin
+
+def _get_boxes_along_z(centers, voxel_size) -> "boxes, origin":
+    """Get minimal boxes from face centers by raytracing along z axis."""
     DEBUG and print("BFDS: _get_boxes_along_z")
     # First face center becomes origin of the integer grid for faces
-    f_origin = tuple(faces[0].center)
+    f_origin = tuple(float(coo) for coo in centers[0])
     hvs = voxel_size / 2.
     origin = (f_origin[0]-hvs, f_origin[1]-hvs, f_origin[2])
-    # Get integer coordinates of faces and
-    # classify faces in integer piles along z
-    # piles = {(3,4):(3,4,15,25,), (3,5):(3,4,15,25), ...}
-    piles = dict()
-    for face in faces:
-        center = face.center
-        ix, iy, iz = (
-            round((center[0]-f_origin[0]) / voxel_size),
-            round((center[1]-f_origin[1]) / voxel_size),
-            round((center[2]-f_origin[2]) / voxel_size),
-        )
-        try:
-            piles[(ix, iy)].append(iz)
-        except KeyError:
-            piles[(ix, iy)] = [iz,]
     # Create boxes by raytracing piles along axis
     # boxes = [[ix0, ix1, iy0, iy1, iz0, iz1], ...]
-    boxes = list()
-    for (ix, iy), izs in piles.items():
-        izs.sort()  # sort in +z direction
-        while izs:
-            iz1, iz0 = izs.pop(), izs.pop()  # pop solid volumes from top to bottom
-            boxes.append([ix, ix+1, iy, iy+1, iz0, iz1,])
-    return boxes, origin
+    ixs, iys, izs = _get_piles(centers, f_origin, voxel_size, axis=2)
+    boxes = np.column_stack((ixs[0::2], ixs[0::2]+1, iys[0::2], iys[0::2]+1, izs[1::2], izs[0::2]))
+    return boxes.tolist(), origin
+
+# The next function transforms face centers into integer coordinates,
+# and classifies them in integer piles along axis, as a dict would do:
+# piles = {(3,4):(25,15,4,3), (3,5):(25,15,4,3), ...}
+# Piles are kept in order of first appearance, each one sorted from top
+# to bottom, and then concatenated. So each couple of consecutive
+# coordinates (i1, i0) is a solid volume, popped from top to bottom.
+
+def _get_piles(centers, f_origin, voxel_size, axis) -> "ixs, iys, izs":
+    """Get integer coordinates of face centers, sorted in piles along axis."""
+    icenters = np.round((centers - f_origin) / voxel_size).astype(np.int64)
+    # Get an unique integer key for each pile
+    ias, ibs = icenters[:, (axis+1) % 3], icenters[:, (axis+2) % 3]
+    ia_min, ib_min = ias.min(), ibs.min()
+    keys = (ias - ia_min) * (ibs.max() - ib_min + 1) + (ibs - ib_min)
+    # Rank piles by first appearance
+    ukeys, first_indexes, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    ranks = np.empty(len(ukeys), dtype=np.int64)
+    ranks[np.argsort(first_indexes)] = np.arange(len(ukeys))
+    pile_ranks = ranks[inverse]
+    # If solid is manifold, each pile has an even number of faces
+    if np.any(np.bincount(pile_ranks) % 2):
+        raise ValueError("BFDS: odd pile of faces")
+    # Sort by pile, then from top to bottom
+    order = np.lexsort((-icenters[:, axis], pile_ranks))
+    icenters = icenters[order]
+    return icenters[:, 0], icenters[:, 1], icenters[:, 2]
 
 # The following functions reduce the number of boxes in xbs format,
 # used to describe the geometry, by merging them
@@ -348,6 +348,278 @@ def _grow_boxes_along_z(boxes, sort_by):
     boxes_grown.append(box)
     return boxes_grown
 
+# Scanline voxelization does not need the remesh modifier:
+# the global triangulated mesh is rasterized directly on the integer grid,
+# by casting rays through voxel centers and counting mesh crossings.
+# Each couple of crossings along a ray (ray-parity) is a solid span.
+# Grid units are: u = (global - origin) / voxel_size - .5,
+# so voxel centers have integer coordinates. Boxes share the same
+# integer coordinates (ix0, ix1, iy0, iy1, iz0, iz1) of remesh voxelization.
+
+def _get_boxes_by_scanline(context, ob, voxel_size) -> "boxes, origin, timing":
+    """Get boxes from object, by scanline rasterization."""
+    DEBUG and print("BFDS: calc_voxels._get_boxes_by_scanline")
+    # Get triangles in global coordinates
+    t1 = time()
+    tris = utils.get_global_triangles(context, ob)
+    dt = time() - t1
+    try:
+        boxes, origin, timing = get_boxes_from_triangles(
+            tris, voxel_size, ob.bf_xb_center_voxels, context.scene.bf_config_processes,
+        )
+    except ValueError:
+        raise BFException(ob, "Object is not closed, cannot voxelize.")
+    return boxes, origin, (timing[0] + dt,) + timing[1:]
+
+def get_voxels_from_triangles(tris, voxel_size, center_voxels=False, optimize=False, processes=1) -> "xbs, timing, nboxes":
+    """Get voxels in xbs format from global triangles, by scanline rasterization.
+    No bpy access, can run in another process. Raise ValueError if not closed."""
+    boxes, origin, timing = get_boxes_from_triangles(tris, voxel_size, center_voxels, processes)
+    boxes, nboxes = _optimize_boxes(boxes, optimize)
+    return list(_get_box_xbs(boxes, origin, voxel_size)), timing, nboxes
+
+def get_boxes_from_triangles(tris, voxel_size, center_voxels=False, processes=1) -> "boxes, origin, timing":
+    """Get boxes from global triangles, by scanline rasterization.
+    No bpy access, can run in another process. Raise ValueError if not closed."""
+    t1 = time()
+    if not len(tris):
+        return list(), (0., 0., 0.), (0., 0., 0., 0.)
+    # Init grid origin, and cast rays along the largest dimension (less rays)
+    origin = _get_scanline_origin(tris, voxel_size, center_voxels)
+    dimensions = tris.max(axis=(0, 1)) - tris.min(axis=(0, 1))
+    axis = int(np.argmax(dimensions))
+    b_axis, c_axis = (axis+1) % 3, (axis+2) % 3
+    grow_boxes = _grow_boxes_along_x, _grow_boxes_along_y, _grow_boxes_along_z
+    # Raytrace spans
+    t2 = time()
+    if processes > 1:
+        boxes = _get_scanline_boxes_in_tiles(tris, origin, voxel_size, axis, processes)
+    else:
+        boxes = _get_scanline_boxes(tris, origin, voxel_size, axis)
+    if not len(boxes):
+        return list(), origin.tolist(), (t2-t1, time()-t2, 0., 0.)
+    boxes = boxes.tolist()
+    # Join boxes along other axis and return their global coordinates
+    t3 = time()
+    boxes = grow_boxes[b_axis](boxes, c_axis*2)
+    t4 = time()
+    boxes = grow_boxes[c_axis](boxes, b_axis*2)
+    t5 = time()
+    # Return with timing: tris, 1b, 2g, 3g
+    return boxes, origin.tolist(), (t2-t1, t3-t2, t4-t3, t5-t4)
+
+def _get_scanline_origin(tris, voxel_size, center_voxels) -> "origin":
+    """Get scanline grid origin, aligned to global origin or centered to bbox."""
+    if not center_voxels:
+        return np.zeros(3)
+    pmin, pmax = tris.min(axis=(0, 1)), tris.max(axis=(0, 1))
+    nvoxels = np.maximum(np.ceil((pmax - pmin) / voxel_size), 1.)
+    return (pmin + pmax) / 2. - nvoxels * voxel_size / 2.
+
+def _get_scanline_boxes(tris, origin, voxel_size, axis, tile=None, chunk=1<<21) -> "boxes":
+    """Get boxes by raytracing triangles along axis through voxel centers.
+    If tile = (ib0, ib1, ic0, ic1) is set, cast only rays in tile (inclusive)."""
+    DEBUG and print("BFDS: _get_scanline_boxes")
+    b, c = (axis+1) % 3, (axis+2) % 3
+    # Transform to grid units
+    tris = (tris - origin) / voxel_size - .5
+    # Drop triangles parallel to rays, and orient the others counterclockwise
+    areas = (tris[:, 1, b] - tris[:, 0, b]) * (tris[:, 2, c] - tris[:, 0, c]) - \
+            (tris[:, 1, c] - tris[:, 0, c]) * (tris[:, 2, b] - tris[:, 0, b])
+    tris, areas = tris[areas != 0.], areas[areas != 0.]
+    tris[areas < 0.] = tris[areas < 0.][:, (0, 2, 1)]
+    # Get the rectangle of candidate ray positions for each triangle
+    ib0 = np.ceil(tris[:, :, b].min(axis=1)).astype(np.int64)
+    ib1 = np.floor(tris[:, :, b].max(axis=1)).astype(np.int64)
+    ic0 = np.ceil(tris[:, :, c].min(axis=1)).astype(np.int64)
+    ic1 = np.floor(tris[:, :, c].max(axis=1)).astype(np.int64)
+    if tile:
+        ib0, ib1 = np.maximum(ib0, tile[0]), np.minimum(ib1, tile[1])
+        ic0, ic1 = np.maximum(ic0, tile[2]), np.minimum(ic1, tile[3])
+    ncs = np.maximum(ic1 - ic0 + 1, 0)
+    counts = np.maximum(ib1 - ib0 + 1, 0) * ncs
+    # Test candidates, in chunks of triangles to limit memory use
+    cumcounts = np.cumsum(counts)
+    ibs, ics, ias = list(), list(), list()
+    i0 = 0
+    while i0 < len(tris):
+        done = i0 and cumcounts[i0-1] or 0
+        i1 = max(i0 + 1, int(np.searchsorted(cumcounts, done + chunk, side="right")))
+        ccounts = counts[i0:i1]
+        itris = np.repeat(np.arange(i0, i1), ccounts)
+        locals_ = np.arange(len(itris)) - np.repeat(np.cumsum(ccounts) - ccounts, ccounts)
+        pbs = (ib0[itris] + locals_ // ncs[itris]).astype(np.float64)
+        pcs = (ic0[itris] + locals_ % ncs[itris]).astype(np.float64)
+        ctris = tris[itris]
+        w0, in0 = _edge_test(ctris[:, 1], ctris[:, 2], pbs, pcs, b, c)
+        w1, in1 = _edge_test(ctris[:, 2], ctris[:, 0], pbs, pcs, b, c)
+        w2, in2 = _edge_test(ctris[:, 0], ctris[:, 1], pbs, pcs, b, c)
+        inside = in0 & in1 & in2
+        w0, w1, w2, ctris = w0[inside], w1[inside], w2[inside], ctris[inside]
+        ibs.append(pbs[inside].astype(np.int64))
+        ics.append(pcs[inside].astype(np.int64))
+        ias.append((w0 * ctris[:, 0, axis] + w1 * ctris[:, 1, axis] + \
+            w2 * ctris[:, 2, axis]) / (w0 + w1 + w2))
+        i0 = i1
+    ibs, ics, ias = np.concatenate(ibs), np.concatenate(ics), np.concatenate(ias)
+    if not len(ias):
+        return np.empty((0, 6), dtype=np.int64)
+    # Sort crossings by ray, then along ray
+    ib_min, ic_min = ibs.min(), ics.min()
+    nc = ics.max() - ic_min + 1
+    keys = (ibs - ib_min) * nc + (ics - ic_min)
+    order = np.lexsort((ias, keys))
+    keys, ias = keys[order], ias[order]
+    # If solid is closed, each ray crosses it an even number of times
+    if np.any(np.unique(keys, return_counts=True)[1] % 2):
+        raise ValueError("BFDS: odd number of crossings")
+    # Get spans of voxels whose center is in solid, drop empty ones
+    keys = keys[0::2]
+    ia0s, ia1s = np.ceil(ias[0::2]).astype(np.int64), np.ceil(ias[1::2]).astype(np.int64)
+    is_span = ia1s > ia0s
+    keys, ia0s, ia1s = keys[is_span], ia0s[is_span], ia1s[is_span]
+    # Join touching spans along the same ray
+    is_start = np.ones(len(keys), dtype=bool)
+    is_start[1:] = (keys[1:] != keys[:-1]) | (ia0s[1:] != ia1s[:-1])
+    is_end = np.ones(len(keys), dtype=bool)
+    is_end[:-1] = is_start[1:]
+    keys, ia0s, ia1s = keys[is_start], ia0s[is_start], ia1s[is_end]
+    # Build boxes
+    ibs, ics = keys // nc + ib_min, keys % nc + ic_min
+    boxes = np.empty((len(keys), 6), dtype=np.int64)
+    boxes[:, axis*2], boxes[:, axis*2+1] = ia0s, ia1s
+    boxes[:, b*2], boxes[:, b*2+1] = ibs, ibs + 1
+    boxes[:, c*2], boxes[:, c*2+1] = ics, ics + 1
+    return boxes
+
+# Large objects are voxelized in parallel: the plane perpendicular to rays
+# is cut in voxel-aligned tiles, and each process casts the rays of a tile.
+# Each ray belongs to one tile only, so the joined spans are the same of a
+# single pass, and the following merging steps are run on the whole object.
+
+def _get_scanline_boxes_in_tiles(tris, origin, voxel_size, axis, processes) -> "boxes":
+    """Get boxes by raytracing triangles along axis, in tiles, by a process pool."""
+    DEBUG and print("BFDS: _get_scanline_boxes_in_tiles")
+    try:
+        mp_context = multiprocessing.get_context("fork")
+    except ValueError:  # fork not available, eg. on Windows
+        return _get_scanline_boxes(tris, origin, voxel_size, axis)
+    b, c = (axis+1) % 3, (axis+2) % 3
+    # Get triangle extents in grid units, and the extent of all rays
+    tris_bc = (tris[:, :, (b, c)] - origin[[b, c]]) / voxel_size - .5
+    tris_min, tris_max = tris_bc.min(axis=1), tris_bc.max(axis=1)
+    ib_min, ic_min = np.ceil(tris_min.min(axis=0)).astype(np.int64)
+    ib_max, ic_max = np.floor(tris_max.max(axis=0)).astype(np.int64)
+    # Cut in tiles, a few for each process to balance the load
+    ntiles = int(ceil(sqrt(processes * 4)))
+    ib_edges = np.unique(np.linspace(ib_min, ib_max + 1, ntiles + 1).astype(np.int64))
+    ic_edges = np.unique(np.linspace(ic_min, ic_max + 1, ntiles + 1).astype(np.int64))
+    tasks = list()
+    for ib0, ib1 in zip(ib_edges[:-1], ib_edges[1:] - 1):
+        for ic0, ic1 in zip(ic_edges[:-1], ic_edges[1:] - 1):
+            # Send only the triangles touching the tile
+            is_in = (tris_max[:, 0] >= ib0) & (tris_min[:, 0] <= ib1) & \
+                    (tris_max[:, 1] >= ic0) & (tris_min[:, 1] <= ic1)
+            if np.any(is_in):
+                tile = int(ib0), int(ib1), int(ic0), int(ic1)
+                tasks.append((tris[is_in], origin, voxel_size, axis, tile))
+    with mp_context.Pool(processes) as pool:
+        results = pool.starmap(_get_scanline_boxes, tasks)
+    # Join results, in the same order of a single pass
+    results = [result for result in results if len(result)]
+    if not results:
+        return np.empty((0, 6), dtype=np.int64)
+    boxes = np.concatenate(results)
+    return boxes[np.lexsort((boxes[:, axis*2], boxes[:, c*2], boxes[:, b*2]))]
+
+# Edge function of a counterclockwise triangle edge (pi -> pj) is positive
+# for points at its left, and zero on its line. The edge function is always
+# calculated from the lower point to the other, so that the shared edge of
+# two neighbour triangles gives exactly opposite values.
+# Points lying on edges are assigned to a single triangle by
+# the "top-left" rule, as in raster graphics:
+# each ray crosses the surface once, even through edges and vertices.
+
+def _edge_test(pis, pjs, pbs, pcs, b, c) -> "ws, is_ins":
+    """Get edge function values, and test inclusion with the top-left rule."""
+    ibs, ics, jbs, jcs = pis[:, b], pis[:, c], pjs[:, b], pjs[:, c]
+    swap = (ibs > jbs) | ((ibs == jbs) & (ics > jcs))
+    sbs, scs = np.where(swap, jbs, ibs), np.where(swap, jcs, ics)
+    ebs, ecs = np.where(swap, ibs, jbs), np.where(swap, ics, jcs)
+    ws = (ebs - sbs) * (pcs - scs) - (ecs - scs) * (pbs - sbs)
+    ws = np.where(swap, -ws, ws)
+    dbs, dcs = jbs - ibs, jcs - ics
+    is_top_left = (dcs < 0.) | ((dcs == 0.) & (dbs < 0.))
+    return ws, (ws > 0.) | ((ws == 0.) & is_top_left)
+
+# The following functions further reduce the number of boxes, by a greedy
+# maximal cuboid decomposition. The boxes fill an occupancy grid, compressed
+# to the box coordinates, so that its cells are few and can be of any size.
+# Then, from the first free occupied cell, a box is grown as far as possible
+# along x, then y, then z, and its cells are marked as used.
+# The grid is dense, so it is not allocated when it has too many cells:
+# boxes are left unmerged, and the voxelization message tells.
+
+MAX_MERGE_CELLS = 1 << 26  # 64 MB of occupancy grid
+
+def _optimize_boxes(boxes, optimize) -> "boxes, nboxes":
+    """Merge boxes if requested, get the number of boxes before merging (None if not merged)."""
+    nboxes = len(boxes)
+    if not boxes or not optimize:
+        return boxes, nboxes
+    merged = _merge_boxes(boxes)
+    if merged is None:
+        return boxes, None
+    return merged, nboxes
+
+def _merge_boxes(boxes) -> "boxes or None":
+    """Merge boxes in 3D, by greedy growth of maximal boxes on the occupancy grid.
+    Return None if the occupancy grid is too large."""
+    DEBUG and print("BFDS: _merge_boxes")
+    boxes = np.array(boxes, dtype=np.int64)
+    # Compress the grid to the box coordinates
+    xs, ys, zs = (np.unique(boxes[:, axis*2:axis*2+2]) for axis in range(3))
+    nz, ny, nx = len(zs) - 1, len(ys) - 1, len(xs) - 1
+    if nz * ny * nx > MAX_MERGE_CELLS:
+        DEBUG and print("BFDS: _merge_boxes: grid too large:", nz * ny * nx)
+        return None
+    ixs, iys, izs = (
+        np.searchsorted(coos, boxes[:, axis*2:axis*2+2]) for axis, coos in enumerate((xs, ys, zs))
+    )
+    # Fill the occupancy grid, indexed as [iz, iy, ix]
+    free = np.zeros((nz, ny, nx), dtype=bool)
+    for (ix0, ix1), (iy0, iy1), (iz0, iz1) in zip(ixs.tolist(), iys.tolist(), izs.tolist()):
+        free[iz0:iz1, iy0:iy1, ix0:ix1] = True
+    # Grow boxes from the first free cell, in z, y, x order,
+    # checking one more row or layer at a time, up to the first not free
+    free_flat = free.reshape(-1)  # a view
+    merged = list()
+    i, chunk = 0, 4096
+    while i < free_flat.size:
+        j = int(np.argmax(free_flat[i:i+chunk]))
+        if not free_flat[i+j]:  # no free cell in chunk
+            i += chunk
+            continue
+        i += j
+        iz0, iy0, ix0 = i // (ny*nx), i // nx % ny, i % nx
+        ix1 = ix0 + _get_run_length(free[iz0, iy0, ix0:])
+        iy1 = iy0 + 1
+        while iy1 < ny and free[iz0, iy1, ix0:ix1].all():
+            iy1 += 1
+        iz1 = iz0 + 1
+        while iz1 < nz and free[iz1, iy0:iy1, ix0:ix1].all():
+            iz1 += 1
+        free[iz0:iz1, iy0:iy1, ix0:ix1] = False
+        merged.append([xs[ix0], xs[ix1], ys[iy0], ys[iy1], zs[iz0], zs[iz1]])
+    # Greedy growth is not optimal: never give back more boxes
+    if len(merged) > len(boxes):
+        return boxes.tolist()
+    return np.array(merged, dtype=np.int64).tolist()
+
+def _get_run_length(is_free) -> "int":
+    """Get the number of leading free cells."""
+    return is_free.all() and len(is_free) or int(np.argmin(is_free))
+
 # Transform boxes in integer coordinates, back to global coordinates
 
 def _get_box_xbs(boxes, origin, voxel_size) -> "xbs":
@@ -368,13 +640,15 @@ def get_pixels(context, ob):
     """Get pixels from flat object in xbs format."""
     # Check and init
     DEBUG and print("BFDS: calc_voxels.get_voxels")
-    voxel_size = _get_voxel_size(context, ob)
-    flat_axis = _get_flat_axis(ob, voxel_size)
+    voxel_size = get_voxel_size(context, ob)
     # Create new object, and link it. Then prepare it for voxelization
+    # Its flat axis is read from the copy, that can be an ARRAY base element
     ob_tmp = utils.object_get_global_copy(context, ob, suffix='_pix_tmp')
+    flat_axis = _get_flat_axis(ob_tmp, voxel_size)
     ob_tmp.bf_xb_voxel_size = voxel_size
     ob_tmp.bf_xb_custom_voxel = True
     ob_tmp.bf_xb_center_voxels = ob.bf_xb_center_voxels
+    ob_tmp.bf_xb_optimize_voxels = ob.bf_xb_optimize_voxels
     # Check how flat it is
     if ob_tmp.dimensions[flat_axis] > voxel_size:
         bpy.data.objects.remove(ob_tmp, do_unlink=True)
@@ -396,13 +670,13 @@ def get_pixels(context, ob):
     )
     ob_tmp.modifiers.remove(mo)
     # Voxelize
-    xbs, voxel_size, ts = get_voxels(context, ob_tmp)
+    xbs, voxel_size, ts, nboxes = get_voxels(context, ob_tmp)
     # Flatten the solidified object
     choice = (_x_flatten_xbs, _y_flatten_xbs, _z_flatten_xbs)[flat_axis]
     xbs = choice(xbs, flat_origin)
     # Clean and return
     bpy.data.objects.remove(ob_tmp, do_unlink=True)
-    return xbs, voxel_size, ts
+    return xbs, voxel_size, ts, nboxes
 
 def _get_flat_axis(ob, voxel_size):
     """Get object flat axis."""
@@ -0,0 +1,77 @@
+"""BlenderFDS, persistent geometry cache on disk."""
+
+import bpy, os, hashlib
+import numpy as np
+
+from . import utils
+
+DEBUG = True
+
+# The cache is content addressed: the key is the hash of the evaluated
+# global mesh, of the object transform, and of all the parameters that
+# affect the result. The value is a compact binary array of xbs.
+# An unchanged object gets the same key in any session or file,
+# a modified object gets a new key, so the cache is never invalidated.
+
+cache_dirname = "bf_cache"
+
+def get_dirpath(context) -> "str or None":
+    """Get cache directory path, next to the .blend file, if saved."""
+    if not bpy.data.filepath:
+        return None
+    return os.path.join(os.path.dirname(bpy.data.filepath), cache_dirname)
+
+def get_key(context, ob, *params) -> "str":
+    """Get the hash of evaluated object global mesh, transform, and params."""
+    me = utils.get_global_mesh(context, ob)
+    h = hashlib.sha1()
+    for collection, attr, dtype, size in (
+            (me.vertices, "co", np.float32, 3),
+            (me.loops, "vertex_index", np.int32, 1),
+            (me.polygons, "loop_total", np.int32, 1),
+            (me.edges, "vertices", np.int32, 2),
+        ):
+        data = np.empty(len(collection) * size, dtype=dtype)
+        collection.foreach_get(attr, data)
+        h.update(data.tobytes())
+    bpy.data.meshes.remove(me, do_unlink=True)
+    h.update(np.array(ob.matrix_world, dtype=np.float64).tobytes())
+    h.update(repr(params).encode("utf8"))
+    return h.hexdigest()
+
+def _get_filepath(context, key) -> "str or None":
+    """Get cache file path from key."""
+    dirpath = get_dirpath(context)
+    return dirpath and os.path.join(dirpath, key + ".npz")
+
+def load(context, key) -> "(xbs, msg) or None":
+    """Load xbs and msg from cache, if available."""
+    filepath = _get_filepath(context, key)
+    if not filepath or not os.path.isfile(filepath):
+        return None
+    try:
+        with np.load(filepath) as data:
+            xbs, msg = data["xbs"].tolist(), str(data["msg"])
+    except (OSError, ValueError, KeyError):
+        DEBUG and print("BFDS: file_cache.load: cannot read:", filepath)
+        return None
+    DEBUG and print("BFDS: file_cache.load:", key)
+    return xbs, msg and "{}, cached".format(msg) or "Cached"
+
+def save(context, key, xbs, msg) -> "None":
+    """Save xbs and msg to cache, if possible."""
+    filepath = _get_filepath(context, key)
+    if not filepath:
+        return
+    xbs = np.array(xbs, dtype=np.float64).reshape((-1, 6))
+    try:
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        # Write to a tmp file, then rename: concurrent readers never see partial data
+        filepath_tmp = "{}.{}.tmp".format(filepath, os.getpid())
+        with open(filepath_tmp, "wb") as f:
+            np.savez(f, xbs=xbs, msg=np.array(msg))
+        os.replace(filepath_tmp, filepath)
+    except OSError:
+        DEBUG and print("BFDS: file_cache.save: cannot write:", filepath)
+        return
+    DEBUG and print("BFDS: file_cache.save:", key)
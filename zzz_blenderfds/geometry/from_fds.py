@@ -1,6 +1,7 @@
 """BlenderFDS, translate geometry from FDS notation to a Blender mesh."""
 
 import bpy
+import numpy as np
 from time import time
 
 from . import utils
@@ -13,17 +14,28 @@ def none_to_mesh(value=None, me=None) -> "Mesh":
 
 #++ from XB
 
+# Vertex coordinates of each element, as column indices of its XB (x0,x1,y0,y1,z0,z1,)
+_xb_edge_cols = (0,2,4), (1,3,5)
+_xb_face_cols = (  # face normal to x, y, z
+    ((0,2,4), (0,3,4), (0,3,5), (0,2,5)),
+    ((0,2,4), (1,2,4), (1,2,5), (0,2,5)),
+    ((0,2,4), (0,3,4), (1,3,4), (1,2,4)),
+)
+_xb_bbox_cols = (0,2,4), (1,2,4), (1,3,4), (0,3,4), (0,2,5), (1,2,5), (1,3,5), (0,3,5)
+_xb_bbox_faces = (0,3,2,1), (0,1,5,4), (0,4,7,3), (6,5,1,2), (6,2,3,7), (6,7,4,5)
+
+def _get_xbs_array(xbs) -> "xbs":
+    """Get XBs ((x0,x1,y0,y1,z0,z1,), ...) as a (n,6) numpy array."""
+    return np.array(xbs, dtype=np.float64).reshape((-1, 6))
+
 def xbs_edges_to_mesh(xbs, me=None) -> "Mesh":
     """Translate XB edges ((x0,x1,y0,y1,z0,z1,), ...) to Blender mesh."""
     if not me:
         me = bpy.data.meshes.new("xbs_edges")
-    verts, edges, faces = list(), list(), list()
-    for i, xb in enumerate(xbs):
-        x0, x1, y0, y1, z0, z1 = xb
-        j = i * 2
-        verts.extend(((x0,y0,z0), (x1,y1,z1)))
-        edges.append((0+j,1+j))
-    me.from_pydata(verts, edges, faces)
+    xbs = _get_xbs_array(xbs)
+    verts = xbs[:, _xb_edge_cols].reshape((-1, 3))
+    edges = np.arange(len(verts)).reshape((-1, 2))
+    utils.set_mesh_arrays(me, verts, edges=edges)
     return me
 
 def xbs_faces_to_mesh(xbs, me=None) -> "Mesh":
@@ -31,34 +43,158 @@ def xbs_faces_to_mesh(xbs, me=None) -> "Mesh":
     epsilon = 1E-5
     if not me:
         me = bpy.data.meshes.new("xbs_faces")
-    verts, edges, faces = list(), list(), list()
-    for i, xb in enumerate(xbs):
-        x0, x1, y0, y1, z0, z1 = xb
-        j = i * 4
-        if   abs(x1 - x0) < epsilon:
-            verts.extend(((x0,y0,z0), (x0,y1,z0), (x0,y1,z1), (x0,y0,z1)))
-        elif abs(y1 - y0) < epsilon:
-            verts.extend(((x0,y0,z0), (x1,y0,z0), (x1,y0,z1), (x0,y0,z1)))
-        elif abs(z1 - z0) < epsilon:
-            verts.extend(((x0,y0,z0), (x0,y1,z0), (x1,y1,z0), (x1,y0,z0)))
-        else:
-            print("BFDS: from_fds.xbs_faces_to_ob: this XB is not a face:", xb)
-            continue
-        faces.append((0+j,1+j,2+j,3+j))
-    me.from_pydata(verts, edges, faces)
+    xbs = _get_xbs_array(xbs)
+    # Choose the face normal: the first flat axis, or none
+    flat = np.abs(xbs[:, 1::2] - xbs[:, 0::2]) < epsilon
+    is_face = flat.any(axis=1)
+    for xb in xbs[~is_face]:
+        print("BFDS: from_fds.xbs_faces_to_ob: this XB is not a face:", tuple(xb.tolist()))
+    xbs, normals = xbs[is_face], flat[is_face].argmax(axis=1)
+    cols = np.array(_xb_face_cols)[normals]  # (n,4,3)
+    verts = xbs[np.arange(len(xbs))[:, None, None], cols].reshape((-1, 3))
+    faces = np.arange(len(verts)).reshape((-1, 4))
+    utils.set_mesh_arrays(me, verts, faces=faces)
     return me
 
 def xbs_bbox_to_mesh(xbs, me=None) -> "Mesh":
     """Translate XB bbox ((x0,x1,y0,y1,z0,z1,), ...) to Blender mesh."""
     if not me:
         me = bpy.data.meshes.new("xbs_bbox")
-    verts, edges, faces = list(), list(), list()
-    for i, xb in enumerate(xbs):
-        x0, x1, y0, y1, z0, z1 = xb
-        j = i * 8
-        verts.extend(((x0,y0,z0), (x1,y0,z0), (x1,y1,z0), (x0,y1,z0), (x0,y0,z1), (x1,y0,z1), (x1,y1,z1), (x0,y1,z1)))
-        faces.extend(((0+j,3+j,2+j,1+j), (0+j,1+j,5+j,4+j), (0+j,4+j,7+j,3+j), (6+j,5+j,1+j,2+j), (6+j,2+j,3+j,7+j), (6+j,7+j,4+j,5+j)))
-    me.from_pydata(verts, edges, faces)
+    xbs = _get_xbs_array(xbs)
+    verts = xbs[:, _xb_bbox_cols].reshape((-1, 3))
+    faces = (np.array(_xb_bbox_faces) + 8 * np.arange(len(xbs))[:, None, None]).reshape((-1, 4))
+    utils.set_mesh_arrays(me, verts, faces=faces)
+    return me
+
+# The shell of a box set is built on the compressed grid of the box coordinates.
+# Solid boxes fill the occupancy grid of its cells, and the shell is made
+# of the cell faces between occupied and empty cells: so the faces shared
+# by touching boxes cancel out, even when they only partly overlap.
+# Flat boxes (eg. pixels) are not solids: their cells are only joined,
+# plane by plane. Then the cell faces of each plane are merged again
+# into maximal rectangles, and the grid nodes that are corners of other
+# rectangles are inserted along their sides, so there are no T-junctions.
+
+def _get_grid_indices(values, epsilon) -> "grid, indices":
+    """Get sorted grid of values, merged when closer than epsilon, and the grid indices of values."""
+    order = np.argsort(values, kind="mergesort")
+    sorted_values = values[order]
+    is_new = np.ones(len(values), dtype=bool)
+    is_new[1:] = np.diff(sorted_values) > epsilon
+    indices = np.empty(len(values), dtype=np.int64)
+    indices[order] = np.cumsum(is_new) - 1
+    return sorted_values[is_new], indices
+
+def _get_rectangles(cells) -> "[(ib0, ib1, ic0, ic1), ...]":
+    """Get maximal rectangles covering the cells of a 2D bool array, by greedy growth."""
+    cells = cells.copy()
+    nb, nc = cells.shape
+    rectangles = list()
+    for ib0, ic0 in zip(*(indexes.tolist() for indexes in np.nonzero(cells))):
+        if not cells[ib0, ic0]:  # already used
+            continue
+        row = cells[ib0, ic0:]
+        ic1 = row.all() and nc or ic0 + int(np.argmin(row))
+        ib1 = ib0 + 1
+        while ib1 < nb and cells[ib1, ic0:ic1].all():
+            ib1 += 1
+        cells[ib0:ib1, ic0:ic1] = False
+        rectangles.append((ib0, ib1, ic0, ic1))
+    return rectangles
+
+def _get_cell_faces(ijks, shape) -> "[(axis, plane, orientation, cells), ...]":
+    """Get the cell faces of the boxes ijks on a grid of shape nodes,
+    as (axis, plane index, orientation, 2D cells) groups. Flat boxes have orientation 0."""
+    groups = list()
+    is_flat = np.any(ijks[:, 1::2] == ijks[:, 0::2], axis=1)
+    # Shell of solid boxes
+    solids = ijks[~is_flat]
+    if len(solids):
+        occupied = np.zeros(tuple(n - 1 for n in shape), dtype=bool)
+        for i0, i1, j0, j1, k0, k1 in solids.tolist():
+            occupied[i0:i1, j0:j1, k0:k1] = True
+        for axis in range(3):
+            b, c = (axis+1) % 3, (axis+2) % 3
+            padding = [(0, 0)] * 3
+            padding[axis] = (1, 1)
+            padded = np.pad(occupied, padding, mode="constant").astype(np.int8)
+            steps = np.diff(padded, axis=axis).transpose((axis, b, c))  # [plane, ib, ic]
+            for orientation in (1, -1):
+                is_face = steps == -orientation  # occupied cell before, empty after
+                for plane in np.flatnonzero(is_face.any(axis=(1, 2))).tolist():
+                    groups.append((axis, plane, orientation, is_face[plane]))
+    # Union of flat boxes, plane by plane
+    planes = dict()
+    for box in ijks[is_flat].tolist():
+        axis = [box[2*axis] == box[2*axis+1] for axis in range(3)].index(True)
+        b, c = (axis+1) % 3, (axis+2) % 3
+        cells = planes.get((axis, box[2*axis]))
+        if cells is None:
+            cells = planes[(axis, box[2*axis])] = np.zeros((shape[b] - 1, shape[c] - 1), dtype=bool)
+        cells[box[2*b]:box[2*b+1], box[2*c]:box[2*c+1]] = True
+    for (axis, plane), cells in sorted(planes.items()):
+        groups.append((axis, plane, 0, cells))
+    return groups
+
+def get_xbs_shell(xbs) -> "verts, faces, loop_totals":
+    """Get the exterior shell of XB bbox ((x0,x1,y0,y1,z0,z1,), ...),
+    as vertices (n,3), the flat array of face vertices, and the number of vertices of each face."""
+    epsilon = 1E-5
+    xbs = _get_xbs_array(xbs)
+    if not len(xbs):
+        return np.empty((0, 3)), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    # Get the integer box representation on the compressed grid
+    grids, ijks = list(), np.empty(xbs.shape, dtype=np.int64)
+    for axis in range(3):
+        grid, indices = _get_grid_indices(xbs[:, 2*axis:2*axis+2].ravel(), epsilon)
+        grids.append(grid)
+        ijks[:, 2*axis:2*axis+2] = indices.reshape((-1, 2))
+    shape = tuple(len(grid) for grid in grids)
+    # Get the rectangles, as their counterclockwise corners (i,j,k,)
+    rectangles = list()
+    for axis, plane, orientation, cells in _get_cell_faces(ijks, shape):
+        b, c = (axis+1) % 3, (axis+2) % 3
+        for ib0, ib1, ic0, ic1 in _get_rectangles(cells):
+            corners = (ib0, ic0), (ib1, ic0), (ib1, ic1), (ib0, ic1)
+            if orientation < 0:
+                corners = corners[::-1]
+            rectangle = list()
+            for ib, ic in corners:
+                node = [0, 0, 0]
+                node[axis], node[b], node[c] = plane, ib, ic
+                rectangle.append(tuple(node))
+            rectangles.append(rectangle)
+    # Insert the corners of other rectangles along the sides
+    corners = {node for rectangle in rectangles for node in rectangle}
+    faces, loop_totals = list(), list()
+    for rectangle in rectangles:
+        face = list()
+        for node, next_node in zip(rectangle, rectangle[1:] + rectangle[:1]):
+            face.append(node)
+            axis = [node[axis] != next_node[axis] for axis in range(3)].index(True)
+            step = next_node[axis] > node[axis] and 1 or -1
+            for index in range(node[axis] + step, next_node[axis], step):
+                side_node = list(node)
+                side_node[axis] = index
+                side_node = tuple(side_node)
+                if side_node in corners:
+                    face.append(side_node)
+        faces.extend(face)
+        loop_totals.append(len(face))
+    # Get shared vertices, and their coordinates
+    nodes = np.array(faces, dtype=np.int64).reshape((-1, 3))
+    nids = (nodes[:, 0] * shape[1] + nodes[:, 1]) * shape[2] + nodes[:, 2]
+    nids, faces = np.unique(nids, return_inverse=True)
+    i, j, k = nids // (shape[1] * shape[2]), nids // shape[2] % shape[1], nids % shape[2]
+    verts = np.column_stack((grids[0][i], grids[1][j], grids[2][k]))
+    return verts, faces.ravel(), np.array(loop_totals, dtype=np.int64)
+
+def xbs_shell_to_mesh(xbs, me=None) -> "Mesh":
+    """Translate the exterior shell of XB bbox ((x0,x1,y0,y1,z0,z1,), ...) to Blender mesh."""
+    if not me:
+        me = bpy.data.meshes.new("xbs_shell")
+    verts, faces, loop_totals = get_xbs_shell(xbs)
+    utils.set_mesh_arrays(me, verts, faces=faces, loop_totals=loop_totals)
     return me
 
 # Caller function
@@ -72,10 +208,11 @@ choose_from_xbs = {
     "FACES"  : xbs_faces_to_mesh,
     "PIXELS" : xbs_bbox_to_mesh,
     "EDGES"  : xbs_edges_to_mesh,
+    "BOXES"  : xbs_bbox_to_mesh,
 }
 
-def xbs_to_ob(xbs, context, ob=None, bf_xb="NONE", name="xbs_to_ob", update_center=True) -> "Mesh":
-    """Transform geometry in FDS notation to Blender object."""
+def xbs_to_ob(xbs, context, ob=None, bf_xb="NONE", name="xbs_to_ob", update_center=True, shell=False) -> "Mesh":
+    """Transform geometry in FDS notation to Blender object, or only the shell of voxels and pixels."""
     # Choose bf_xb
     epsilon = 1E-5
     if bf_xb == "NONE":
@@ -85,7 +222,10 @@ def xbs_to_ob(xbs, context, ob=None, bf_xb="NONE", name="xbs_to_ob", update_cent
         else:
             bf_xb = "BBOX"
     # Get mesh, set it, set properties and center position
-    me = choose_from_xbs[bf_xb](xbs)
+    if shell and bf_xb in ("VOXELS", "PIXELS"):
+        me = xbs_shell_to_mesh(xbs)
+    else:
+        me = choose_from_xbs[bf_xb](xbs)
     if ob:
         utils.set_global_mesh(context, ob, me) # ob exists, set its mesh
     else:
@@ -95,6 +235,20 @@ def xbs_to_ob(xbs, context, ob=None, bf_xb="NONE", name="xbs_to_ob", update_cent
     ob.bf_xb = bf_xb
     return ob
 
+def xbs_boxes_to_ob(xbs, ids, context, ob=None, name="xbs_boxes_to_ob", update_center=True) -> "Object":
+    """Transform geometry in FDS notation and the box IDs to Blender object, one box for each XB."""
+    # Get mesh, set it, set properties and center position
+    me = xbs_bbox_to_mesh(xbs)
+    utils.set_box_ids(me, ids)
+    if ob:
+        utils.set_global_mesh(context, ob, me) # ob exists, set its mesh
+    else:
+        ob = utils.get_new_object(context, context.scene, name, me) # no ob, get a new one with proper mesh
+    if update_center:
+        utils.set_balanced_center_position(context, ob)
+    ob.bf_xb = "BOXES"
+    return ob
+
 #++ from XYZ
 
 def xyzs_vertices_to_mesh(xyzs, me=None) -> "Mesh":
@@ -193,18 +347,16 @@ def geom_to_mesh(fds_surfids, fds_verts, fds_faces, me=None) -> "Mesh":
         raise Exception("Wrong VERTS length")
     if nfaces * 4 != len(fds_faces):
         raise Exception("Wrong FACES length")
-    verts = [(fds_verts[i*3], fds_verts[i*3+1], fds_verts[i*3+2],) for i in range(nverts)]
-    edges = list()
-    faces = [(fds_faces[i*4]-1, fds_faces[i*4+1]-1, fds_faces[i*4+2]-1,) for i in range(nfaces)]
-    imats = [fds_faces[i*4+3]-1 for i in range(nfaces)]
-    # Check imats
-    if max(imats) > len(me.materials)-1:
+    verts = np.array(fds_verts, dtype=np.float64).reshape((-1, 3))
+    fds_faces = np.array(fds_faces, dtype=np.int64).reshape((-1, 4)) - 1
+    faces, imats = fds_faces[:, :3], fds_faces[:, 3]
+    # Check faces and imats
+    if nfaces and (faces.min() < 0 or faces.max() > nverts-1):
+        raise Exception("Wrong FACES vertex index")
+    if nfaces and imats.max() > len(me.materials)-1:
         raise Exception("Wrong SURF_ID length")
-    # Create mesh
-    me.from_pydata(verts, edges, faces)
-    # Assign materials to faces
-    for iface, face in enumerate(me.polygons):
-        face.material_index = imats[iface]
+    # Create mesh, and assign materials to faces
+    utils.set_mesh_arrays(me, verts, faces=faces, material_indices=imats)
     return me
 
 def geom_to_ob(fds_surfids, fds_verts, fds_faces, context, ob=None, name="geom_to_ob", update_center=True) -> "Mesh":
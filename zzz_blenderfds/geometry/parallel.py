@@ -0,0 +1,171 @@
+"""BlenderFDS, parallel calculation of object geometries."""
+
+import bpy
+import multiprocessing
+from time import time
+
+from ..exceptions import BFException
+from . import utils, file_cache, cache, to_fds
+from .calc_voxels import get_voxels_from_triangles, get_voxels_from_faces, get_remesh_faces, get_voxel_size
+
+DEBUG = True
+
+# Object geometries are independent, so they are calculated by a process pool.
+# First, a pure data snapshot of each object is taken in the main process:
+# its evaluated global mesh arrays and the properties affecting its geometry.
+# Then the snapshots are sent to the pool, where no bpy access happens.
+# Finally, the results are set in the geometry cache, so the ordinary export
+# reads them in its own deterministic order: the FDS file is the same.
+# Only the objects whose namelist exports XB, XYZ or PB are snapshot.
+# Remesh voxelization needs the Blender remesh modifier: it is applied
+# while taking the snapshot, and only the following box building and merging
+# run in the pool. Scanline voxelization runs in the pool as a whole.
+# Pixels and GEOM need Blender operators, so they are not in the snapshot,
+# and are calculated by the ordinary export.
+
+geometry_bpy_idnames = {"bf_xb": "xbs", "bf_xyz": "xyzs", "bf_pb": "pbs"}
+
+def _get_exported_kinds(ob) -> "{kind, }":
+    """Get the geometries exported by the namelist of ob."""
+    bf_namelist = ob.bf_namelist
+    if not bf_namelist:
+        return set()
+    return {
+        geometry_bpy_idnames[bf_prop.bpy_idname] for bf_prop in bf_namelist.all_bf_props
+        if bf_prop.bpy_idname in geometry_bpy_idnames
+    }
+
+def _get_kinds(context, ob) -> "{kind: choice, }":
+    """Get the geometries of ob to be calculated in parallel, if not cached."""
+    kinds = dict()
+    exported_kinds = _get_exported_kinds(ob)
+    if "xbs" in exported_kinds and (
+            ob.bf_xb in ("FACES", "EDGES") or (ob.bf_xb == "VOXELS" and ob.data.vertices)
+        ) and not to_fds.get_array_mult(ob):  # the base element of ARRAY is left to the ordinary export
+        kinds["xbs"] = ob.bf_xb
+    if "xyzs" in exported_kinds and ob.bf_xyz == "VERTICES":
+        kinds["xyzs"] = ob.bf_xyz
+    if "pbs" in exported_kinds and ob.bf_pb == "PLANES":
+        kinds["pbs"] = ob.bf_pb
+    return {kind: choice for kind, choice in kinds.items() if cache.get(ob, kind) is None}
+
+def _get_snapshot(context, ob) -> "snapshot or None":
+    """Get a pure data snapshot of ob, or None if nothing is to be calculated."""
+    kinds = _get_kinds(context, ob)
+    key = None
+    if kinds.get("xbs") == "VOXELS" and context.scene.bf_config_disk_cache:
+        # Try the disk cache first, as the ordinary export does
+        key = file_cache.get_key(
+            context, ob, ob.bf_xb, get_voxel_size(context, ob), ob.bf_xb_center_voxels,
+            ob.bf_xb_optimize_voxels, context.scene.bf_config_voxel_engine,
+        )
+        result = file_cache.load(context, key)
+        if result is not None:
+            cache.set(ob, "xbs", result)
+            del kinds["xbs"]
+    snapshot = {"name": ob.name, "kinds": kinds, "disk_cache_key": key}
+    is_remesh = kinds.get("xbs") == "VOXELS" and context.scene.bf_config_voxel_engine != "SCANLINE"
+    if is_remesh:
+        t0 = time()
+        try:
+            snapshot["normals"], snapshot["centers"] = get_remesh_faces(context, ob, get_voxel_size(context, ob))
+        except BFException:  # the ordinary export reports it
+            del kinds["xbs"]
+            is_remesh = False
+        snapshot["dt"] = time() - t0
+    if not kinds:
+        return None
+    if not is_remesh or len(kinds) > 1:
+        snapshot["verts"], snapshot["faces"], snapshot["edges"] = utils.get_global_mesh_arrays(context, ob)
+    if kinds.get("xbs") == "VOXELS":
+        snapshot["voxel_size"] = get_voxel_size(context, ob)
+        snapshot["center_voxels"] = ob.bf_xb_center_voxels
+        snapshot["optimize_voxels"] = ob.bf_xb_optimize_voxels
+        snapshot["scale_length"] = context.scene.unit_settings.scale_length
+    return snapshot
+
+# Calculations on snapshots, no bpy access
+
+def _calc_xbs_voxels(snapshot) -> "((x0,x1,y0,y1,z0,z1,), ...), 'Message'":
+    t0 = time()
+    if "centers" in snapshot:  # already remeshed
+        t0 -= snapshot["dt"]
+        xbs, timing, nboxes = get_voxels_from_faces(
+            snapshot["normals"], snapshot["centers"], snapshot["voxel_size"], snapshot["optimize_voxels"],
+        )
+    else:
+        tris = utils.get_triangles(snapshot["verts"], snapshot["faces"])
+        xbs, timing, nboxes = get_voxels_from_triangles(
+            tris, snapshot["voxel_size"], snapshot["center_voxels"], snapshot["optimize_voxels"],
+        )
+    if not xbs:
+        return (), "No voxel created"
+    resolution = snapshot["voxel_size"] * snapshot["scale_length"]
+    msg = to_fds.get_voxels_msg(xbs, resolution, time()-t0, timing, nboxes, snapshot["optimize_voxels"])
+    return xbs, msg
+
+def _calc_xbs_faces(snapshot) -> "((x0,x1,y0,y1,z0,z0,), ...), 'Message'":
+    return to_fds.faces_to_xbs(snapshot["verts"], snapshot["faces"])
+
+def _calc_xbs_edges(snapshot) -> "((x0,x1,y0,y1,z0,z1,), ...), 'Message'":
+    return to_fds.edges_to_xbs(snapshot["verts"], snapshot["edges"])
+
+def _calc_xyzs_vertices(snapshot) -> "((x0,y0,z0,), ...), 'Message'":
+    return to_fds.verts_to_xyzs(snapshot["verts"])
+
+def _calc_pbs_planes(snapshot) -> "((0,x3,), (0,x7,), (1,y9,), ...), 'Message'":
+    xbs, msg = _calc_xbs_faces(snapshot)
+    return to_fds.xbs_faces_to_pbs(xbs)
+
+choice_to_calc = {
+    "VOXELS"   : _calc_xbs_voxels,
+    "FACES"    : _calc_xbs_faces,
+    "EDGES"    : _calc_xbs_edges,
+    "VERTICES" : _calc_xyzs_vertices,
+    "PLANES"   : _calc_pbs_planes,
+}
+
+def _calc(snapshot) -> "name, {kind: result, }":
+    """Calculate the geometries of a snapshot, in a pool process."""
+    results = dict()
+    for kind, choice in snapshot["kinds"].items():
+        try:
+            results[kind] = choice_to_calc[choice](snapshot)
+        except ValueError:  # eg. not closed: the ordinary export reports it
+            continue
+    return snapshot["name"], results
+
+# Caller function
+
+def calc_geometries(context, obs, processes) -> "int":
+    """Calculate and cache the geometries of obs by a pool of processes, return their number."""
+    DEBUG and print("BFDS: geometry.parallel.calc_geometries")
+    t0 = time()
+    try:
+        mp_context = multiprocessing.get_context("fork")
+    except ValueError:  # fork not available, eg. on Windows
+        return 0
+    # Take the snapshots, the largest first to balance the load
+    snapshots = list()
+    for ob in obs:
+        if ob.type != "MESH" or not ob.bf_export:
+            continue
+        snapshot = _get_snapshot(context, ob)
+        if snapshot:
+            snapshots.append(snapshot)
+    if not snapshots:
+        return 0
+    snapshots.sort(key=lambda snapshot: len(snapshot.get("centers", snapshot.get("faces"))), reverse=True)
+    # Calculate
+    with mp_context.Pool(min(processes, len(snapshots))) as pool:
+        results = pool.map(_calc, snapshots, chunksize=1)
+    # Cache the results
+    for snapshot, (name, ob_results) in zip(snapshots, results):
+        ob = bpy.data.objects[name]
+        for kind, result in ob_results.items():
+            cache.set(ob, kind, result)
+        key = snapshot["disk_cache_key"]
+        if key and "xbs" in ob_results:
+            file_cache.save(context, key, *ob_results["xbs"])
+    DEBUG and print("BFDS: geometry.parallel.calc_geometries: {} objects in {:.3f} s".format(len(snapshots), time()-t0))
+    return len(snapshots)
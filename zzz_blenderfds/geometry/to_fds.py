@@ -1,9 +1,10 @@
 """BlenderFDS, translate Blender object geometry to FDS notation."""
 
-import bpy
+import hashlib
+import numpy as np
 from time import time
-from . import utils
-from .calc_voxels import get_voxels, get_pixels
+from . import utils, file_cache, cache
+from .calc_voxels import get_voxels, get_pixels, get_voxel_size
 from .calc_trisurfaces import get_trisurface
 from ..exceptions import BFException
 
@@ -21,24 +22,31 @@ def ob_to_xbs_voxels(context, ob) -> "((x0,x1,y0,y1,z0,z1,), ...), 'Message'":
     """Transform ob solid geometry in XBs notation (voxelization). Never send None."""
     DEBUG and print("BFDS: geometry.ob_to_xbs_voxels:", ob.name)
     t0 = time()
-    xbs, voxel_size, timing = get_voxels(context, ob)
+    xbs, voxel_size, timing, nboxes = get_voxels(context, ob)
     if not xbs:
         return (), "No voxel created"
     scale_length = context.scene.unit_settings.scale_length
-    msg = "{0} voxels, resolution {1:.3f} m, in {2:.3f} s".format(len(xbs), voxel_size * scale_length, time()-t0)
-    if DEBUG: msg += " (s:{0[0]:.3f} 1f:{0[1]:.3f}, 2g:{0[2]:.3f}, 3g:{0[3]:.3f})".format(timing)
+    msg = get_voxels_msg(xbs, voxel_size * scale_length, time()-t0, timing, nboxes, ob.bf_xb_optimize_voxels)
     return xbs, msg
 
+def get_voxels_msg(xbs, resolution, dt, timing, nboxes, optimized, label="voxels") -> "str":
+    """Get voxelization message."""
+    msg = "{0} {1}, resolution {2:.3f} m, in {3:.3f} s".format(len(xbs), label, resolution, dt)
+    if optimized:
+        if nboxes is None: msg += ", not optimized (too many to merge)"
+        else: msg += ", optimized from {0} ({1:.0%} less)".format(nboxes, 1. - len(xbs) / nboxes)
+    if DEBUG: msg += " (s:{0[0]:.3f} 1f:{0[1]:.3f}, 2g:{0[2]:.3f}, 3g:{0[3]:.3f})".format(timing)
+    return msg
+
 def ob_to_xbs_pixels(context, ob) -> "((x0,x1,y0,y1,z0,z0,), ...), 'Message'":
     """Transform ob flat geometry in XBs notation (flat voxelization). Never send None."""
     DEBUG and print("BFDS: geometry.ob_to_xbs_pixels:", ob.name)
     t0 = time()
-    xbs, voxel_size, timing = get_pixels(context, ob)
+    xbs, voxel_size, timing, nboxes = get_pixels(context, ob)
     if not xbs:
         return (), "No pixel created"
     scale_length = context.scene.unit_settings.scale_length
-    msg = "{0} pixels, resolution {1:.3f} m, in {2:.0f} s".format(len(xbs), voxel_size * scale_length, time()-t0)
-    if DEBUG: msg += " (s:{0[0]:.0f} 1f:{0[1]:.0f}, 2g:{0[2]:.0f}, 3g:{0[3]:.0f})".format(timing)
+    msg = get_voxels_msg(xbs, voxel_size * scale_length, time()-t0, timing, nboxes, ob.bf_xb_optimize_voxels, "pixels")
     return xbs, msg
 
 def ob_to_xbs_bbox(context, ob) -> "((x0,x1,y0,y1,z0,z1,), ...), 'Message'":
@@ -50,54 +58,61 @@ def ob_to_xbs_bbox(context, ob) -> "((x0,x1,y0,y1,z0,z1,), ...), 'Message'":
 def ob_to_xbs_faces(context, ob) -> "((x0,x1,y0,y1,z0,z0,), ...), 'Message'":
     """Transform ob faces in XBs notation (faces). Never send None."""
     DEBUG and print("BFDS: geometry.ob_to_xbs_faces:", ob.name)
-    # Init
-    result = list()
-    me = utils.get_global_mesh(context, ob)
-    tessfaces = utils.get_tessfaces(context, me)
-    # For each tessface...
-    for tessface in tessfaces:
-        vertices = [me.vertices[vertex] for vertex in tessface.vertices]
-        # Calc the bounding box in global coordinates
-        bbminx, bbminy, bbminz = vertices[0].co
-        bbmaxx, bbmaxy, bbmaxz = vertices[0].co
-        for vertex in vertices[1:]:
-            x, y, z = vertex.co
-            bbminx, bbminy, bbminz = min(bbminx, x), min(bbminy, y), min(bbminz, z)
-            bbmaxx, bbmaxy, bbmaxz = max(bbmaxx, x), max(bbmaxy, y), max(bbmaxz, z)
-        bbd = [(bbmaxx - bbminx, 2), (bbmaxy - bbminy, 1), (bbmaxz - bbminz, 0)]
-        bbd.sort()
-        if bbd[0][1] == 2:
-            bbmaxx = bbminx = (bbminx+bbmaxx)/2
-        if bbd[0][1] == 1:
-            bbmaxy = bbminy = (bbminy+bbmaxy)/2
-        if bbd[0][1] == 0:
-            bbmaxz = bbminz = (bbminz+bbmaxz)/2
-        result.append((bbminx, bbmaxx, bbminy, bbmaxy, bbminz, bbmaxz,),)
-    result.sort()
-    # Clean up
-    bpy.data.meshes.remove(me, do_unlink=True)
-    # Return
+    verts, faces, _ = utils.get_global_mesh_arrays(context, ob)
+    return faces_to_xbs(verts, faces)
+
+def faces_to_xbs(verts, faces) -> "((x0,x1,y0,y1,z0,z0,), ...), 'Message'":
+    """Transform global vertices and raw tessfaces arrays in XBs notation (faces). No bpy access."""
+    if not len(faces):
+        return [], ""
+    # Get the bounding box of each face in global coordinates
+    # (the fourth vertex of a triangle is 0, use its first instead)
+    faces = faces.copy()
+    is_tri = faces[:, 3] == 0
+    faces[is_tri, 3] = faces[is_tri, 0]
+    pts = verts[faces]
+    bbmin, bbmax = pts.min(axis=1), pts.max(axis=1)
+    # Flatten each bounding box along its smallest dimension (if equal, z before y before x)
+    bbd = bbmax - bbmin
+    is_z = (bbd[:, 2] <= bbd[:, 0]) & (bbd[:, 2] <= bbd[:, 1])
+    is_y = ~is_z & (bbd[:, 1] <= bbd[:, 0])
+    is_x = ~is_z & ~is_y
+    for axis, is_flat in enumerate((is_x, is_y, is_z)):
+        bbmin[is_flat, axis] = bbmax[is_flat, axis] = (bbmin[is_flat, axis] + bbmax[is_flat, axis]) / 2
+    # Build (x0,x1,y0,y1,z0,z1,)
+    result = sorted(map(tuple, np.stack((bbmin, bbmax), axis=2).reshape((-1, 6)).tolist()))
     msg = len(result) > 1 and "{0} faces".format(len(result)) or ""
     return result, msg
 
 def ob_to_xbs_edges(context, ob) -> "((x0,x1,y0,y1,z0,z1,), ...), 'Message'":
     """Transform ob faces in XBs notation (faces). Never send None."""
     DEBUG and print("BFDS: geometry.ob_to_xbs_edges:", ob.name)
-    # Init
-    result = list()
-    me = utils.get_global_mesh(context, ob)
-    # For each edge...
-    for edge in me.edges:
-        pt0x, pt0y, pt0z = me.vertices[edge.vertices[0]].co
-        pt1x, pt1y, pt1z = me.vertices[edge.vertices[1]].co
-        result.append((pt0x, pt1x, pt0y, pt1y, pt0z, pt1z,),)
-    result.sort()
-    # Clean up
-    bpy.data.meshes.remove(me, do_unlink=True)
-    # Return
+    verts, _, edges = utils.get_global_mesh_arrays(context, ob)
+    return edges_to_xbs(verts, edges)
+
+def edges_to_xbs(verts, edges) -> "((x0,x1,y0,y1,z0,z1,), ...), 'Message'":
+    """Transform global vertices and edges arrays in XBs notation (edges). No bpy access."""
+    # Build (pt0x, pt1x, pt0y, pt1y, pt0z, pt1z,)
+    result = sorted(map(tuple, verts[edges].transpose((0, 2, 1)).reshape((-1, 6)).tolist()))
     msg = len(result) > 1 and "{0} edges".format(len(result)) or ""
     return result, msg
 
+def ob_to_xbs_boxes(context, ob) -> "((x0,x1,y0,y1,z0,z1,), ...), 'Message'":
+    """Transform ob boxes in XBs notation (boxes), in mesh order. Never send None."""
+    DEBUG and print("BFDS: geometry.ob_to_xbs_boxes:", ob.name)
+    verts, _, _ = utils.get_global_mesh_arrays(context, ob)
+    if len(verts) % 8:
+        raise BFException(ob, "Object is not made of boxes, cannot export.")
+    return verts_to_xbs_boxes(verts)
+
+def verts_to_xbs_boxes(verts) -> "((x0,x1,y0,y1,z0,z1,), ...), 'Message'":
+    """Transform global vertices array, 8 for each box, in XBs notation (boxes). No bpy access."""
+    boxes = verts.reshape((-1, 8, 3))
+    bbmin, bbmax = boxes.min(axis=1), boxes.max(axis=1)
+    result = list(map(tuple, np.stack((bbmin, bbmax), axis=2).reshape((-1, 6)).tolist()))
+    msg = len(result) > 1 and "{0} boxes".format(len(result)) or ""
+    return result, msg
+
 # Caller function (ob.bf_xb)
 
 choice_to_xbs = {
@@ -107,32 +122,63 @@ choice_to_xbs = {
     "FACES"  : ob_to_xbs_faces,
     "PIXELS" : ob_to_xbs_pixels,
     "EDGES"  : ob_to_xbs_edges,
+    "BOXES"  : ob_to_xbs_boxes,
 }
 
+# Slow geometries, cached on disk if requested
+
+disk_cached_xbs = "VOXELS", "PIXELS"
+
+def ob_to_xbs_disk_cached(context, ob) -> "((x0,x1,y0,y1,z0,z0,), ...), 'Message'":
+    """Transform Blender object geometry according to ob.bf_xb, using the disk cache. Never send None."""
+    DEBUG and print("BFDS: geometry.ob_to_xbs_disk_cached:", ob.name)
+    key = file_cache.get_key(
+        context, ob, ob.bf_xb, get_voxel_size(context, ob), ob.bf_xb_center_voxels,
+        ob.bf_xb_optimize_voxels, context.scene.bf_config_voxel_engine,
+    )
+    result = file_cache.load(context, key)
+    if result is None:
+        result = choice_to_xbs[ob.bf_xb](context, ob)  # Calculate
+        file_cache.save(context, key, *result)
+    return result
+
 def ob_to_xbs(context, ob) -> "((x0,x1,y0,y1,z0,z0,), ...), 'Message'":
     """Transform Blender object geometry according to ob.bf_xb to FDS notation. Never send None."""
-    # not ob.get("ob_to_xbs_cache") -> precalc not available or modified input conditions
+    # None from cache -> precalc not available or modified input conditions
     DEBUG and print("BFDS: geometry.ob_to_xbs:", ob.name)
-    if not ob.get("ob_to_xbs_cache"): # ob.is_updated does not work here, checked in the handler
-        ob["ob_to_xbs_cache"] = choice_to_xbs[ob.bf_xb](context, ob) # Calculate
-    return ob["ob_to_xbs_cache"]
+    result = cache.get(ob, "xbs")
+    if result is None: # ob.is_updated does not work here, checked in the handler
+        array_mult = get_array_mult(ob)
+        with utils.base_element(ob, array_mult and array_mult[0] or ()):  # only the base element
+            if ob.bf_xb in disk_cached_xbs and context.scene.bf_config_disk_cache:
+                result = ob_to_xbs_disk_cached(context, ob)
+            else:
+                result = choice_to_xbs[ob.bf_xb](context, ob) # Calculate
+        cache.set(ob, "xbs", result)
+    return result
+
+# Trailing ARRAY modifiers, exported as FDS MULT
+
+array_mult_namelists = "ON_OBST", "ON_HOLE", "ON_VENT"
+array_mult_xbs = "BBOX", "VOXELS", "FACES", "PIXELS"
+
+def get_array_mult(ob) -> "modifiers, (dx,dy,dz), (i_upper,j_upper,k_upper) or None":
+    """Get the trailing ARRAY modifiers of ob exported as FDS MULT, and their lattice, or None."""
+    if not ob.bf_xb_array_mult or ob.bf_namelist_cls not in array_mult_namelists or ob.bf_xb not in array_mult_xbs:
+        return None
+    return utils.get_array_lattice(ob)
 
 #++ to XYZ
 
 def ob_to_xyzs_vertices(context, ob) -> "((x0,y0,z0,), ...), 'Message'":
     """Transform ob vertices in XYZs notation. Never send None."""
     DEBUG and print("BFDS: geometry.ob_to_xyzs_vertices:", ob.name)
-    # Init
-    result = list()
-    me = utils.get_global_mesh(context, ob)
-    # For each vertex...
-    for vertex in me.vertices:
-        pt0x, pt0y, pt0z = vertex.co
-        result.append((pt0x, pt0y, pt0z,),)
-    result.sort()
-    # Clean up
-    bpy.data.meshes.remove(me, do_unlink=True)
-    # Return
+    verts, _, _ = utils.get_global_mesh_arrays(context, ob)
+    return verts_to_xyzs(verts)
+
+def verts_to_xyzs(verts) -> "((x0,y0,z0,), ...), 'Message'":
+    """Transform global vertices array in XYZs notation. No bpy access."""
+    result = sorted(map(tuple, verts.tolist()))
     msg = len(result) > 1 and "{0} vertices".format(len(result)) or ""
     return result, msg
 
@@ -151,11 +197,13 @@ choice_to_xyzs = {
 
 def ob_to_xyzs(context, ob):
     """Transform Blender object geometry according to ob.bf_xyz to FDS notation. Never send None."""
-    # not ob.get("ob_to_xyzs_cache") -> precalc not available or modified input conditions
+    # None from cache -> precalc not available or modified input conditions
     DEBUG and print("BFDS: geometry.ob_to_xyzs:", ob.name)
-    if not ob.get("ob_to_xyzs_cache"): # ob.is_updated does not work here, checked in the handler
-        ob["ob_to_xyzs_cache"] = choice_to_xyzs[ob.bf_xyz](context, ob) # Calculate
-    return ob["ob_to_xyzs_cache"]
+    result = cache.get(ob, "xyzs")
+    if result is None: # ob.is_updated does not work here, checked in the handler
+        result = choice_to_xyzs[ob.bf_xyz](context, ob) # Calculate
+        cache.set(ob, "xyzs", result)
+    return result
 
 
 #++ to PB
@@ -163,9 +211,12 @@ def ob_to_xyzs(context, ob):
 def ob_to_pbs_planes(context, ob) -> "(('X',x3,), ('X',x7,), ('Y',y9,), ...), 'Message'":
     """Transform ob faces in PBs notation. Never send None."""
     DEBUG and print("BFDS: geometry.ob_to_pbs_planes:", ob.name)
-    # Init
-    result = list()
     xbs, msg = ob_to_xbs_faces(context, ob)
+    return xbs_faces_to_pbs(xbs)
+
+def xbs_faces_to_pbs(xbs) -> "(('X',x3,), ('X',x7,), ('Y',y9,), ...), 'Message'":
+    """Transform faces in XBs notation to PBs notation. No bpy access."""
+    result = list()
     epsilon = 1E-5
     # For each face build a plane...
     for xb in xbs:
@@ -191,18 +242,42 @@ choice_to_pbs = {
 
 def ob_to_pbs(context, ob):
     """Transform Blender object geometry according to ob.bf_pb to FDS notation. Never send None."""
-    # not ob.get("ob_to_pbs_cache") -> precalc not available or modified input conditions
+    # None from cache -> precalc not available or modified input conditions
     DEBUG and print("BFDS: geometry.ob_to_pbs:", ob.name)
-    if not ob.get("ob_to_pbs_cache"): # ob.is_updated does not work here, checked in the handler
-        ob["ob_to_pbs_cache"] = choice_to_pbs[ob.bf_pb](context, ob) # Calculate
-    return ob["ob_to_pbs_cache"]
+    result = cache.get(ob, "pbs")
+    if result is None: # ob.is_updated does not work here, checked in the handler
+        result = choice_to_pbs[ob.bf_pb](context, ob) # Calculate
+        cache.set(ob, "pbs", result)
+    return result
 
 #++ to GEOM
 
 def ob_to_geom(context, ob) -> "mas, fds_verts, fds_faces, msg":
     """Transform Blender object geometry to GEOM FDS notation. Never send a None."""
-    mas, verts, faces = get_trisurface(context, ob)
-    msg = "{} vertices, {} faces".format(len(verts), len(faces))
-    fds_verts = [coo for vert in verts for coo in vert]
-    fds_faces = [i for face in faces for i in face]
-    return mas, fds_verts, fds_faces, msg  # FIXME add caching of results
+    DEBUG and print("BFDS: geometry.ob_to_geom:", ob.name)
+    signature = get_geom_signature(context, ob)
+    result = cache.get(ob, "geom", signature)
+    if result is None: # ob.is_updated does not work here, checked in the handler and by signature
+        mas, verts, faces = get_trisurface(context, ob)
+        msg = "{} vertices, {} faces".format(len(verts), len(faces))
+        fds_verts = [coo for vert in verts for coo in vert]
+        fds_faces = [i for face in faces for i in face]
+        result = mas, fds_verts, fds_faces, msg
+        cache.set(ob, "geom", result, signature)
+    return result
+
+def get_geom_signature(context, ob) -> "str":
+    """Get the signature of the inputs of ob GEOM that do not update ob: materials and settings.
+    The evaluated mesh and the transform are left to the handler, as they are expensive to sign."""
+    mas = tuple(
+        (ma.name, ma.bf_export) if ma else None
+        for ma in (material_slot.material for material_slot in ob.material_slots)
+    )
+    imats = np.empty(len(ob.data.polygons), dtype=np.int16)
+    ob.data.polygons.foreach_get("material_index", imats)
+    sc = context.scene
+    inputs = (
+        mas, hashlib.sha1(imats.tobytes()).hexdigest(), ob.bf_geom_weld_vertices,
+        sc.bf_config_min_edge_length, sc.bf_config_min_face_area,
+    )
+    return hashlib.sha1(repr(inputs).encode("utf-8")).hexdigest()
@@ -1,12 +1,15 @@
 """BlenderFDS, geometric utilities."""
 
 import bpy, bmesh
+import numpy as np
+from contextlib import contextmanager
+from mathutils import Matrix, Vector
 
 ### Working on Blender objects
 
 def object_get_global_copy(context, ob, suffix='_tmp'):
     """Copy object, apply modifiers, apply transformations."""
-    me_tmp = ob.to_mesh(
+    me_tmp = _get_evaluated_object(ob).to_mesh(
         scene=context.scene,
         apply_modifiers=True,
         settings="RENDER",
@@ -20,10 +23,66 @@ def object_get_global_copy(context, ob, suffix='_tmp'):
 
 def get_global_mesh(context, ob) -> "Mesh":
     """Return object mesh modified and transformed in global coordinates."""
-    me = ob.to_mesh(scene=context.scene, apply_modifiers=True, settings="RENDER") # apply modifiers (as in RENDER, not PREVIEW)
+    me = _get_evaluated_object(ob).to_mesh(scene=context.scene, apply_modifiers=True, settings="RENDER") # apply modifiers (as in RENDER, not PREVIEW)
     me.transform(ob.matrix_world) # transform mesh in global coordinates, apply scale, rotation, and location
     return me
 
+# Trailing ARRAY modifiers with constant offsets along the global axes
+# are a regular lattice of copies of the base element, as FDS MULT.
+
+def get_array_lattice(ob) -> "modifiers, (dx,dy,dz), (i_upper,j_upper,k_upper) or None":
+    """Get the trailing ARRAY modifiers of ob and their lattice, or None if not a lattice."""
+    epsilon = 1E-6
+    mds = list()
+    for md in reversed(ob.modifiers):
+        if not md.show_render:
+            continue
+        if md.type != "ARRAY":
+            break
+        if md.fit_type != "FIXED_COUNT" or not md.use_constant_offset or md.use_relative_offset \
+                or md.use_object_offset or md.use_merge_vertices or md.start_cap or md.end_cap:
+            return None
+        mds.append(md)
+    if not mds:
+        return None
+    # Each modifier steps along a different global axis
+    steps, uppers = [0., 0., 0.], [0, 0, 0]
+    matrix = ob.matrix_world.to_3x3()
+    for md in mds:
+        offset = matrix * md.constant_offset_displace
+        axes = [axis for axis in range(3) if abs(offset[axis]) > epsilon]
+        if len(axes) != 1 or uppers[axes[0]]:
+            return None
+        steps[axes[0]], uppers[axes[0]] = offset[axes[0]], md.count - 1
+    return mds, tuple(steps), tuple(uppers)
+
+# The base element is evaluated on a temporary copy of the object,
+# sharing its mesh, without the trailing ARRAY modifiers. The modifier
+# stack of the object is never touched during export: so the object is
+# not updated, and the handler does not invalidate its cached geometries.
+
+_base_obs = dict()  # object name: its temporary copy, evaluated in its place
+
+def _get_evaluated_object(ob) -> "Object":
+    """Get the object to be evaluated in place of ob."""
+    return _base_obs.get(ob.name, ob)
+
+@contextmanager
+def base_element(ob, mds):
+    """Evaluate the global mesh of ob without the trailing modifiers mds, on a temporary copy."""
+    if not mds:
+        yield
+        return
+    ob_tmp = ob.copy()  # shares the mesh, copies the modifiers
+    for md in mds:
+        ob_tmp.modifiers.remove(ob_tmp.modifiers[md.name])
+    _base_obs[ob.name] = ob_tmp
+    try:
+        yield
+    finally:
+        del _base_obs[ob.name]
+        bpy.data.objects.remove(ob_tmp, do_unlink=True)
+
 def set_global_mesh(context, ob, me) -> "None":
     """Set object mesh from mesh in global coordinates."""
     try: me.transform(ob.matrix_world.inverted()) # transform global mesh to local coordinates, apply scale, rotation, and location
@@ -63,6 +122,40 @@ def get_tessfaces(context, me) -> "Mesh tessfaces":
     me.update(calc_tessface=True)
     return me.tessfaces
 
+def get_tessfaces_normals_centers(me) -> "normals, centers":
+    """Get mesh tessfaces normals and centers as (n,3) numpy arrays."""
+    tessfaces = me.tessfaces
+    nfaces = len(tessfaces)
+    normals = np.empty(nfaces * 3, dtype=np.float32)
+    centers = np.empty(nfaces * 3, dtype=np.float32)
+    tessfaces.foreach_get("normal", normals)
+    tessfaces.foreach_get("center", centers)
+    # Same precision as reading face.center from Python
+    return (
+        normals.reshape((nfaces, 3)).astype(np.float64),
+        centers.reshape((nfaces, 3)).astype(np.float64),
+    )
+
+# A mesh of boxes (bf_xb == "BOXES") has 8 vertices and 6 faces for each box, in order.
+# The box IDs are kept in a polygon string layer, set on the first face of each box.
+
+box_id_layer = "bf_box_id"
+
+def set_box_ids(me, ids) -> "None":
+    """Set the IDs of the boxes of mesh me."""
+    layer = me.polygon_layers_string.get(box_id_layer) or me.polygon_layers_string.new(name=box_id_layer)
+    data = layer.data
+    for i, box_id in enumerate(ids):
+        data[i*6].value = box_id.encode("utf8")
+
+def get_box_ids(me) -> "list":
+    """Get the IDs of the boxes of mesh me, empty if not available."""
+    layer = me.polygon_layers_string.get(box_id_layer)
+    if not layer:
+        return list()
+    data = layer.data
+    return [data[i].value.decode("utf8") for i in range(0, len(data) - 5, 6)]
+
 def insert_vertices_into_mesh(me, verts) -> "None":  # FIXME not used
     """Insert vertices into mesh."""
     bm = bmesh.new()
@@ -71,6 +164,67 @@ def insert_vertices_into_mesh(me, verts) -> "None":  # FIXME not used
     bm.to_mesh(me) # Inject bm into me
     bm.free()
 
+def get_mesh_arrays(me) -> "verts, tessfaces, edges":
+    """Get mesh vertices, raw tessfaces and edges as numpy arrays."""
+    me.calc_tessface()
+    verts = np.empty(len(me.vertices) * 3, dtype=np.float32)
+    me.vertices.foreach_get("co", verts)
+    faces = np.empty(len(me.tessfaces) * 4, dtype=np.int32)
+    me.tessfaces.foreach_get("vertices_raw", faces)
+    edges = np.empty(len(me.edges) * 2, dtype=np.int32)
+    me.edges.foreach_get("vertices", edges)
+    # Same precision as reading vertex.co from Python
+    return (
+        verts.reshape((-1, 3)).astype(np.float64),
+        faces.reshape((-1, 4)).astype(np.int64),
+        edges.reshape((-1, 2)).astype(np.int64),
+    )
+
+def set_mesh_arrays(me, verts, faces=None, edges=None, material_indices=None, loop_totals=None) -> "None":
+    """Fill empty mesh me with vertices (n,3), same size faces (n,m), edges (n,2) numpy arrays.
+    If loop_totals (n,) is set, faces of any size are sent as the flat array of their vertices."""
+    # Size the mesh once, then fill it, as from_pydata does element by element
+    me.vertices.add(len(verts))
+    me.vertices.foreach_set("co", np.ascontiguousarray(verts, dtype=np.float32).ravel())
+    if edges is not None and len(edges):
+        me.edges.add(len(edges))
+        me.edges.foreach_set("vertices", np.ascontiguousarray(edges, dtype=np.int32).ravel())
+    if faces is not None and len(faces):
+        if loop_totals is None:
+            nfaces, size = faces.shape
+            loop_totals = np.full(nfaces, size, dtype=np.int32)
+        loop_totals = np.ascontiguousarray(loop_totals, dtype=np.int32)
+        loop_starts = np.cumsum(loop_totals, dtype=np.int32) - loop_totals
+        me.loops.add(int(loop_totals.sum()))
+        me.loops.foreach_set("vertex_index", np.ascontiguousarray(faces, dtype=np.int32).ravel())
+        me.polygons.add(len(loop_totals))
+        me.polygons.foreach_set("loop_start", loop_starts)
+        me.polygons.foreach_set("loop_total", loop_totals)
+        if material_indices is not None:
+            me.polygons.foreach_set("material_index", np.ascontiguousarray(material_indices, dtype=np.int32))
+        me.update(calc_edges=edges is None or not len(edges))
+    else:
+        me.update()
+
+def get_global_mesh_arrays(context, ob) -> "verts, tessfaces, edges":
+    """Get object mesh in global coordinates as numpy arrays."""
+    me = get_global_mesh(context, ob)
+    result = get_mesh_arrays(me)
+    bpy.data.meshes.remove(me, do_unlink=True)
+    return result
+
+def get_triangles(verts, faces) -> "triangles":
+    """Get triangles from vertices and raw tessfaces as a (n,3,3) numpy array."""
+    # Split quads in two triangles (the fourth vertex of a triangle is 0)
+    quads = faces[faces[:, 3] != 0]
+    tris = np.concatenate((faces[:, :3], quads[:, (0, 2, 3)]))
+    return verts[tris]
+
+def get_global_triangles(context, ob) -> "triangles":
+    """Get object triangles in global coordinates as a (n,3,3) numpy array."""
+    verts, faces, _ = get_global_mesh_arrays(context, ob)
+    return get_triangles(verts, faces)
+
 ### Working on bounding box and size
 
 def get_global_bbox(context, ob) -> "x0, x1, y0, y1, z0, z1":
@@ -112,16 +266,66 @@ def get_global_area(context, ob) -> "Float":
 
 ### Working on position
 
+# Object origins are set to the median of their vertices (as ORIGIN_GEOMETRY),
+# by shifting mesh data and object location directly, without operators and selections.
+# A shared mesh is shifted once, and all the objects using it are moved,
+# so they stay in place, as ORIGIN_GEOMETRY does.
+# When many objects are imported, their centering can be deferred and done in bulk.
+
+_deferred_obs = None  # {pointer: ob, } waiting for center position, when deferred
+
 def set_balanced_center_position(context, ob) -> "None":
     """Set object center position"""
+    if _deferred_obs is not None:
+        _deferred_obs[ob.as_pointer()] = ob
+        return
+    set_balanced_center_positions(context, (ob,))
+
+def _get_mesh_users() -> "{mesh pointer: [Object, ...], }":
+    """Get all objects using each mesh."""
+    users = dict()
+    for ob in bpy.data.objects:
+        if ob.type == "MESH":
+            users.setdefault(ob.data.as_pointer(), list()).append(ob)
+    return users
+
+def set_balanced_center_positions(context, obs) -> "None":
+    """Set center position of all objects in obs, and of the other users of their meshes"""
     if context.mode != 'OBJECT': bpy.ops.object.mode_set(mode='OBJECT', toggle=False)
-    # origin_set works on currently selected objects
-    # unselect all, select ob, set origin, and try to revert selections to original
-    active_ob = context.active_object
-    bpy.ops.object.select_all(action='DESELECT')
-    ob.select = True
-    bpy.ops.object.origin_set(type='ORIGIN_GEOMETRY')
-    if active_ob: active_ob.select = True
+    done, users = set(), None
+    for ob in obs:
+        me = ob.data
+        if not me or me.as_pointer() in done:  # shared mesh, already done
+            continue
+        done.add(me.as_pointer())
+        nverts = len(me.vertices)
+        if not nverts:
+            continue
+        co = np.empty(nverts * 3, dtype=np.float32)
+        me.vertices.foreach_get("co", co)
+        center = co.reshape((nverts, 3)).mean(axis=0)
+        if not center.any():
+            continue
+        # Shift mesh data, and move its users of the same local vector
+        me.transform(Matrix.Translation(-Vector(center)))
+        if me.users > 1 and users is None:  # shared mesh, index mesh users once
+            users = _get_mesh_users()
+        for user in me.users > 1 and users[me.as_pointer()] or (ob,):
+            user.matrix_basis = user.matrix_basis * Matrix.Translation(Vector(center))
+
+@contextmanager
+def deferred_center_positions(context):
+    """Defer center position of objects in the block, then set them all at once"""
+    global _deferred_obs
+    if _deferred_obs is not None:  # already deferred
+        yield
+        return
+    _deferred_obs = dict()
+    try:
+        yield
+    finally:
+        obs, _deferred_obs = list(_deferred_obs.values()), None
+        set_balanced_center_positions(context, obs)
 
 def move_xbs(xbs, movement) -> "None":  # FIXME not used
     """Move xbs of movement vector."""
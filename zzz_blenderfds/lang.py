@@ -11,7 +11,7 @@ from . import custom_list_operators
 
 from .types import *
 from . import geometry
-from .fds import tables, mesh
+from .fds import tables, mesh, mult, records
 
 from .utils import is_iterable
 
@@ -127,7 +127,7 @@ def update_bf_xb_voxel_size(self, context):
     """Update function for bf_xb_voxel_size"""
     # Del my tmp object and cached xbs geometry
     self.remove_tmp_obs(context)
-    self["ob_to_xbs_cache"] = False
+    geometry.cache.invalidate(self, kinds=("xbs",))
 
 
 @subscribe
@@ -171,6 +171,41 @@ class OP_XB_center_voxels(BFNoAutoUIMod, BFNoAutoExportMod, BFProp):
         "default": False,
     }
 
+@subscribe
+class OP_XB_optimize_voxels(BFNoAutoUIMod, BFNoAutoExportMod, BFProp):
+    label = "Optimize Voxels"
+    description = "Minimize the number of voxels/pixels by merging them in 3D (slower)"
+    bpy_type = Object
+    bpy_idname = "bf_xb_optimize_voxels"
+    bpy_prop = BoolProperty
+    bpy_other =  {
+        "update": update_bf_xb_voxel_size,
+        "default": False,
+    }
+
+@subscribe
+class OP_XB_mult(BFNoAutoUIMod, BFNoAutoExportMod, BFProp):
+    label = "Use MULT"
+    description = "Export regular patterns of same size boxes as FDS MULT namelists"
+    bpy_type = Object
+    bpy_idname = "bf_xb_mult"
+    bpy_prop = BoolProperty
+    bpy_other =  {
+        "default": False,
+    }
+
+@subscribe
+class OP_XB_array_mult(BFNoAutoUIMod, BFNoAutoExportMod, BFProp):
+    label = "ARRAY as MULT"
+    description = "Export trailing ARRAY modifiers with constant offset along global axes as FDS MULT namelist"
+    bpy_type = Object
+    bpy_idname = "bf_xb_array_mult"
+    bpy_prop = BoolProperty
+    bpy_other =  {
+        "update": update_bf_xb_voxel_size,
+        "default": False,
+    }
+
 def update_bf_default_voxel_size(self, context):
     """Update function for bf_xb_custom_voxel"""
     # Del all tmp objects and all cached geometry
@@ -203,9 +238,9 @@ def update_bf_xb(self, context):
     """Update function for bf_xb"""
     # Delete my tmp object and cached xbs geometry
     self.remove_tmp_obs(context)
-    self["ob_to_xbs_cache"] = False
+    geometry.cache.invalidate(self, kinds=("xbs",))
     # Set other geometries to compatible settings
-    if self.bf_xb in ("VOXELS", "FACES", "PIXELS", "EDGES"):
+    if self.bf_xb in ("VOXELS", "FACES", "PIXELS", "EDGES", "BOXES"):
         if self.bf_xyz == "VERTICES":
             self.bf_xyz = "NONE"
         if self.bf_pb == "PLANES":
@@ -214,7 +249,7 @@ def update_bf_xb(self, context):
 
 @subscribe
 class OP_XB(BFXBProp):
-    bf_props = OP_XB_custom_voxel, OP_XB_voxel_size, OP_XB_center_voxels
+    bf_props = OP_XB_custom_voxel, OP_XB_voxel_size, OP_XB_center_voxels, OP_XB_optimize_voxels, OP_XB_mult, OP_XB_array_mult
     bpy_other = {
         "update": update_bf_xb,
         "items": (
@@ -224,18 +259,25 @@ class OP_XB(BFXBProp):
             ("FACES", "Faces", "Faces, one for each face of this object", 300),
             ("PIXELS", "Pixels", "Export pixels from pixelized flat object", 400),
             ("EDGES", "Edges", "Segments, one for each edge of this object", 500),
+            ("BOXES", "Boxes", "Boxes, one for each box of this object, with their own IDs", 600),
         ),
         "default": 'NONE',  # Cannot be "BBOX", beware in import!
     }
-    allowed_items = "NONE", "BBOX", "VOXELS", "FACES", "PIXELS", "EDGES"
+    allowed_items = "NONE", "BBOX", "VOXELS", "FACES", "PIXELS", "EDGES", "BOXES"
 
     def _draw_body(self, context, layout):
         super()._draw_body(context, layout)
+        if self.element.bf_xb in ("BBOX", "VOXELS", "FACES", "PIXELS") and self.element.bf_namelist_cls in ("ON_OBST", "ON_HOLE", "ON_VENT"):
+            row = layout.row()
+            if self.element.bf_xb != "BBOX":
+                row.prop(self.element, "bf_xb_mult")
+            row.prop(self.element, "bf_xb_array_mult")
         if not self.element.bf_xb in ("VOXELS", "PIXELS"):
             return
-        # center voxels
+        # center and optimize voxels
         row = layout.row()
         row.prop(self.element, "bf_xb_center_voxels")
+        row.prop(self.element, "bf_xb_optimize_voxels")
         # voxel_size
         row = layout.row()
         layout_export, layout_custom = row.column(), row.column()
@@ -246,6 +288,9 @@ class OP_XB(BFXBProp):
     def _format_xb(self, value):
         return "XB={0[0]:.6f},{0[1]:.6f},{0[2]:.6f},{0[3]:.6f},{0[4]:.6f},{0[5]:.6f}".format(value)
 
+    def _format_xb_id(self, value, name):
+        return "ID='{1}' XB={0[0]:.6f},{0[1]:.6f},{0[2]:.6f},{0[3]:.6f},{0[4]:.6f},{0[5]:.6f}".format(value, name)
+
     def _format_xb_idi(self, value, name, i):
         return "ID='{1}_{2}' XB={0[0]:.6f},{0[1]:.6f},{0[2]:.6f},{0[3]:.6f},{0[4]:.6f},{0[5]:.6f}".format(value, name, i)
 
@@ -287,21 +332,72 @@ class OP_XB(BFXBProp):
         scale_length = context.scene.unit_settings.scale_length
         xbs = [[coo * scale_length for coo in xb] for xb in xbs]
         # Prepare
+        if bf_xb == "BOXES":
+            # Use the box IDs, or build them
+            ids = geometry.utils.get_box_ids(self.element.data)
+            name = self.element.name
+            return [
+                self._format_xb_id(xb, i < len(ids) and ids[i] or "{}_{}".format(name, i))
+                for i, xb in enumerate(xbs)
+            ]
+        array_mult = geometry.to_fds.get_array_mult(self.element)
+        if array_mult:
+            # The xbs are of the base element, copied by the MULT of the ARRAY modifiers
+            return self._format_array_mult(xbs, array_mult, scale_length)
         if len(xbs) == 1:
             return self._format_xb(xbs[0])
-        else:
-            _format_xb = {
-                "IDI" :   self._format_xb_idi,
-                "IDX" :   self._format_xb_idx,
-                "IDY" :   self._format_xb_idy,
-                "IDZ" :   self._format_xb_idz,
-                "IDXY" :  self._format_xb_idxy,
-                "IDXZ" :  self._format_xb_idxz,
-                "IDYZ" :  self._format_xb_idyz,
-                "IDXYZ" : self._format_xb_idxyz,
-            }[self.element.bf_id_suffix]
-            name = self.element.name
-            return [_format_xb(xb, name, i) for i, xb in enumerate(xbs)]
+        if self.element.bf_xb_mult and self.element.bf_namelist_cls in ("ON_OBST", "ON_HOLE", "ON_VENT"):
+            # Send regular patterns of boxes to MULT, if they give back the same boxes
+            lattices = mult.get_lattices(xbs)
+            if len(lattices) < len(xbs) and mult.check_lattices(xbs, lattices):
+                self.infos.append("MULT: {} boxes in {} lattices".format(len(xbs), len(lattices)))
+                return self._format_lattices(lattices)
+        _format_xb = self._get_format_xb()
+        name = self.element.name
+        return [_format_xb(xb, name, i) for i, xb in enumerate(xbs)]
+
+    def _get_format_xb(self):
+        return {
+            "IDI" :   self._format_xb_idi,
+            "IDX" :   self._format_xb_idx,
+            "IDY" :   self._format_xb_idy,
+            "IDZ" :   self._format_xb_idz,
+            "IDXY" :  self._format_xb_idxy,
+            "IDXZ" :  self._format_xb_idxz,
+            "IDYZ" :  self._format_xb_idyz,
+            "IDXYZ" : self._format_xb_idxyz,
+        }[self.element.bf_id_suffix]
+
+    def _format_array_mult(self, xbs, array_mult, scale_length):
+        """Format boxes referencing the MULT of the ARRAY modifiers, and append it to self.mults."""
+        _, steps, uppers = array_mult
+        mult_id = "{}_array".format(self.element.name)
+        lattice = xbs[0], [step * scale_length for step in steps], uppers
+        self.mults.append(mult.get_mult_record(mult_id, lattice))
+        self.infos.append("MULT: {} copies from ARRAY modifiers".format(mult.get_lattice_size(lattice)))
+        if len(xbs) == 1:
+            return "{} MULT_ID='{}'".format(self._format_xb(xbs[0]), mult_id)
+        _format_xb = self._get_format_xb()
+        name = self.element.name
+        return ["{} MULT_ID='{}'".format(_format_xb(xb, name, i), mult_id) for i, xb in enumerate(xbs)]
+
+    def _format_lattices(self, lattices):
+        """Format lattices base boxes, and append their MULT namelists to self.mults."""
+        name = self.element.name
+        if len(lattices) == 1:
+            mult_id = "{}_mult".format(name)
+            self.mults.append(mult.get_mult_record(mult_id, lattices[0]))
+            return "{} MULT_ID='{}'".format(self._format_xb(lattices[0][0]), mult_id)
+        _format_xb = self._get_format_xb()
+        params = list()
+        for i, lattice in enumerate(lattices):
+            param = _format_xb(lattice[0], name, i)
+            if mult.get_lattice_size(lattice) > 1:
+                mult_id = "{}_mult_{}".format(name, i)
+                self.mults.append(mult.get_mult_record(mult_id, lattice))
+                param = "{} MULT_ID='{}'".format(param, mult_id)
+            params.append(param)
+        return params
 
     def from_fds(self, context, value):
         try:
@@ -325,11 +421,11 @@ class OP_XB_bbox(OP_XB):
 
 @subscribe
 class OP_XB_solid(OP_XB):
-    allowed_items = "NONE", "BBOX", "VOXELS"
+    allowed_items = "NONE", "BBOX", "VOXELS", "BOXES"
 
 @subscribe
 class OP_XB_faces(OP_XB):
-    allowed_items = "NONE", "FACES", "PIXELS"
+    allowed_items = "NONE", "FACES", "PIXELS", "BOXES"
 
 # XYZ
 
@@ -337,10 +433,10 @@ def update_bf_xyz(self, context):
     """Update function for bf_xyz"""
     # Delete my tmp object and cached xyzs geometry
     self.remove_tmp_obs(context)
-    self["ob_to_xyzs_cache"] = False
+    geometry.cache.invalidate(self, kinds=("xyzs",))
     # Set other geometries to compatible settings
     if self.bf_xyz == "VERTICES":
-        if self.bf_xb in ("VOXELS", "FACES", "PIXELS", "EDGES"):
+        if self.bf_xb in ("VOXELS", "FACES", "PIXELS", "EDGES", "BOXES"):
             self.bf_xb = "NONE"
         if self.bf_pb == "PLANES":
             self.bf_pb = "NONE"
@@ -438,10 +534,10 @@ def update_bf_pb(self, context):
     """Update function for bf_pb"""
     # Delete my tmp object and cached pbs geometry
     self.remove_tmp_obs(context)
-    self["ob_to_pbs_cache"] = False
+    geometry.cache.invalidate(self, kinds=("pbs",))
     # Set other geometries to compatible settings
     if self.bf_pb == "PLANES":
-        if self.bf_xb in ("VOXELS", "FACES", "PIXELS", "EDGES"): self.bf_xb = "NONE"
+        if self.bf_xb in ("VOXELS", "FACES", "PIXELS", "EDGES", "BOXES"): self.bf_xb = "NONE"
         if self.bf_xyz == "VERTICES": self.bf_xyz = "NONE"
 
 # @subscribe OP_PB later, because OP_PB* are defined later
@@ -677,12 +773,52 @@ class SP_config_min_face_area(BFProp):
         "default": 1E-08,
     }
 
+@subscribe
+class SP_config_voxel_engine(BFProp):
+    label = "Voxelization"
+    description = "Voxelization engine"
+    bpy_type = Scene
+    bpy_idname = "bf_config_voxel_engine"
+    bpy_prop = EnumProperty
+    bpy_other = {
+        "items": (
+            ("REMESH", "Remesh", "Voxelize by Blender remesh modifier, limited in size", 100),
+            ("SCANLINE", "Scanline", "Voxelize by scanline rasterization, for closed objects of any size", 200),
+        ),
+        "update": update_bf_default_voxel_size,
+        "default": "REMESH",
+    }
+
+@subscribe
+class SP_config_processes(BFProp):
+    label = "Processes"
+    description = "Number of parallel processes for scanline voxelization and geometry export"
+    bpy_type = Scene
+    bpy_idname = "bf_config_processes"
+    bpy_prop = IntProperty
+    bpy_other = {
+        "min": 1,
+        "max": 256,
+        "default": 1,
+    }
+
+@subscribe
+class SP_config_disk_cache(BFProp):
+    label = "Disk Cache"
+    description = "Cache voxels/pixels on disk, in the bf_cache directory next to the .blend file"
+    bpy_type = Scene
+    bpy_idname = "bf_config_disk_cache"
+    bpy_prop = BoolProperty
+    bpy_other = {
+        "default": False,
+    }
+
 @subscribe
 class SN_config(BFNoAutoExportMod, BFNamelist):
     label = "Case configuration"
     enum_id = 3008
     bpy_type = Scene
-    bf_props = SP_HEAD_directory, SP_HEAD_free_text, SP_default_voxel_size, SP_config_min_edge_length, SP_config_min_face_area
+    bf_props = SP_HEAD_directory, SP_HEAD_free_text, SP_default_voxel_size, SP_config_voxel_engine, SP_config_processes, SP_config_disk_cache, SP_config_min_edge_length, SP_config_min_face_area
 
 
 # TIME
@@ -1687,6 +1823,9 @@ class OP_GEOM(BFProp):  # FIXME FIXME FIXME this is an hack!
     label = "Triangulated geometry"
     description = "Triangulated geometry vertices and faces"
     bpy_type = Object
+    bpy_other = {
+        "precision": 6,
+    }
 
     def to_fds(self, context):  # FIXME
         # Check is performed while exporting
@@ -1699,19 +1838,35 @@ class OP_GEOM(BFProp):  # FIXME FIXME FIXME this is an hack!
         # Correct for scale_lenght
         scale_length = context.scene.unit_settings.scale_length
         fds_verts = [coo * scale_length for coo in fds_verts]
-        # Group by 3 and 4
-        verts = [t for t in zip(*[iter(fds_verts)]*3)]
-        faces = [t for t in zip(*[iter(fds_faces)]*4)]
-        # Prepare
+        # Prepare, formatting by 3 and 4 in chunks
+        precision = self.bpy_other.get("precision", 6)
         surfids_str = ','.join(("'{}'".format(s) for s in fds_surfids))
-        verts_str = ""
-        for v in verts:
-            verts_str += "\n            {0[0]:.6f}, {0[1]:.6f}, {0[2]:.6f},".format(v)
-        faces_str = ""
-        for f in faces:
-            faces_str += "\n            {0[0]},{0[1]},{0[2]}, {0[3]},".format(f)
+        verts_str = "".join(records.rows_to_fds_chunks(
+            fds_verts, "\n            {{:.{0}f}}, {{:.{0}f}}, {{:.{0}f}},".format(precision), 3,
+        ))
+        faces_str = "".join(records.rows_to_fds_chunks(
+            fds_faces, "\n            {},{},{}, {},", 4,
+        ))
         return "SURF_ID={}\n      VERTS={}\n      FACES={}".format(surfids_str, verts_str, faces_str)
 
+def update_bf_geom_weld_vertices(self, context):
+    """Update function for bf_geom_weld_vertices"""
+    # Del my tmp object and cached geom geometry
+    self.remove_tmp_obs(context)
+    geometry.cache.invalidate(self, kinds=("geom",))
+
+@subscribe
+class OP_GEOM_weld_vertices(BFNoAutoExportMod, BFProp):
+    label = "Weld Vertices"
+    description = "Weld duplicate vertices, closer than Min Edge Length, instead of reporting them"
+    bpy_type = Object
+    bpy_idname = "bf_geom_weld_vertices"
+    bpy_prop = BoolProperty
+    bpy_other =  {
+        "update": update_bf_geom_weld_vertices,
+        "default": False,
+    }
+
 @subscribe
 class ON_GEOM(BFNamelist):
     label = "GEOM"
@@ -1720,7 +1875,7 @@ class ON_GEOM(BFNamelist):
     fds_label = "GEOM"
     bpy_type = Object
     bf_prop_export = OP_export
-    bf_props = OP_ID, OP_FYI, OP_GEOM, OP_free
+    bf_props = OP_ID, OP_FYI, OP_GEOM, OP_GEOM_weld_vertices, OP_free
     bf_other = {
         "draw_type": "SOLID",
     }
@@ -0,0 +1,207 @@
+"""BlenderFDS, benchmark routines, run them inside Blender"""
+
+import bpy
+from time import time
+
+from .term_colors import *
+
+# Objects export
+
+def _new_objects_scene(n, children_per_parent=10):
+    """Create a new Scene with n mesh Objects, parented in small families."""
+    sc = bpy.data.scenes.new("benchmark_{}".format(n))
+    bpy.context.screen.scene = sc
+    me = bpy.data.meshes.new("benchmark_mesh")
+    me.from_pydata(((0,0,0),(1,0,0),(0,1,0),(0,0,1)), (), ((0,1,2),(0,1,3),(0,2,3),(1,2,3)))
+    parent = None
+    for i in range(n):
+        ob = bpy.data.objects.new("benchmark_{}_{:06d}".format(n, i), me)
+        sc.objects.link(ob)
+        if i % children_per_parent:
+            ob.parent = parent
+        else:
+            parent = ob
+        ob.bf_xb = "BBOX"
+    sc.update()
+    return sc
+
+def _remove_scene(sc):
+    """Remove Scene and its Objects."""
+    for ob in sc.objects:
+        bpy.data.objects.remove(ob, do_unlink=True)
+    bpy.data.scenes.remove(sc, do_unlink=True)
+
+def benchmark_children_to_fds(ns=(500, 1000, 2000, 4000)):
+    """Check that Objects export time scales linearly with their number."""
+    print_h2("Benchmark Object._children_to_fds")
+    results = list()
+    for n in ns:
+        sc = _new_objects_scene(n)
+        t0 = time()
+        for body in bpy.types.Object._children_to_fds(self=None, context=bpy.context): pass
+        dt = time() - t0
+        results.append((n, dt))
+        print("{:6d} objects: {:.3f} s, {:.1f} us/object".format(n, dt, dt / n * 1E6))
+        _remove_scene(sc)
+    # Linear scaling: time per object is roughly constant
+    (n0, dt0), (n1, dt1) = results[0], results[-1]
+    ratio = (dt1 / n1) / (dt0 / n0)
+    msg = "Time per object ratio ({} vs {} objects): {:.2f}".format(n1, n0, ratio)
+    if ratio < 2.: print_ok(msg)
+    else: print_fail(msg)
+
+# Parallel geometry export
+
+def _new_voxels_scene(n, engine):
+    """Create a new Scene with n voxelized sphere Objects."""
+    sc = bpy.data.scenes.new("benchmark_voxels_{}".format(n))
+    bpy.context.screen.scene = sc
+    sc.bf_config_voxel_engine = engine
+    for i in range(n):
+        bpy.ops.mesh.primitive_uv_sphere_add(location=(i % 20 * 2.5, i // 20 * 2.5, 0.))
+        ob = bpy.context.active_object
+        ob.name = "benchmark_voxels_{}_{:06d}".format(n, i)
+        ob.bf_namelist_cls = "ON_OBST"
+        ob.bf_xb, ob.bf_xb_custom_voxel, ob.bf_xb_voxel_size = "VOXELS", True, .05
+    sc.update()
+    return sc
+
+def benchmark_parallel_geometry(n=400, processes=(1, 2, 4), engine="SCANLINE"):
+    """Check that voxelized Objects export time scales with the number of processes."""
+    print_h2("Benchmark geometry.parallel.calc_geometries, {} voxelization".format(engine))
+    from ..geometry import parallel, cache
+    sc = _new_voxels_scene(n, engine)
+    results = list()
+    for nprocesses in processes:
+        cache.clear()
+        t0 = time()
+        if nprocesses > 1:
+            parallel.calc_geometries(bpy.context, sc.objects, nprocesses)
+        for ob in sc.objects: ob.to_fds(context=bpy.context)
+        dt = time() - t0
+        results.append((nprocesses, dt))
+        print("{:3d} processes: {:.3f} s".format(nprocesses, dt))
+    cache.clear()
+    _remove_scene(sc)
+    (p0, dt0), (p1, dt1) = results[0], results[-1]
+    msg = "Speedup ({} vs {} processes): {:.2f}".format(p1, p0, dt0 / dt1)
+    if dt0 / dt1 > 1.: print_ok(msg)
+    else: print_fail(msg)
+
+# FDS file tokenizer
+
+def _new_fds_text(nverts=300000, nobsts=20000):
+    """Get an FDS text with a large GEOM and many OBSTs."""
+    verts = ",".join("{:.3f}".format(i * .001) for i in range(nverts * 3))
+    faces = ",".join(str(i % nverts + 1) for i in range(nverts * 2))
+    obsts = "".join("&OBST ID='obst_{}' XB=1,2,3,4,5,6 SURF_ID='A' /\n".format(i) for i in range(nobsts))
+    return "&HEAD CHID='benchmark' /\n&GEOM ID='geom', SURF_ID='A',\n  VERTS={},\n  FACES={} /\n{}&TAIL /\n".format(verts, faces, obsts)
+
+def benchmark_tokenize():
+    """Check that the tokenizer scanners are faster than the regex and give the same result."""
+    print_h2("Benchmark fds.to_py scanners vs regex")
+    from ..fds import to_py
+    text = _new_fds_text()
+    t0 = time()
+    nls_re = to_py._extract_namelists(text)
+    params_re = [to_py._extract_params(nl[2]) for nl in nls_re]
+    dt_re = time() - t0
+    t0 = time()
+    nls = to_py.scan_namelists(text)
+    params = [to_py._scan_params(nl[2]) for nl in nls]
+    dt = time() - t0
+    print("{:.1f} MB, regex: {:.3f} s, scanners: {:.3f} s".format(len(text) / 1E6, dt_re, dt))
+    if nls != nls_re or params != params_re: print_fail("Different tokens")
+    elif dt < dt_re: print_ok("Speedup: {:.2f}".format(dt_re / dt))
+    else: print_fail("Speedup: {:.2f}".format(dt_re / dt))
+
+# Mesh builders
+
+def benchmark_mesh_builders(n=100000):
+    """Check that the array-based mesh builders are faster than from_pydata."""
+    print_h2("Benchmark geometry.from_fds.xbs_bbox_to_mesh vs from_pydata")
+    from ..geometry import from_fds
+    xbs = [(i, i+1., 0., 1., 0., 1.) for i in range(n)]
+    t0 = time()
+    verts, faces = list(), list()
+    for i, (x0, x1, y0, y1, z0, z1) in enumerate(xbs):
+        j = i * 8
+        verts.extend(((x0,y0,z0), (x1,y0,z0), (x1,y1,z0), (x0,y1,z0), (x0,y0,z1), (x1,y0,z1), (x1,y1,z1), (x0,y1,z1)))
+        faces.extend(((0+j,3+j,2+j,1+j), (0+j,1+j,5+j,4+j), (0+j,4+j,7+j,3+j), (6+j,5+j,1+j,2+j), (6+j,2+j,3+j,7+j), (6+j,7+j,4+j,5+j)))
+    me_ref = bpy.data.meshes.new("benchmark_from_pydata")
+    me_ref.from_pydata(verts, (), faces)
+    dt_ref = time() - t0
+    t0 = time()
+    me = from_fds.xbs_bbox_to_mesh(xbs)
+    dt = time() - t0
+    print("{} boxes, from_pydata: {:.3f} s, foreach_set: {:.3f} s".format(n, dt_ref, dt))
+    same = len(me.vertices) == len(me_ref.vertices) and len(me.polygons) == len(me_ref.polygons) and len(me.edges) == len(me_ref.edges)
+    bpy.data.meshes.remove(me_ref, do_unlink=True)
+    bpy.data.meshes.remove(me, do_unlink=True)
+    if not same: print_fail("Different meshes")
+    elif dt < dt_ref: print_ok("Speedup: {:.2f}".format(dt_ref / dt))
+    else: print_fail("Speedup: {:.2f}".format(dt_ref / dt))
+
+# Duplicate vertices
+
+def benchmark_duplicate_verts(n=200000):
+    """Check that the grid hash finds the same duplicate vertices as the KDTree, faster."""
+    print_h2("Benchmark geometry.calc_trisurfaces grid hash vs KDTree")
+    import numpy as np, mathutils
+    from ..geometry import calc_trisurfaces
+    epsilon = 1E-5
+    verts = np.random.random((n, 3)) * 100.
+    verts = np.concatenate((verts, verts[:n//100] + epsilon / 3.))
+    t0 = time()
+    kd = mathutils.kdtree.KDTree(len(verts))
+    for i, co in enumerate(verts.tolist()):
+        kd.insert(co, i)
+    kd.balance()
+    bad_verts = set()
+    for co in verts.tolist():
+        vert_group = [i for (_, i, _) in kd.find_range(co, epsilon)]
+        if len(vert_group) > 1:
+            bad_verts.update(vert_group)
+    dt_ref = time() - t0
+    t0 = time()
+    result = calc_trisurfaces._get_duplicate_verts(verts, epsilon)
+    dt = time() - t0
+    print("{} vertices, KDTree: {:.3f} s, grid hash: {:.3f} s".format(len(verts), dt_ref, dt))
+    if sorted(bad_verts) != result.tolist(): print_fail("Different duplicate vertices")
+    elif dt < dt_ref: print_ok("Speedup: {:.2f}".format(dt_ref / dt))
+    else: print_fail("Speedup: {:.2f}".format(dt_ref / dt))
+
+# GEOM serializer
+
+def benchmark_geom_to_fds(n=300000):
+    """Check that the chunked GEOM serializer is faster than concatenation and gives the same string."""
+    print_h2("Benchmark fds.records.rows_to_fds_chunks vs concatenation")
+    from ..fds import records
+    fds_verts = [i * .001 for i in range(n * 3)]
+    fds_faces = [i % n + 1 for i in range(n * 4)]
+    t0 = time()
+    verts_ref = ""
+    for v in zip(*[iter(fds_verts)]*3):
+        verts_ref += "\n            {0[0]:.6f}, {0[1]:.6f}, {0[2]:.6f},".format(v)
+    faces_ref = ""
+    for f in zip(*[iter(fds_faces)]*4):
+        faces_ref += "\n            {0[0]},{0[1]},{0[2]}, {0[3]},".format(f)
+    dt_ref = time() - t0
+    t0 = time()
+    verts_str = "".join(records.rows_to_fds_chunks(fds_verts, "\n            {:.6f}, {:.6f}, {:.6f},", 3))
+    faces_str = "".join(records.rows_to_fds_chunks(fds_faces, "\n            {},{},{}, {},", 4))
+    dt = time() - t0
+    print("{} vertices and faces, concatenation: {:.3f} s, chunks: {:.3f} s".format(n, dt_ref, dt))
+    if verts_str != verts_ref or faces_str != faces_ref: print_fail("Different strings")
+    elif dt < dt_ref: print_ok("Speedup: {:.2f}".format(dt_ref / dt))
+    else: print_fail("Speedup: {:.2f}".format(dt_ref / dt))
+
+def main():
+    print_h1("BlenderFDS benchmarks")
+    benchmark_children_to_fds()
+    benchmark_parallel_geometry(engine="SCANLINE")
+    benchmark_parallel_geometry(engine="REMESH")
+    benchmark_tokenize()
+    benchmark_mesh_builders()
+    benchmark_duplicate_verts()
+    benchmark_geom_to_fds()
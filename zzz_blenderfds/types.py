@@ -1,12 +1,14 @@
 """BlenderFDS, types"""
 
 import bpy, time, sys
+from collections import OrderedDict
 from bpy.props import *
 from bpy.types import Scene, Object, Material
 
 from . import config, geometry, fds
 from .exceptions import BFException
 from .utils import is_iterable, ClsList
+from .fds.records import FDSParam, FDSNamelist
 
 DEBUG = False
 
@@ -80,6 +82,7 @@ class _BFCommon():
             self.bf_props = ClsList((bf_prop(element) for bf_prop in self.bf_props))
         # Init exporting variables
         self.infos = list()
+        self.mults = list()  # FDSNamelist of MULT, referenced by my params
 
     def __repr__(self):
         return "{__class__.__name__!s}(element={element!r})".format(
@@ -238,35 +241,23 @@ class BFProp(_BFCommon):
 
     # Export
 
-    def format(self, context, value):
-        """Format to FDS notation."""
-        # Expected output:
-        #   ID='example' or PI=3.14 or COLOR=3,4,5
+    def format(self, context, value) -> "FDSParam or None":
+        """Format to FDS param record."""
         if value is None:
             return None
         # If value is not an iterable, then put it in a tuple
         if not is_iterable(value):
             values = tuple((value,))
         else:
-            values = value
-        # Check first element of the iterable and choose formatting
-        if   isinstance(values[0], bool):
-            value = ",".join(value and ".TRUE." or ".FALSE." for value in values)
-        elif isinstance(values[0], int):
-            value = ",".join(str(value) for value in values)
-        elif isinstance(values[0], float):
-            value = ",".join("{:.{}f}".format(value, self.bpy_other.get("precision",3)) for value in values)
-        elif isinstance(values[0], str) and value: # value is not ""
-            value = ",".join("'{}'".format(value) for value in values)
-        else:
+            values = tuple(value)
+        # Check first element of the iterable, unknown types are not exported
+        if not isinstance(values[0], (bool, int, float)) and \
+            not (isinstance(values[0], str) and value): # value is not ""
             return None
-        # Return
-        if self.fds_label:
-            return "=".join((self.fds_label, value))
-        return str(value)
+        return FDSParam(self.fds_label, values, precision=self.bpy_other.get("precision",3))
 
-    def to_fds(self, context) -> "str or None":
-        """Get my exported FDS string, on error raise BFException."""
+    def to_fds(self, context) -> "FDSParam, str, list, or None":
+        """Get my exported FDS param record (or raw FDS string), on error raise BFException."""
         if not self.get_exported(context):
             return None
         self.check(context)
@@ -338,48 +329,23 @@ class BFNamelist(_BFCommon):
 
     # Export
 
-    def format(self, context, params):
-        """Format to FDS notation."""
-        # Expected output:
-        # ! name: info message 1
-        # ! name: info message 2
-        # &OBST ID='example' XB=... /\n
-        # &OBST ID='example' XB=... /\n
-
+    def format(self, context, params) -> "FDSNamelist":
+        """Format to FDS namelist record."""
         # Set fds_label, if empty use first param (OP_free_namelist)
-        fds_label = "".join(("&", self.fds_label or params.pop(0), " "))
-        # Set info
+        fds_label = self.fds_label or fds.records.param_to_fds(params.pop(0))
+        # Set infos
         infos = [is_iterable(info) and info[0] or info for info in self.infos]
-        info = "".join(("! {}\n".format(info) for info in infos))
-        # Extract the first and only multiparams from params
-        multiparams = None
-        for param in params:
-            if is_iterable(param):
-                multiparams = param
-                params.remove(param)
-                # ... then remove ordinary single ID
-                for param in params:
-                    if param[:3] == "ID=":
-                        params.remove(param)
-                        break
-                break
-        # ... and join remaining params + namelist closure
-        params.append("/\n")
-        param = self.fds_separator.join(params)
-        # Build namelists, set body
-        # &fds_label multiparam param /
-        if multiparams:
-            body = "".join((
-                self.fds_separator.join(("".join((fds_label, multiparam)), param)) for multiparam in multiparams
-            ))
-        else:
-            body = "".join((fds_label, param))
-        # Return
-        return "".join((info, body))
+        return FDSNamelist(fds_label, params, infos, self.fds_separator, self.mults)
 
     def to_fds(self, context) -> "str or None":
-        """Get my exported FDS string, on error raise BFException."""
-        DEBUG and print("BFDS: BFNamelist.to_fds:", str(self))
+        """Get my exported FDS string, rendered from my record, on error raise BFException."""
+        record = self.to_fds_record(context)
+        if record:
+            return record.to_fds()
+
+    def to_fds_record(self, context) -> "FDSNamelist or None":
+        """Get my exported FDS namelist record, on error raise BFException."""
+        DEBUG and print("BFDS: BFNamelist.to_fds_record:", str(self))
         # Check self
         if not self.get_exported(context):
             return None
@@ -397,6 +363,7 @@ class BFNamelist(_BFCommon):
                 if param:
                     params.append(param)
                 self.infos.extend(bf_prop.infos)
+                self.mults.extend(bf_prop.mults)
         # Re-raise occurred errors
         if errors:
             raise BFException(self, "Following errors reported", errors)
@@ -479,10 +446,7 @@ class BFStringProp(BFProp):
 
     def format(self, context, value):
         if value:
-            if self.fds_label:
-                return "{}='{}'".format(self.fds_label, value)
-            else:
-                return str(value)
+            return FDSParam(self.fds_label, (value,), quoted=bool(self.fds_label))
 
 
 class BFFYIProp(BFStringProp):
@@ -581,9 +545,11 @@ class BFNoAutoUIMod():  # No automatic UI (eg. my UI is managed elsewhere)
 
 class BFNoAutoExportMod():  # No automatic export (eg. my export is managed elsewhere)
     def to_fds(self, context):
-        if not self.get_exported(context):
-            return None
-        self.check(context)
+        self.to_fds_record(context)
+
+    def to_fds_record(self, context):
+        if self.get_exported(context):
+            self.check(context)
 
 
 class BFNoAutoImportMod():  # No automatic import (eg. my import is managed elsewhere)
@@ -610,11 +576,15 @@ class BFScene():
         Scene._header_to_fds = cls._header_to_fds
         Scene._free_text_to_fds = cls._free_text_to_fds
         Scene._children_to_fds = cls._children_to_fds
+        Scene.to_fds_chunks = cls.to_fds_chunks
         Scene.to_fds = cls.to_fds
         Scene.to_ge1 = cls.to_ge1
         Scene._get_imported_bf_namelist_cls = cls._get_imported_bf_namelist_cls
         Scene._get_imported_element = cls._get_imported_element
         Scene._save_imported_unmanaged_tokens = cls._save_imported_unmanaged_tokens
+        Scene._import_token = cls._import_token
+        Scene._get_imported_boxes_key = cls._get_imported_boxes_key
+        Scene._import_boxes = cls._import_boxes
         Scene.from_fds = cls.from_fds
 
     @classmethod
@@ -650,23 +620,19 @@ class BFScene():
             bodies.append("\n")
         return bodies
 
-    def _children_to_fds(self, context) -> "list":
-        """Export children in FDS notation."""
-        # Init
-        bodies = list()
+    def _children_to_fds(self, context) -> "generator":
+        """Export children in FDS notation, one chunk at a time."""
         # Materials
-        bodies.append("\n! --- Boundary conditions (from Blender Materials)\n")
+        yield "\n! --- Boundary conditions (from Blender Materials)\n"
         mas = [ma for ma in bpy.data.materials]
         mas.sort(key=lambda k: k.name)  # Alphabetic order by element name
         for ma in mas:
             body = ma.to_fds(context)
             if body:
-                bodies.append(body)
+                yield body
         # Objects
-        bodies.append("\n! --- Geometric entities (from Blender Objects)\n")
-        bodies.extend(Object._children_to_fds(self=None, context=context))
-        # Return
-        return bodies
+        yield "\n! --- Geometric entities (from Blender Objects)\n"
+        yield from Object._children_to_fds(self=None, context=context)
 
     def _header_to_fds(self, context) -> "tuple":
         """Export header in FDS notation."""
@@ -699,24 +665,25 @@ class BFScene():
                 bodies.append("\n")
         return bodies
 
-    def to_fds(self, context, with_children=False) -> "str or None":
-        """Export myself and children (full FDS case) in FDS notation."""
+    def to_fds_chunks(self, context, with_children=False) -> "generator":
+        """Export myself and children (full FDS case) in FDS notation, one chunk at a time."""
         # Init
         t0 = time.time()
-        bodies = list()
         # Header, Scene, free_text
         if with_children:
-            bodies.extend(self._header_to_fds(context))
-        bodies.extend(self._myself_to_fds(context))
-        bodies.extend(self._free_text_to_fds(context))
+            yield from self._header_to_fds(context)
+        yield from self._myself_to_fds(context)
+        yield from self._free_text_to_fds(context)
         # Materials, objects, TAIL
         if with_children:
-            bodies.extend(self._children_to_fds(context))
-            bodies.append("&TAIL /\n! Generated in {0:.0f} s.".format(
-                (time.time()-t0))
+            yield from self._children_to_fds(context)
+            yield "&TAIL /\n! Generated in {0:.0f} s.".format(
+                (time.time()-t0)
             )
-        # Return
-        return "".join(bodies)
+
+    def to_fds(self, context, with_children=False) -> "str or None":
+        """Export myself and children (full FDS case) in FDS notation."""
+        return "".join(self.to_fds_chunks(context, with_children))
 
     def to_ge1(self, context) -> "str or None":
         """Export my geometry in FDS GE1 notation."""
@@ -774,38 +741,102 @@ class BFScene():
         # Write merged contents
         bpy.data.texts[bf_head_free_text].from_string("\n".join(free_texts))
 
-    def from_fds(self, context, value):
-        """Import a text in FDS notation into self."""
-        tokens = None
+    def _import_token(self, context, token, free_texts) -> "bool":
+        """Import token into self, append unmanaged texts and errors to free_texts, return True if errors."""
+        # Init
+        fds_label, fds_params, fds_original = token
+        # Search managed FDS namelist, and import token
+        bf_namelist_cls = self._get_imported_bf_namelist_cls(
+            context, fds_label, fds_params)
+        if bf_namelist_cls:
+            # This FDS namelists is managed:
+            # get element, instanciate and import BFNamelist
+            element = self._get_imported_element(
+                context, bf_namelist_cls, fds_label)
+            try:
+                bf_namelist_cls(element).from_fds(context, fds_params)
+            except BFException as err:
+                free_texts.extend(err.free_texts)
+                return True
+        else:
+            # This FDS namelists is not managed
+            free_texts.append(fds_original)
+        return False
+
+    # Many simple OBST, HOLE, VENT namelists with the same non geometric
+    # parameters are imported into one object, with one box for each namelist
+    # and its ID. The object is then exported with the same IDs and XBs.
+
+    def _get_imported_boxes_key(self, context, token) -> "key or None":
+        """Get the key of the token group that can be merged into boxes, or None."""
+        fds_label, fds_params, fds_original = token
+        if fds_label not in ("OBST", "HOLE", "VENT") or "XB" not in fds_params:
+            return None
+        if any(label in fds_params for label in ("XYZ", "PBX", "PBY", "PBZ")):
+            return None
+        try:
+            if len(fds_params["XB"][0]) != 6:
+                return None
+        except TypeError:
+            return None
+        return (fds_label,) + tuple(sorted(
+            (label, fds_value)
+            for label, (value, fds_value) in fds_params.items() if label not in ("ID", "XB")
+        ))
+
+    def _import_boxes(self, context, tokens, free_texts) -> "bool":
+        """Import tokens into one object of boxes, append errors to free_texts, return True if errors."""
+        fds_label, fds_params, fds_original = tokens[0]
+        bf_namelist_cls = self._get_imported_bf_namelist_cls(
+            context, fds_label, fds_params)
+        element = self._get_imported_element(context, bf_namelist_cls, fds_label)
+        # Import common params
         errors = False
-        free_texts = list()
-        # Tokenize value and manage exception
         try:
-            tokens = fds.to_py.tokenize(value)
+            bf_namelist_cls(element).from_fds(context, {
+                label: fds_param for label, fds_param in fds_params.items() if label not in ("ID", "XB")
+            })
         except BFException as err:
             errors = True
-            free_texts.extend(err.free_texts)  # Record in free_texts
-        # Treat tokens, first SURFs
-        if tokens:
-            for token in sorted(tokens, key=lambda k: k[0] != ("SURF_ID")):
-                # Init
-                fds_label, fds_params, fds_original = token
-                # Search managed FDS namelist, and import token
-                bf_namelist_cls = self._get_imported_bf_namelist_cls(
-                    context, fds_label, fds_params)
-                if bf_namelist_cls:
-                    # This FDS namelists is managed:
-                    # get element, instanciate and import BFNamelist
-                    element = self._get_imported_element(
-                        context, bf_namelist_cls, fds_label)
-                    try:
-                        bf_namelist_cls(element).from_fds(context, fds_params)
-                    except BFException as err:
-                        errors = True
-                        free_texts.extend(err.free_texts)
+            free_texts.extend(err.free_texts)
+        # Import boxes and their IDs
+        scale_length = context.scene.unit_settings.scale_length
+        xbs = [[coo / scale_length for coo in token[1]["XB"][0]] for token in tokens]
+        ids = [str(token[1].get("ID", ("",))[0]) for token in tokens]
+        geometry.from_fds.xbs_boxes_to_ob(xbs, ids, context, ob=element)
+        element.name = "{} boxes".format(ids[0] or fds_label)
+        return errors
+
+    def from_fds(self, context, value=None, namelists=None, merge_boxes=False):
+        """Import a text in FDS notation, or an iterable of namelists from fds.to_py, into self."""
+        errors = False
+        free_texts = list()
+        boxes_tokens = OrderedDict()  # key: list of tokens
+        if namelists is None:
+            namelists = fds.to_py.scan_namelists(value)
+        # Tokenize and import one namelist at a time, center imported objects at the end
+        with geometry.utils.deferred_center_positions(context):
+            for nl in namelists:
+                # Tokenize namelist and manage exception
+                try:
+                    token = fds.to_py.tokenize_namelist(nl)
+                except BFException as err:
+                    errors = True
+                    free_texts.extend(err.free_texts)  # Record in free_texts
+                    free_texts.append(nl[0])  # Keep the original namelist
+                    continue
+                # Collect mergeable tokens, or import
+                key = merge_boxes and self._get_imported_boxes_key(context, token)
+                if key:
+                    boxes_tokens.setdefault(key, list()).append(token)
+                    continue
+                errors |= self._import_token(context, token, free_texts)
+            # Import collected tokens, merged when more than one
+            for tokens in boxes_tokens.values():
+                if len(tokens) == 1:
+                    errors |= self._import_token(context, tokens[0], free_texts)
                 else:
-                    # This FDS namelists is not managed
-                    free_texts.append(fds_original)
+                    errors |= self._import_boxes(context, tokens, free_texts)
         # Save free_texts, even if empty
         # (remember, bf_head_free_text is not set to default)
         self._save_imported_unmanaged_tokens(context, free_texts)
@@ -829,7 +860,9 @@ class BFObject():
         Object.bf_namelist = cls.bf_namelist
         Object.set_default_appearance = cls.set_default_appearance
         Object._myself_to_fds = cls._myself_to_fds
+        Object._get_children_obs_by_parent = cls._get_children_obs_by_parent
         Object._children_to_fds = cls._children_to_fds
+        Object.to_fds_chunks = cls.to_fds_chunks
         Object.to_fds = cls.to_fds
         Object.set_tmp = cls.set_tmp
         Object.show_tmp_obs = cls.show_tmp_obs
@@ -880,30 +913,41 @@ class BFObject():
                 bodies.append("! -- {}: {}\n".format(self.name, self.bf_fyi))
         return bodies
 
-    def _children_to_fds(self, context) -> "list":
-        """Export children in FDS notation."""
-        # Init
-        children_obs = [ob for ob in context.scene.objects if ob.parent == self]
+    def _get_children_obs_by_parent(self, context) -> "dict":
+        """Get the children objects of each parent object name, or None for the root."""
+        children_obs_by_parent = dict()
+        for ob in context.scene.objects:
+            parent_name = ob.parent and ob.parent.name or None
+            children_obs_by_parent.setdefault(parent_name, list()).append(ob)
+        return children_obs_by_parent
+
+    def _children_to_fds(self, context, children_obs_by_parent=None) -> "generator":
+        """Export children in FDS notation, one chunk at a time."""
+        # Init, the parent to children index is built once
+        if children_obs_by_parent is None:
+            children_obs_by_parent = Object._get_children_obs_by_parent(self, context)
+        children_obs = list(children_obs_by_parent.get(self and self.name or None, ()))
         children_obs.sort(key=lambda k: k.name)  # Order by element name
         children_obs.sort(key=lambda k: k.bf_namelist_cls != ("ON_MESH"))
         # Children to_fds
-        bodies = list()
+        has_bodies = False
         for ob in children_obs:
-            body = ob.to_fds(context, with_children=True)
-            if body:
-                bodies.append(body)  # could be None
-        if bodies:
-            bodies.append("\n")
-        # Return
-        return bodies
+            for body in ob.to_fds_chunks(context, with_children=True, children_obs_by_parent=children_obs_by_parent):
+                if body:  # could be None
+                    has_bodies = True
+                    yield body
+        if has_bodies:
+            yield "\n"
+
+    def to_fds_chunks(self, context, with_children=False, children_obs_by_parent=None) -> "generator":
+        """Export myself and children in FDS notation, one chunk at a time."""
+        yield from self._myself_to_fds(context)
+        if with_children:
+            yield from self._children_to_fds(context, children_obs_by_parent)
 
     def to_fds(self, context, with_children=False, max_lines=0) -> "str or None":
         """Export myself and children in FDS notation."""
-        bodies = list()
-        bodies.extend(self._myself_to_fds(context))
-        if with_children:
-            bodies.extend(self._children_to_fds(context))
-        return "".join(bodies)
+        return "".join(self.to_fds_chunks(context, with_children))
 
     # Manage tmp objects
 
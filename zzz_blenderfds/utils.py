@@ -1,5 +1,7 @@
 """BlenderFDS, other utilities"""
 
+import os
+
 # Check if a quantity is an iterable type
 
 def is_iterable(var):
@@ -62,3 +64,17 @@ def write_to_file(filepath, text_file):
     except IOError:
         return False
 
+def write_chunks_to_file(filepath, chunks):
+    """Write text chunks to filepath, while they are generated.
+    Chunks are written to a temporary file, that replaces filepath when done:
+    if an exception is raised by the chunks generator, filepath is untouched."""
+    filepath_tmp = filepath + ".tmp"
+    try:
+        with open(filepath_tmp,"w",encoding="utf8",errors="ignore") as out_file:
+            for chunk in chunks: out_file.write(chunk)
+        os.replace(filepath_tmp, filepath)
+        return True
+    except IOError:
+        return False
+    finally:
+        if os.path.exists(filepath_tmp): os.remove(filepath_tmp)